@@ -58,3 +58,22 @@ STATIC_URL = '/static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 LOCALE_PATH = ['movies/locale']
+
+# Сериализатор ответов API: orjson или json
+API_JSON_SERIALIZER = os.environ.get('API_JSON_SERIALIZER', 'orjson')
+# Сколько секунд количество фильмов в списке API живет в кэше
+API_COUNT_CACHE_TIMEOUT = int(os.environ.get('API_COUNT_CACHE_TIMEOUT', 60))
+# С какого количества строк film_work количество фильмов
+# оценивается по pg_class, а не считается COUNT
+API_COUNT_ESTIMATE_THRESHOLD = int(
+    os.environ.get('API_COUNT_ESTIMATE_THRESHOLD', 100000))
+# Заголовок Cache-Control ответов API, пустой - без заголовка
+API_CACHE_CONTROL = os.environ.get('API_CACHE_CONTROL',
+                                   'no-cache, max-age=0')
+# Redis кэша ответов API, например redis://redis:6379/1;
+# пустой - кэш ответов выключен
+API_CACHE_REDIS_URL = os.environ.get('API_CACHE_REDIS_URL', '')
+# Сколько секунд ответ живет в кэше, если его не сбросили сигналы
+API_CACHE_TIMEOUT = int(os.environ.get('API_CACHE_TIMEOUT', 300))
+# Сколько ответов хранит LRU каждого процесса, 0 - только Redis
+API_CACHE_LOCAL_SIZE = int(os.environ.get('API_CACHE_LOCAL_SIZE', 1000))
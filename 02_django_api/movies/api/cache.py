@@ -0,0 +1,191 @@
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from time import time
+from typing import Iterable, Optional
+
+import redis
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe, urlencode
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'movies:cache:'
+# Счетчик всех инвалидаций: ответ, во время сборки которого он
+# изменился, в кэш не кладется
+EPOCH_KEY = PREFIX + 'epoch'
+# Метка всех страниц списка: меняется при создании и удалении фильмов
+LIST_TAG = 'list'
+# Заголовки, которые хранятся вместе с телом ответа
+HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Cache-Control')
+
+
+def film_tag(pk) -> str:
+    return 'film:{0}'.format(pk)
+
+
+def cache_key(request) -> str:
+    """Путь и параметры запроса в порядке имен"""
+    query = urlencode(sorted(request.GET.lists()), doseq=True)
+    path = '{0}?{1}'.format(request.path, query)
+    return hashlib.md5(path.encode()).hexdigest()
+
+
+class LocalCache:
+    """LRU ответов в памяти процесса: без запроса тела из Redis"""
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[tuple]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0]['expires'] < time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, entry: tuple) -> None:
+        if self.size <= 0:
+            return
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def pop(self, key: str) -> None:
+        with self.lock:
+            self.entries.pop(key, None)
+
+
+class ResponseCache:
+    """Кэш ответов API в два уровня: LRU процесса и Redis.
+    Ответ хранится с версиями меток - фильмов ответа и, у списка,
+    LIST_TAG. Сигналы моделей увеличивают версии меток измененных
+    фильмов, и ответ со старой версией любой метки считается
+    промахом. Версии проверяются в Redis на каждое попадание, поэтому
+    LRU процесса не отдает ответ, устаревший в другом процессе.
+    При недоступном Redis ответы собираются без кэша"""
+
+    def __init__(self) -> None:
+        self.local = LocalCache(settings.API_CACHE_LOCAL_SIZE)
+        self.client = None
+        self.stats = dict.fromkeys(
+            ('local', 'redis', 'miss', 'stale', 'skipped'), 0)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(settings.API_CACHE_REDIS_URL)
+
+    @property
+    def redis(self) -> redis.Redis:
+        if self.client is None:
+            self.client = redis.Redis.from_url(settings.API_CACHE_REDIS_URL)
+        return self.client
+
+    @staticmethod
+    def version_keys(tags: Iterable[str]) -> list:
+        return [PREFIX + 'v:' + tag for tag in tags]
+
+    def lookup(self, key: str) -> Optional[tuple]:
+        """Актуальный ответ: (метаданные, тело) или None"""
+        try:
+            entry, tier = self.local.get(key), 'local'
+            if entry is None:
+                data = self.redis.get(PREFIX + 'r:' + key)
+                if data is None:
+                    self.stats['miss'] += 1
+                    return None
+                meta, body = data.split(b'\n', 1)
+                entry, tier = (json.loads(meta), body), 'redis'
+            versions = entry[0]['versions']
+            current = self.redis.mget(self.version_keys(versions))
+            if [int(value or 0) for value in current] != list(
+                    versions.values()):
+                self.local.pop(key)
+                self.stats['stale'] += 1
+                return None
+        except redis.RedisError as error:
+            logger.warning('Кэш ответов недоступен: %s', error)
+            return None
+        if tier == 'redis':
+            self.local.set(key, entry)
+        self.stats[tier] += 1
+        return entry
+
+    def epoch(self) -> Optional[bytes]:
+        """Счетчик инвалидаций перед сборкой ответа"""
+        try:
+            return self.redis.get(EPOCH_KEY) or b'0'
+        except redis.RedisError as error:
+            logger.warning('Кэш ответов недоступен: %s', error)
+            return None
+
+    def store(self, key: str, response: HttpResponse, tags: list,
+              epoch: bytes) -> None:
+        """Ответ в оба уровня с текущими версиями меток, если с начала
+        сборки не было инвалидаций"""
+        try:
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.mget(self.version_keys(tags))
+            pipe.get(EPOCH_KEY)
+            current, epoch_now = pipe.execute()
+            if (epoch_now or b'0') != epoch:
+                self.stats['skipped'] += 1
+                return
+            meta = {
+                'headers': {name: response[name] for name in HEADERS
+                            if response.has_header(name)},
+                'versions': {tag: int(value or 0)
+                             for tag, value in zip(tags, current)},
+                'expires': time() + settings.API_CACHE_TIMEOUT,
+            }
+            self.redis.set(PREFIX + 'r:' + key,
+                           json.dumps(meta).encode() + b'\n' +
+                           response.content,
+                           ex=settings.API_CACHE_TIMEOUT)
+        except redis.RedisError as error:
+            logger.warning('Кэш ответов недоступен: %s', error)
+            return
+        self.local.set(key, (meta, response.content))
+
+    def invalidate(self, tags: Iterable[str]) -> None:
+        tags = list(tags)
+        if not tags:
+            return
+        try:
+            pipe = self.redis.pipeline(transaction=True)
+            for version_key in self.version_keys(tags):
+                pipe.incr(version_key)
+            pipe.incr(EPOCH_KEY)
+            pipe.execute()
+        except redis.RedisError as error:
+            logger.warning('Кэш ответов не сброшен: %s', error)
+
+
+def entry_response(request, entry: tuple) -> HttpResponse:
+    """Ответ из кэша, или 304, если клиент уже его получил"""
+    meta, body = entry
+    headers = meta['headers']
+    response = get_conditional_response(
+        request, etag=headers.get('ETag'),
+        last_modified=parse_http_date_safe(headers.get('Last-Modified')))
+    if response is None:
+        response = HttpResponse(body)
+    for name, value in headers.items():
+        if name != 'Content-Type' or response.status_code == 200:
+            response[name] = value
+    return response
+
+
+response_cache = ResponseCache()
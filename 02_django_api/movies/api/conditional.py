@@ -0,0 +1,26 @@
+import hashlib
+
+from django.conf import settings
+from django.utils.http import http_date, quote_etag
+
+
+def make_validators(meta: dict, films: list, stamp: tuple) -> tuple:
+    """ETag и Last-Modified ответа по строкам film_work и отметке связей.
+    meta - остальные поля ответа (количество, соседние страницы)"""
+    updated, links = stamp
+    changes = [film['updated_at'] for film in films]
+    if updated is not None:
+        changes.append(updated)
+    key = repr((sorted(meta.items()),
+                [(str(film['id']), film['updated_at']) for film in films],
+                updated, links))
+    etag = quote_etag(hashlib.md5(key.encode()).hexdigest())
+    return etag, max(changes) if changes else None
+
+
+def set_validators(response, etag: str, last_modified) -> None:
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    if settings.API_CACHE_CONTROL:
+        response['Cache-Control'] = settings.API_CACHE_CONTROL
@@ -0,0 +1,88 @@
+import logging
+from typing import Optional
+
+import redis
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from movies.api.cache import response_cache
+from movies.models import Filmwork
+
+logger = logging.getLogger(__name__)
+
+FILM_COUNT_KEY = 'movies:film_count'
+# Поправка количества, только если оно уже есть: без значения
+# его посчитает film_count
+ADJUST_SCRIPT = ("if redis.call('exists', KEYS[1]) == 1 then "
+                 "return redis.call('incrby', KEYS[1], ARGV[1]) end")
+# Оценка планировщика по последнему ANALYZE или autovacuum
+ESTIMATE_QUERY = ("SELECT reltuples::bigint FROM pg_class "
+                  "WHERE oid = 'content.film_work'::regclass")
+
+
+def estimate_films() -> int:
+    with connection.cursor() as cursor:
+        cursor.execute(ESTIMATE_QUERY)
+        row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def cached_count() -> Optional[int]:
+    """Количество из Redis кэша ответов, общего для процессов,
+    а без него - из кэша Django"""
+    if not response_cache.enabled:
+        return cache.get(FILM_COUNT_KEY)
+    try:
+        value = response_cache.redis.get(FILM_COUNT_KEY)
+    except redis.RedisError as error:
+        logger.warning('Кэш количества недоступен: %s', error)
+        return None
+    return None if value is None else int(value)
+
+
+def store_count(count: int) -> None:
+    timeout = settings.API_COUNT_CACHE_TIMEOUT
+    if not response_cache.enabled:
+        cache.set(FILM_COUNT_KEY, count, timeout)
+        return
+    try:
+        response_cache.redis.set(FILM_COUNT_KEY, count, ex=timeout)
+    except redis.RedisError as error:
+        logger.warning('Кэш количества недоступен: %s', error)
+
+
+def reset_count() -> None:
+    cache.delete(FILM_COUNT_KEY)
+    if response_cache.enabled:
+        response_cache.redis.delete(FILM_COUNT_KEY)
+
+
+def film_count(exact: bool = False) -> int:
+    """Количество фильмов в списке API. В списке ровно одна строка
+    на фильм, поэтому хватает COUNT по film_work без связей. Значение
+    берется из кэша; при промахе большие таблицы (от
+    API_COUNT_ESTIMATE_THRESHOLD строк) оцениваются по pg_class,
+    остальные считаются точно. exact - всегда точный COUNT"""
+    if exact:
+        return Filmwork.objects.count()
+    count = cached_count()
+    if count is None:
+        count = estimate_films()
+        if count < settings.API_COUNT_ESTIMATE_THRESHOLD:
+            count = Filmwork.objects.count()
+        store_count(count)
+    return count
+
+
+def add_films(delta: int) -> None:
+    """Поправка количества в Redis при создании и удалении фильмов,
+    после фиксации транзакции. Кэш Django у каждого процесса свой,
+    поправка из одного процесса не дошла бы до остальных, поэтому
+    без Redis значение только устаревает за API_COUNT_CACHE_TIMEOUT"""
+    if not response_cache.enabled:
+        return
+    try:
+        response_cache.redis.eval(ADJUST_SCRIPT, 1, FILM_COUNT_KEY, delta)
+    except redis.RedisError as error:
+        logger.warning('Количество фильмов не поправлено: %s', error)
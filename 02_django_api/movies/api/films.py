@@ -0,0 +1,75 @@
+from django.db import connection
+from django.db.models import CharField, F, Value
+from django.db.models.functions import Greatest
+
+from movies.models import GenreFilmwork, PersonFilmWork
+
+GENRE = 'genre'
+# Поле ответа для жанров и каждой роли
+FIELDS = {
+    GENRE: 'genres',
+    PersonFilmWork.Role.ACTOR.value: 'actors',
+    PersonFilmWork.Role.DIRECTOR.value: 'directors',
+    PersonFilmWork.Role.WRITER.value: 'writers',
+}
+# Отметка связей, как у attach_people, но одной строкой агрегатов
+LINKS_STAMP_QUERY = (
+    "SELECT max(updated), count(*) FROM ("
+    "SELECT greatest(g.updated_at, gfw.created_at) AS updated "
+    "FROM content.genre_film_work gfw "
+    "JOIN content.genre g ON g.id = gfw.genre_id "
+    "WHERE gfw.film_work_id = ANY(%s) "
+    "UNION ALL "
+    "SELECT greatest(p.updated_at, pfw.created_at) "
+    "FROM content.person_film_work pfw "
+    "JOIN content.person p ON p.id = pfw.person_id "
+    "WHERE pfw.film_work_id = ANY(%s)) AS links")
+
+
+def people_query(ids: list):
+    """Жанры и люди с ролями фильмов ids одним запросом: строки
+    (id фильма, genre или роль, имя, время изменения жанра или
+    человека либо создания связи - что позже)"""
+    # Столбцы обеих частей - аннотации: так их порядок в SELECT
+    # одинаковый, поля модели Django ставит перед аннотациями
+    genres = GenreFilmwork.objects.filter(film_work_id__in=ids).annotate(
+        film=F('film_work_id'), kind=Value(GENRE, output_field=CharField()),
+        name=F('genre__name'),
+        updated=Greatest('genre__updated_at', 'created_at'))
+    persons = PersonFilmWork.objects.filter(film_work_id__in=ids).annotate(
+        film=F('film_work_id'), kind=F('role'), name=F('person__full_name'),
+        updated=Greatest('person__updated_at', 'created_at'))
+    columns = ('film', 'kind', 'name', 'updated')
+    return genres.values_list(*columns).union(
+        persons.values_list(*columns), all=True)
+
+
+def attach_people(films: list) -> tuple:
+    """Добавляет к строкам film_work жанры и людей по ролям.
+    Списки без повторов и по алфавиту, как у ArrayAgg(distinct=True).
+    Возвращает отметку связей фильмов, как links_stamp"""
+    names = {film['id']: {field: set() for field in FIELDS.values()}
+             for film in films}
+    updated, links = None, 0
+    if names:
+        for film_id, kind, name, changed in people_query(list(names)):
+            links += 1
+            updated = changed if updated is None else max(updated, changed)
+            field = FIELDS.get(kind)
+            if field is not None and name is not None:
+                names[film_id][field].add(name)
+    for film in films:
+        film.update((field, sorted(values))
+                    for field, values in names[film['id']].items())
+    return updated, links
+
+
+def links_stamp(ids: list) -> tuple:
+    """Отметка связей фильмов без чтения самих жанров и людей:
+    последнее изменение жанра, человека или связи и количество связей.
+    Удаление связи меняет количество"""
+    if not ids:
+        return None, 0
+    with connection.cursor() as cursor:
+        cursor.execute(LINKS_STAMP_QUERY, (ids, ids))
+        return cursor.fetchone()
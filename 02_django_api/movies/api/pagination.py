@@ -0,0 +1,70 @@
+import base64
+import datetime as dt
+import json
+import uuid
+
+from django.core.exceptions import BadRequest
+from django.db.models import BooleanField, QuerySet
+from django.db.models.expressions import RawSQL
+
+NEXT = 'next'
+PREV = 'prev'
+# Ключ курсора: по индексу film_work_created_at_idx
+ORDERING = ('created_at', 'id')
+# Сравнение строк целиком: Postgres начинает чтение индекса
+# сразу с позиции курсора, на любой глубине списка
+AFTER = '(created_at, id) > (%s, %s)'
+BEFORE = '(created_at, id) < (%s, %s)'
+
+
+def encode_cursor(direction: str, created_at: dt.datetime, pk) -> str:
+    data = json.dumps([direction, created_at.isoformat(), str(pk)])
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Направление, created_at и id из курсора"""
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direction, created_at, pk = json.loads(data)
+        if direction not in (NEXT, PREV):
+            raise ValueError(direction)
+        return (direction, dt.datetime.fromisoformat(created_at),
+                uuid.UUID(pk))
+    except (ValueError, TypeError) as error:
+        raise BadRequest('Некорректный курсор') from error
+
+
+def keyset_ids(films: QuerySet, cursor: str, size: int) -> tuple:
+    """Узкий запрос к film_work без связей: id страницы после
+       или перед курсором и одной строки сверх страницы, по которой
+       видно, есть ли следующая. Пустой курсор - первая страница"""
+    direction = NEXT
+    if cursor:
+        direction, created_at, pk = decode_cursor(cursor)
+        films = films.filter(RawSQL(AFTER if direction == NEXT else BEFORE,
+                                    (created_at, pk),
+                                    output_field=BooleanField()))
+    ordering = ORDERING if direction == NEXT else [
+        '-' + field for field in ORDERING]
+    return direction, ordering, films.order_by(*ordering).values_list(
+        'id', flat=True)[:size + 1]
+
+
+def keyset_page(queryset: QuerySet, films: QuerySet, cursor: str,
+                size: int) -> dict:
+    """Страница queryset по курсору: фильмы выбираются узким запросом
+       keyset_ids, и только они собираются в queryset"""
+    direction, ordering, ids = keyset_ids(films, cursor, size)
+    rows = list(queryset.filter(id__in=ids).order_by(*ordering))
+    has_more = len(rows) > size
+    rows = rows[:size]
+    if direction == PREV:
+        rows.reverse()
+    first, last = (rows[0], rows[-1]) if rows else (None, None)
+    prev = next = None
+    if first and (cursor and direction == NEXT or has_more):
+        prev = encode_cursor(PREV, first['created_at'], first['id'])
+    if last and (direction == PREV or has_more):
+        next = encode_cursor(NEXT, last['created_at'], last['id'])
+    return {'prev': prev, 'next': next, 'results': rows}
@@ -0,0 +1,33 @@
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+encoder = DjangoJSONEncoder()
+
+
+def default(value):
+    # Даты, время, Decimal и остальное - в том же виде, что у JsonResponse
+    return encoder.default(value)
+
+
+def dumps(data) -> bytes:
+    if orjson is not None and settings.API_JSON_SERIALIZER == 'orjson':
+        return orjson.dumps(data, default=default,
+                            option=orjson.OPT_PASSTHROUGH_DATETIME)
+    return json.dumps(data, cls=DjangoJSONEncoder).encode('utf-8')
+
+
+class FastJsonResponse(HttpResponse):
+    """Ответ JSON с сериализатором из настройки API_JSON_SERIALIZER:
+    orjson, если он установлен, иначе стандартный json"""
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
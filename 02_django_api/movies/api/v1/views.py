@@ -1,34 +1,86 @@
-from django.contrib.postgres.aggregates import ArrayAgg
 from django.core.paginator import Paginator
-from django.db.models import Q
-from django.http import JsonResponse
+from django.utils.cache import get_conditional_response
 from django.views.generic.detail import BaseDetailView
 from django.views.generic.list import BaseListView
 
-from movies.models import Filmwork, PersonFilmWork
+from movies.api.counts import film_count
+from movies.api.cache import (LIST_TAG, cache_key, entry_response,
+                              film_tag, response_cache)
+from movies.api.conditional import make_validators, set_validators
+from movies.api.films import attach_people, links_stamp
+from movies.api.pagination import ORDERING, keyset_page
+from movies.api.responses import FastJsonResponse
+from movies.models import Filmwork
+
+
+class CountedPaginator(Paginator):
+    """Paginator с заранее известным количеством объектов:
+    без COUNT на каждый запрос"""
+
+    def __init__(self, object_list, per_page, count: int, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count = count
 
 
 class MoviesApiMixin:
+    """Ответ собирается в два запроса: строки film_work без связей,
+    затем жанры и люди только этих фильмов (attach_people).
+    На условный запрос вместо второго идет links_stamp, и если ответ
+    не изменился, отдается 304 без жанров и людей.
+    Ответы 200 хранятся в response_cache с метками своих фильмов"""
     model = Filmwork
     http_method_names = ['get']
+    cache_tags = ()
+
+    def get(self, request, *args, **kwargs):
+        if not response_cache.enabled:
+            return super().get(request, *args, **kwargs)
+        key = cache_key(request)
+        entry = response_cache.lookup(key)
+        if entry is not None:
+            return entry_response(request, entry)
+        epoch = response_cache.epoch()
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200 and epoch is not None:
+            response_cache.store(key, response, list(self.cache_tags),
+                                 epoch)
+        return response
 
     def get_queryset(self):
-        roles = PersonFilmWork.Role
-        return Filmwork.objects.prefetch_related('genres',
-                                                 'persons').values().annotate(
-            genres=ArrayAgg('genres__name', distinct=True),
-            actors=ArrayAgg(
-                'persons__full_name', distinct=True,
-                filter=Q(personfilmwork__role__exact=roles.ACTOR.value)),
-            directors=ArrayAgg(
-                'persons__full_name', distinct=True,
-                filter=Q(personfilmwork__role__exact=roles.DIRECTOR.value)),
-            writers=ArrayAgg(
-                'persons__full_name', distinct=True,
-                filter=Q(personfilmwork__role__exact=roles.WRITER.value)))
+        return Filmwork.objects.values()
+
+    def get_films(self, context) -> list:
+        """Строки film_work ответа: по умолчанию ответ - один фильм"""
+        return [context]
+
+    def get_meta(self, context) -> dict:
+        """Поля ответа кроме фильмов"""
+        return {}
+
+    def get_cache_tags(self, films: list) -> list:
+        return [film_tag(film['id']) for film in films]
 
     def render_to_response(self, context, **response_kwargs):
-        return JsonResponse(context)
+        films = self.get_films(context)
+        meta = self.get_meta(context)
+        self.cache_tags = self.get_cache_tags(films)
+        headers = self.request.META
+        if 'HTTP_IF_NONE_MATCH' in headers or (
+                'HTTP_IF_MODIFIED_SINCE' in headers):
+            stamp = links_stamp([film['id'] for film in films])
+            etag, last_modified = make_validators(meta, films, stamp)
+            response = get_conditional_response(
+                self.request, etag=etag,
+                last_modified=last_modified and int(
+                    last_modified.timestamp()))
+            if response is not None:
+                set_validators(response, etag, last_modified)
+                return response
+        stamp = attach_people(films)
+        etag, last_modified = make_validators(meta, films, stamp)
+        response = FastJsonResponse(context)
+        set_validators(response, etag, last_modified)
+        return response
 
 
 class MoviesListApi(MoviesApiMixin, BaseListView):
@@ -38,7 +90,15 @@ class MoviesListApi(MoviesApiMixin, BaseListView):
 
     def get_context_data(self, *, object_list=None, **kwargs):
         queryset = self.get_queryset()
-        paginator = Paginator(queryset, self.paginate_by)
+        cursor = self.request.GET.get('cursor')
+        if cursor is not None:
+            return self.get_cursor_page(queryset, cursor)
+        # Страница выбирается по индексу film_work_created_at_idx
+        # только из id, строки фильмов читаются для нее одной
+        ids = Filmwork.objects.order_by(*ORDERING).values_list(
+            'id', flat=True)
+        paginator = CountedPaginator(ids, self.paginate_by,
+                                     film_count(self.exact_count()))
         page_number = self.request.GET.get('page')
         if page_number == 'last':
             page_number = paginator.page_range[-1]
@@ -50,14 +110,42 @@ class MoviesListApi(MoviesApiMixin, BaseListView):
             'total_pages': paginator.num_pages,
             'prev': prev,
             'next': next,
-            'results': list(p_obj),
+            'results': list(queryset.filter(
+                id__in=p_obj.object_list).order_by(*ORDERING)),
         }
         return context
 
+    def get_films(self, context) -> list:
+        return context['results']
+
+    def get_meta(self, context) -> dict:
+        return {key: value for key, value in context.items()
+                if key != 'results'}
+
+    def get_cache_tags(self, films: list) -> list:
+        return [LIST_TAG] + super().get_cache_tags(films)
+
+    def exact_count(self) -> bool:
+        return self.request.GET.get('count', '').lower() == 'exact'
+
+    def get_cursor_page(self, queryset, cursor: str) -> dict:
+        """Страница по курсору: без COUNT и OFFSET, время ответа
+        не зависит от глубины. Количество фильмов - только по count=true
+        или count=exact"""
+        films = Filmwork.objects.all()
+        context = {'count': None}
+        if self.request.GET.get('count', '').lower() in {'true', '1',
+                                                         'exact'}:
+            context['count'] = film_count(self.exact_count())
+        context.update(keyset_page(queryset, films, cursor,
+                                   self.paginate_by))
+        return context
+
 
 class MoviesDetailApi(MoviesApiMixin, BaseDetailView):
     model = Filmwork
     http_method_names = ['get']
 
     def get_context_data(self, *, object_list=None, **kwargs):
-        return self.get_queryset().get(id=self.kwargs['pk'])
+        # self.object - строка film_work из get_object, 404 без фильма
+        return self.object
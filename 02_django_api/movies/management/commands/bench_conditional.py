@@ -0,0 +1,67 @@
+import random
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from movies.api.pagination import ORDERING
+from movies.api.v1.views import MoviesDetailApi, MoviesListApi
+from movies.models import Filmwork
+
+
+class Command(BaseCommand):
+    help = ('Пропускная способность API при смеси условных запросов: '
+            'клиенты с сохраненным ETag повторяют запрос с If-None-Match '
+            'против клиентов без валидаторов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--pages', type=int, default=20,
+                            help='сколько первых страниц списка запрашивается')
+        parser.add_argument('--films', type=int, default=200,
+                            help='сколько карточек фильмов запрашивается')
+        parser.add_argument('--revalidate', type=float, default=0.8,
+                            help='доля повторных запросов с If-None-Match')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        factory = RequestFactory()
+        list_view = MoviesListApi.as_view()
+        detail_view = MoviesDetailApi.as_view()
+        ids = list(Filmwork.objects.order_by(*ORDERING).values_list(
+            'id', flat=True)[:options['films']])
+        targets = [(list_view, '/api/v1/movies/', {'page': page}, {})
+                   for page in range(1, options['pages'] + 1)]
+        targets += [(detail_view, '/api/v1/movies/{0}/'.format(pk), {},
+                     {'pk': pk}) for pk in ids]
+
+        for title, revalidate in (('без валидаторов', 0),
+                                  ('с If-None-Match',
+                                   options['revalidate'])):
+            rng = random.Random(options['seed'])
+            etags = {}
+            statuses = {200: 0, 304: 0}
+            queries = {200: 0, 304: 0}
+            started = perf_counter()
+            for _ in range(options['requests']):
+                number = rng.randrange(len(targets))
+                view, path, params, kwargs = targets[number]
+                headers = {}
+                if number in etags and rng.random() < revalidate:
+                    headers['HTTP_IF_NONE_MATCH'] = etags[number]
+                request = factory.get(path, params, **headers)
+                with CaptureQueriesContext(connection) as captured:
+                    response = view(request, **kwargs)
+                etags[number] = response['ETag']
+                statuses[response.status_code] += 1
+                queries[response.status_code] += len(captured)
+            elapsed = perf_counter() - started
+            self.stdout.write(
+                '{0:>16}: {1:.0f} запросов/с, 304: {2:.0%}, запросов к БД '
+                'на 200: {3:.1f}, на 304: {4:.1f}'.format(
+                    title, options['requests'] / elapsed,
+                    statuses[304] / options['requests'],
+                    queries[200] / max(1, statuses[200]),
+                    queries[304] / max(1, statuses[304])))
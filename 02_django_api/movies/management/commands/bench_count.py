@@ -0,0 +1,50 @@
+import statistics
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.test import RequestFactory
+
+from movies.api import counts
+from movies.api.v1.views import MoviesListApi
+
+
+def measure(func, repeat: int) -> tuple:
+    """Медиана и 99-й перцентиль времени вызова в мс"""
+    timings = []
+    for _ in range(repeat):
+        started = perf_counter()
+        func()
+        timings.append((perf_counter() - started) * 1000)
+    percentiles = statistics.quantiles(timings, n=100, method='inclusive')
+    return statistics.median(timings), percentiles[98]
+
+
+class Command(BaseCommand):
+    help = ('Цена количества фильмов в списке: COUNT по сгруппированному '
+            'запросу со связями против COUNT по film_work, оценки '
+            'pg_class и кэша; время ответа первой страницы')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        view = MoviesListApi.as_view()
+        factory = RequestFactory()
+        exact = factory.get('/api/v1/movies/', {'count': 'exact'})
+        cached = factory.get('/api/v1/movies/')
+        self.stdout.write('Фильмов: {0}, оценка pg_class: {1}'.format(
+            counts.film_count(exact=True), counts.estimate_films()))
+        counts.reset_count()
+        for title, func in (
+                ('COUNT со связями',
+                 lambda: Paginator(MoviesListApi().get_queryset(), 50).count),
+                ('COUNT film_work', lambda: counts.film_count(exact=True)),
+                ('pg_class', counts.estimate_films),
+                ('кэш', counts.film_count),
+                ('page=1, count=exact', lambda: view(exact)),
+                ('page=1, кэш', lambda: view(cached))):
+            median, p99 = measure(func, repeat)
+            self.stdout.write('{0:>20}: медиана {1:.2f} мс, '
+                              '99% {2:.2f} мс'.format(title, median, p99))
@@ -0,0 +1,57 @@
+import datetime as dt
+import json
+import uuid
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.test import override_settings
+
+from movies.api import responses
+
+
+def make_page(size: int) -> dict:
+    """Страница списка фильмов в формате ответа MoviesListApi"""
+    now = dt.datetime.now(dt.timezone.utc)
+    people = ['Person {0}'.format(i) for i in range(8)]
+    results = [{
+        'id': uuid.uuid4(),
+        'title': 'Film {0}'.format(i),
+        'description': 'description ' * 20,
+        'creation_date': dt.date(2000, 1, 1) + dt.timedelta(days=i),
+        'file_path': '',
+        'rating': 7.5,
+        'type': 'movie',
+        'created_at': now,
+        'updated_at': now,
+        'genres': ['Action', 'Drama'],
+        'actors': people[:5],
+        'directors': people[5:6],
+        'writers': people[6:],
+    } for i in range(size)]
+    return {'count': 10000, 'total_pages': 200, 'prev': None, 'next': 2,
+            'results': results}
+
+
+class Command(BaseCommand):
+    help = ('Время сериализации страницы списка фильмов '
+            'стандартным json и orjson')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        page = make_page(options['page_size'])
+        expected = json.loads(json.dumps(page, cls=DjangoJSONEncoder))
+        for serializer in ('json', 'orjson'):
+            with override_settings(API_JSON_SERIALIZER=serializer):
+                if json.loads(responses.dumps(page)) != expected:
+                    self.stderr.write('{0}: ответ отличается'.format(
+                        serializer))
+                started = perf_counter()
+                for _ in range(options['repeat']):
+                    responses.dumps(page)
+                elapsed = perf_counter() - started
+            self.stdout.write('{0:>6}: {1:.1f} мкс на страницу'.format(
+                serializer, elapsed / options['repeat'] * 1_000_000))
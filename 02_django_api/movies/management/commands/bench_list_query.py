@@ -0,0 +1,113 @@
+import statistics
+from time import perf_counter
+
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
+
+from movies.api.films import attach_people
+from movies.api.pagination import ORDERING
+from movies.models import Filmwork, PersonFilmWork
+
+
+def annotated_queryset():
+    """Прежний запрос API: связи и четыре ArrayAgg
+    по всем фильмам до нарезки страницы"""
+    roles = PersonFilmWork.Role
+    return Filmwork.objects.prefetch_related('genres',
+                                             'persons').values().annotate(
+        genres=ArrayAgg('genres__name', distinct=True),
+        actors=ArrayAgg(
+            'persons__full_name', distinct=True,
+            filter=Q(personfilmwork__role__exact=roles.ACTOR.value)),
+        directors=ArrayAgg(
+            'persons__full_name', distinct=True,
+            filter=Q(personfilmwork__role__exact=roles.DIRECTOR.value)),
+        writers=ArrayAgg(
+            'persons__full_name', distinct=True,
+            filter=Q(personfilmwork__role__exact=roles.WRITER.value)))
+
+
+def annotated_page(number: int, size: int) -> list:
+    queryset = annotated_queryset().order_by(*ORDERING)
+    return list(queryset[(number - 1) * size:number * size])
+
+
+def two_phase_page(number: int, size: int) -> list:
+    ids = Filmwork.objects.order_by(*ORDERING).values_list(
+        'id', flat=True)[(number - 1) * size:number * size]
+    films = list(Filmwork.objects.values().filter(
+        id__in=ids).order_by(*ORDERING))
+    attach_people(films)
+    return films
+
+
+def annotated_detail(pk) -> dict:
+    return annotated_queryset().get(id=pk)
+
+
+def two_phase_detail(pk) -> dict:
+    film = Filmwork.objects.values().get(id=pk)
+    attach_people([film])
+    return film
+
+
+def measure(func, repeat: int) -> tuple:
+    """Медиана и 99-й перцентиль времени в мс, запросов на вызов
+    и результат последнего вызова"""
+    timings = []
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as queries:
+            started = perf_counter()
+            result = func()
+            timings.append((perf_counter() - started) * 1000)
+    percentiles = statistics.quantiles(timings, n=100, method='inclusive')
+    return (statistics.median(timings), percentiles[98], len(queries),
+            result)
+
+
+def normalize(films):
+    """Пустые списки ArrayAgg приходят как [None]"""
+    films = films if isinstance(films, list) else [films]
+    return [{key: [item for item in value if item is not None]
+             if isinstance(value, list) else value
+             for key, value in film.items()} for film in films]
+
+
+class Command(BaseCommand):
+    help = ('Запросы и время страницы списка и карточки фильма: '
+            'ArrayAgg по всем связям против двух запросов '
+            '(страница id, затем жанры и люди только ее фильмов)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page', type=int, default=200)
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        size = options['page_size']
+        pages = max(1, Paginator(Filmwork.objects.all(), size).num_pages)
+        page = min(options['page'], pages)
+        pk = Filmwork.objects.order_by(*ORDERING).values_list(
+            'id', flat=True)[(page - 1) * size]
+        for title, old, new in (
+                ('страница 1', lambda: annotated_page(1, size),
+                 lambda: two_phase_page(1, size)),
+                ('страница {0}'.format(page),
+                 lambda: annotated_page(page, size),
+                 lambda: two_phase_page(page, size)),
+                ('карточка', lambda: annotated_detail(pk),
+                 lambda: two_phase_detail(pk))):
+            results = []
+            for name, func in (('ArrayAgg', old), ('два запроса', new)):
+                median, p99, queries, result = measure(
+                    func, options['repeat'])
+                results.append(normalize(result))
+                self.stdout.write(
+                    '{0:>12}, {1:>11}: медиана {2:.1f} мс, 99% {3:.1f} мс, '
+                    'запросов {4}'.format(title, name, median, p99, queries))
+            if results[0] != results[1]:
+                self.stderr.write('{0}: ответы отличаются'.format(title))
@@ -0,0 +1,62 @@
+import statistics
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from movies.api.pagination import NEXT, ORDERING, encode_cursor
+from movies.api.v1.views import MoviesListApi
+from movies.models import Filmwork
+
+
+def measure(view, request, repeat: int) -> tuple:
+    """Медиана и 99-й перцентиль времени ответа в мс,
+    количество запросов к БД на один ответ"""
+    timings = []
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as queries:
+            started = perf_counter()
+            response = view(request)
+            timings.append((perf_counter() - started) * 1000)
+        assert response.status_code == 200, response.status_code
+    percentiles = statistics.quantiles(timings, n=100, method='inclusive')
+    return statistics.median(timings), percentiles[98], len(queries)
+
+
+class Command(BaseCommand):
+    help = ('Время ответа списка фильмов на первой и глубокой странице: '
+            'номер страницы (COUNT и OFFSET) против курсора')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        view = MoviesListApi.as_view()
+        factory = RequestFactory()
+        size = MoviesListApi.paginate_by
+        films = Filmwork.objects.count()
+        page = min(options['page'], max(1, films // size))
+        # Курсор на ту же глубину, что и страница page: по последнему
+        # фильму предыдущей страницы
+        cursor = ''
+        if page > 1:
+            created_at, pk = Filmwork.objects.order_by(
+                *ORDERING).values_list(*ORDERING)[(page - 1) * size - 1]
+            cursor = encode_cursor(NEXT, created_at, pk)
+        self.stdout.write('Фильмов: {0}, страница {1}'.format(films, page))
+        for title, params in (
+                ('page=1', {'page': 1}),
+                ('page={0}'.format(page), {'page': page}),
+                ('page=last', {'page': 'last'}),
+                ('cursor, 1', {'cursor': ''}),
+                ('cursor, {0}'.format(page), {'cursor': cursor}),
+                ('cursor, {0}, count'.format(page),
+                 {'cursor': cursor, 'count': 'true'})):
+            request = factory.get('/api/v1/movies/', params)
+            median, p99, queries = measure(view, request, options['repeat'])
+            self.stdout.write(
+                '{0:>18}: медиана {1:.1f} мс, 99% {2:.1f} мс, '
+                'запросов {3}'.format(title, median, p99, queries))
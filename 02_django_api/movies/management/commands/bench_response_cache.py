@@ -0,0 +1,105 @@
+import random
+import statistics
+from time import perf_counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory, override_settings
+
+from movies.api.cache import PREFIX, response_cache
+from movies.api.pagination import ORDERING
+from movies.api.v1.views import MoviesDetailApi, MoviesListApi
+from movies.models import Filmwork
+
+
+def make_targets(pages: int, films: int, seed: int) -> list:
+    """Первые страницы списка и карточки фильмов в случайном порядке
+    популярности: (view, путь, параметры, kwargs, id фильма)"""
+    list_view = MoviesListApi.as_view()
+    detail_view = MoviesDetailApi.as_view()
+    ids = list(Filmwork.objects.order_by(*ORDERING).values_list(
+        'id', flat=True)[:films])
+    targets = [(list_view, '/api/v1/movies/', {'page': page}, {}, None)
+               for page in range(1, pages + 1)]
+    targets += [(detail_view, '/api/v1/movies/{0}/'.format(pk), {},
+                 {'pk': pk}, pk) for pk in ids]
+    random.Random(seed).shuffle(targets)
+    return targets
+
+
+class Command(BaseCommand):
+    help = ('Доля попаданий и время ответа кэша ответов API при нагрузке '
+            'по закону Ципфа: популярные страницы и фильмы запрашиваются '
+            'намного чаще остальных; часть запросов меняет фильмы. '
+            'Изменение - save() фильма в базе, на которую настроен '
+            'проект; после замера updated_at фильмов восстанавливается')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5000)
+        parser.add_argument('--pages', type=int, default=100)
+        parser.add_argument('--films', type=int, default=5000)
+        parser.add_argument('--zipf', type=float, default=1.1,
+                            help='показатель распределения популярности')
+        parser.add_argument('--write-every', type=int, default=200,
+                            help='каждый N-й запрос меняет фильм, 0 - нет')
+        parser.add_argument('--redis',
+                            default=settings.API_CACHE_REDIS_URL or
+                            'redis://127.0.0.1:6379/1')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        factory = RequestFactory()
+        targets = make_targets(options['pages'], options['films'],
+                               options['seed'])
+        film_ids = [target[4] for target in targets if target[4]]
+        weights = [1 / rank ** options['zipf']
+                   for rank in range(1, len(targets) + 1)]
+        # save() идет не в откатываемой транзакции: сброс кэша сигналами
+        # выполняется только после фиксации. save() без изменений полей меняет
+        # только updated_at, прежнее значение возвращается через update(),
+        # который сигналов не шлет
+        saved = {}
+        try:
+            self.run(options, factory, targets, film_ids, weights, saved)
+        finally:
+            for pk, updated_at in saved.items():
+                Filmwork.objects.filter(pk=pk).update(updated_at=updated_at)
+
+    def run(self, options: dict, factory: RequestFactory, targets: list,
+            film_ids: list, weights: list, saved: dict) -> None:
+        for title, url in (('без кэша', ''), ('кэш', options['redis'])):
+            with override_settings(API_CACHE_REDIS_URL=url):
+                response_cache.client = None
+                response_cache.local.entries.clear()
+                response_cache.stats = dict.fromkeys(response_cache.stats, 0)
+                if url:
+                    for key in response_cache.redis.scan_iter(PREFIX + 'r:*'):
+                        response_cache.redis.delete(key)
+                rng = random.Random(options['seed'])
+                timings = []
+                started = perf_counter()
+                for number in range(1, options['requests'] + 1):
+                    view, path, params, kwargs, _ = rng.choices(
+                        targets, weights)[0]
+                    request_started = perf_counter()
+                    response = view(factory.get(path, params), **kwargs)
+                    timings.append((perf_counter() - request_started) * 1000)
+                    assert response.status_code == 200, response.status_code
+                    if (options['write_every'] and film_ids
+                            and number % options['write_every'] == 0):
+                        film = Filmwork.objects.get(pk=rng.choice(film_ids))
+                        saved.setdefault(film.pk, film.updated_at)
+                        film.save()
+                elapsed = perf_counter() - started
+            stats = response_cache.stats
+            hits = stats['local'] + stats['redis']
+            percentiles = statistics.quantiles(timings, n=100,
+                                               method='inclusive')
+            self.stdout.write(
+                '{0:>8}: {1:.0f} запросов/с, медиана {2:.2f} мс, '
+                '99% {3:.2f} мс, попаданий {4:.0%} (LRU {5}, Redis {6}), '
+                'устаревших {7}, не сохранено {8}'.format(
+                    title, options['requests'] / elapsed,
+                    statistics.median(timings), percentiles[98],
+                    hits / options['requests'], stats['local'],
+                    stats['redis'], stats['stale'], stats['skipped']))
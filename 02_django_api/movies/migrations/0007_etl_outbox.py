@@ -0,0 +1,92 @@
+from django.db import migrations
+
+# Изменения в таблицах content записываются триггерами в outbox
+# и сопровождаются pg_notify, ETL просыпается по уведомлению
+# и индексирует только затронутые фильмы
+OUTBOX_SQL = """
+CREATE TABLE IF NOT EXISTS content.etl_outbox (
+    id bigserial PRIMARY KEY,
+    film_work_id uuid NOT NULL,
+    created_at timestamp with time zone NOT NULL DEFAULT now()
+);
+
+CREATE OR REPLACE FUNCTION content.etl_outbox_film_work() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO content.etl_outbox (film_work_id) VALUES (NEW.id);
+    PERFORM pg_notify('etl_outbox', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION content.etl_outbox_genre() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO content.etl_outbox (film_work_id)
+        SELECT film_work_id FROM content.genre_film_work
+        WHERE genre_id = NEW.id;
+    PERFORM pg_notify('etl_outbox', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION content.etl_outbox_person() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO content.etl_outbox (film_work_id)
+        SELECT film_work_id FROM content.person_film_work
+        WHERE person_id = NEW.id;
+    PERFORM pg_notify('etl_outbox', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION content.etl_outbox_link() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO content.etl_outbox (film_work_id) VALUES (OLD.film_work_id);
+    ELSE
+        INSERT INTO content.etl_outbox (film_work_id) VALUES (NEW.film_work_id);
+    END IF;
+    PERFORM pg_notify('etl_outbox', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER etl_outbox_film_work
+    AFTER INSERT OR UPDATE ON content.film_work
+    FOR EACH ROW EXECUTE PROCEDURE content.etl_outbox_film_work();
+CREATE TRIGGER etl_outbox_genre
+    AFTER UPDATE ON content.genre
+    FOR EACH ROW EXECUTE PROCEDURE content.etl_outbox_genre();
+CREATE TRIGGER etl_outbox_person
+    AFTER UPDATE ON content.person
+    FOR EACH ROW EXECUTE PROCEDURE content.etl_outbox_person();
+CREATE TRIGGER etl_outbox_genre_film_work
+    AFTER INSERT OR UPDATE OR DELETE ON content.genre_film_work
+    FOR EACH ROW EXECUTE PROCEDURE content.etl_outbox_link();
+CREATE TRIGGER etl_outbox_person_film_work
+    AFTER INSERT OR UPDATE OR DELETE ON content.person_film_work
+    FOR EACH ROW EXECUTE PROCEDURE content.etl_outbox_link();
+"""
+
+DROP_OUTBOX_SQL = """
+DROP TRIGGER IF EXISTS etl_outbox_film_work ON content.film_work;
+DROP TRIGGER IF EXISTS etl_outbox_genre ON content.genre;
+DROP TRIGGER IF EXISTS etl_outbox_person ON content.person;
+DROP TRIGGER IF EXISTS etl_outbox_genre_film_work ON content.genre_film_work;
+DROP TRIGGER IF EXISTS etl_outbox_person_film_work ON content.person_film_work;
+DROP FUNCTION IF EXISTS content.etl_outbox_film_work();
+DROP FUNCTION IF EXISTS content.etl_outbox_genre();
+DROP FUNCTION IF EXISTS content.etl_outbox_person();
+DROP FUNCTION IF EXISTS content.etl_outbox_link();
+DROP TABLE IF EXISTS content.etl_outbox;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0006_alter_personfilmwork_id'),
+    ]
+
+    operations = [
+        migrations.RunSQL(OUTBOX_SQL, reverse_sql=DROP_OUTBOX_SQL),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 3.2 on 2026-10-18 12:00
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # Индексы строятся без блокировки записи в таблицы,
+    # CREATE INDEX CONCURRENTLY нельзя выполнять в транзакции
+    atomic = False
+
+    dependencies = [
+        ('movies', '0007_etl_outbox'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='filmwork',
+            index=models.Index(fields=['updated_at', 'id'], name='film_work_updated_at_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='genre',
+            index=models.Index(fields=['updated_at', 'id'], name='genre_updated_at_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='person',
+            index=models.Index(fields=['updated_at', 'id'], name='person_updated_at_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='genrefilmwork',
+            index=models.Index(fields=['genre', 'film_work'], name='genre_film_work_genre_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='personfilmwork',
+            index=models.Index(fields=['person', 'film_work'], name='person_film_work_person_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.2 on 2026-10-18 12:00
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # Индекс для постраничного вывода по курсору,
+    # CREATE INDEX CONCURRENTLY нельзя выполнять в транзакции
+    atomic = False
+
+    dependencies = [
+        ('movies', '0008_etl_scan_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='filmwork',
+            index=models.Index(fields=['created_at', 'id'], name='film_work_created_at_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations
+
+# Триггеры outbox нужны только ETL в режиме уведомлений
+# (ETL_CHANGE_CAPTURE=true), он включает их при запуске. В режиме опроса
+# события никто не забирает, поэтому по умолчанию триггеры выключены,
+# а накопленные события удаляются
+TRIGGERS = (
+    ('film_work', 'etl_outbox_film_work'),
+    ('genre', 'etl_outbox_genre'),
+    ('person', 'etl_outbox_person'),
+    ('genre_film_work', 'etl_outbox_genre_film_work'),
+    ('person_film_work', 'etl_outbox_person_film_work'),
+)
+
+DISABLE_SQL = ''.join(
+    'ALTER TABLE content.{0} DISABLE TRIGGER {1};\n'.format(table, trigger)
+    for table, trigger in TRIGGERS) + 'TRUNCATE content.etl_outbox;\n'
+
+ENABLE_SQL = ''.join(
+    'ALTER TABLE content.{0} ENABLE TRIGGER {1};\n'.format(table, trigger)
+    for table, trigger in TRIGGERS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0009_film_work_created_at_idx'),
+    ]
+
+    operations = [
+        migrations.RunSQL(DISABLE_SQL, reverse_sql=ENABLE_SQL),
+    ]
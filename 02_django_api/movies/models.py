@@ -28,6 +28,8 @@ class Genre(UUIDMixin, TimeStampedMixin):
         db_table = "content\".\"genre"
         verbose_name = 'жанр'
         verbose_name_plural = 'жанры'
+        indexes = [models.Index(fields=['updated_at', 'id'],
+                                name='genre_updated_at_idx')]
 
     def __str__(self):
         return self.name
@@ -42,6 +44,8 @@ class GenreFilmwork(UUIDMixin):
         db_table = "content\".\"genre_film_work"
         constraints = [models.UniqueConstraint(fields=['film_work', 'genre'],
                        name='unique_film_work_genre')]
+        indexes = [models.Index(fields=['genre', 'film_work'],
+                                name='genre_film_work_genre_idx')]
 
     def __str__(self):
         return '{0} - {1}'.format(self.film_work, self.genre)
@@ -54,6 +58,8 @@ class Person(UUIDMixin, TimeStampedMixin):
         db_table = "content\".\"person"
         verbose_name = 'персона'
         verbose_name_plural = 'персоны'
+        indexes = [models.Index(fields=['updated_at', 'id'],
+                                name='person_updated_at_idx')]
 
     def __str__(self):
         return self.full_name
@@ -81,6 +87,8 @@ class PersonFilmWork(UUIDMixin, models.Model):
         constraints = [models.UniqueConstraint(fields=['film_work', 'person',
                                                        'role'],
                        name='unique_person_and_role_for_film_work')]
+        indexes = [models.Index(fields=['person', 'film_work'],
+                                name='person_film_work_person_idx')]
 
     def __str__(self):
         return '{0} - {1}'.format(self.film_work, self.person)
@@ -113,6 +121,10 @@ class Filmwork(UUIDMixin, TimeStampedMixin):
         db_table = "content\".\"film_work"
         verbose_name = 'кинопроизведение'
         verbose_name_plural = 'кинопроизведения'
+        indexes = [models.Index(fields=['updated_at', 'id'],
+                                name='film_work_updated_at_idx'),
+                   models.Index(fields=['created_at', 'id'],
+                                name='film_work_created_at_idx')]
 
     def __str__(self):
         return self.title
@@ -0,0 +1,133 @@
+import threading
+
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from movies.api import counts
+from movies.api.cache import LIST_TAG, film_tag, response_cache
+from movies.models import (Filmwork, Genre, GenreFilmwork, Person,
+                           PersonFilmWork)
+
+# Поле связи со стороны жанра или человека
+LINK_FIELDS = {GenreFilmwork: 'genre_id', PersonFilmWork: 'person_id'}
+
+
+def invalidate(film_ids, films_changed: bool = False) -> None:
+    """Сброс ответов с фильмами film_ids после фиксации транзакции:
+    раньше другой запрос мог бы снова положить в кэш старые данные.
+    films_changed - фильмы созданы или удалены, меняются все страницы"""
+    tags = [film_tag(pk) for pk in film_ids]
+    if films_changed:
+        tags.append(LIST_TAG)
+    if tags:
+        transaction.on_commit(lambda: response_cache.invalidate(tags))
+
+
+class DeletedLinks(threading.local):
+    """Фильмы связей, которые удаляет текущий delete(), и фильмы,
+    которые он удаляет сами. Collector сначала шлет pre_delete всем
+    удаляемым объектам, затем удаляет строки и шлет post_delete"""
+
+    def __init__(self) -> None:
+        self.films = set()
+        self.deleted = set()
+
+
+deleted_links = DeletedLinks()
+
+
+def touch_films() -> None:
+    """Удаление связи не оставляет строки со временем изменения:
+    его получает updated_at фильмов, иначе Last-Modified ответа
+    не сдвинулся бы, а ETL в режиме опроса не увидел бы изменения.
+    Один UPDATE на delete(), без фильмов, которые удаляются сами"""
+    films = deleted_links.films - deleted_links.deleted
+    deleted_links.films = set()
+    if films:
+        Filmwork.objects.filter(id__in=films).update(
+            updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Filmwork)
+def film_saved(sender, instance, created, **kwargs):
+    # Количество поправляется раньше сброса страниц списка: иначе
+    # страница, собранная между ними, попала бы в кэш со старым count
+    if created:
+        transaction.on_commit(lambda: counts.add_films(1))
+    if response_cache.enabled:
+        invalidate([instance.pk], films_changed=created)
+
+
+@receiver(post_delete, sender=Filmwork)
+def film_deleted(sender, instance, **kwargs):
+    deleted_links.deleted.discard(instance.pk)
+    transaction.on_commit(lambda: counts.add_films(-1))
+    if response_cache.enabled:
+        invalidate([instance.pk], films_changed=True)
+
+
+# Удаление жанра или человека сначала удаляет их связи,
+# и ответы сбрасывают сигналы связей
+@receiver(post_save, sender=Genre)
+def genre_saved(sender, instance, created, **kwargs):
+    if response_cache.enabled and not created:
+        invalidate(GenreFilmwork.objects.filter(
+            genre_id=instance.pk).values_list('film_work_id', flat=True))
+
+
+@receiver(post_save, sender=Person)
+def person_saved(sender, instance, created, **kwargs):
+    if response_cache.enabled and not created:
+        invalidate(PersonFilmWork.objects.filter(
+            person_id=instance.pk).values_list('film_work_id', flat=True))
+
+
+@receiver(post_save, sender=GenreFilmwork)
+@receiver(post_delete, sender=GenreFilmwork)
+@receiver(post_save, sender=PersonFilmWork)
+@receiver(post_delete, sender=PersonFilmWork)
+def link_changed(sender, instance, **kwargs):
+    if response_cache.enabled:
+        invalidate([instance.film_work_id])
+
+
+@receiver(pre_delete, sender=Filmwork)
+def film_deleting(sender, instance, **kwargs):
+    deleted_links.deleted.add(instance.pk)
+
+
+# remove(), clear() и каскад от жанра, человека или фильма тоже
+# удаляют связи через Collector
+@receiver(pre_delete, sender=GenreFilmwork)
+@receiver(pre_delete, sender=PersonFilmWork)
+def link_deleting(sender, instance, **kwargs):
+    deleted_links.films.add(instance.film_work_id)
+
+
+@receiver(post_delete, sender=GenreFilmwork)
+@receiver(post_delete, sender=PersonFilmWork)
+def link_deleted(sender, instance, **kwargs):
+    # Первый post_delete приходит, когда pre_delete получили уже все
+    # связи этого delete(), остальные находят список пустым
+    touch_films()
+
+
+@receiver(m2m_changed, sender=GenreFilmwork)
+@receiver(m2m_changed, sender=PersonFilmWork)
+def links_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """add, remove и clear у Filmwork.genres и Filmwork.persons
+    и у обратных связей жанра и человека"""
+    if not response_cache.enabled:
+        return
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            invalidate([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        invalidate(pk_set)
+    elif action == 'pre_clear':
+        invalidate(sender.objects.filter(
+            **{LINK_FIELDS[sender]: instance.pk}).values_list(
+            'film_work_id', flat=True))
@@ -0,0 +1,88 @@
+"""Пропускная способность движков индексации (bulk, streaming, parallel)
+   на заглушке ElasticSearch с искусственной задержкой ответа.
+   Движки проходят --rounds кругов, и каждый круг начинает следующий
+   движок; у каждого прохода свой AdaptiveBatcher, чтобы размер пачки,
+   подобранный одним движком, не доставался другому. Выводится медиана
+   по кругам.
+
+   python benchmarks/bench_bulk.py --docs 20000 --latency 0.05
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import uuid
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..',
+                                'postgres_to_es'))
+
+import elasticsearch  # noqa: E402
+
+import config  # noqa: E402
+import etl  # noqa: E402
+from batching import AdaptiveBatcher  # noqa: E402
+from es_stub import serve  # noqa: E402
+
+ENGINES = ('bulk', 'streaming', 'parallel')
+
+
+def make_doc(film_id: str, number: int) -> dict:
+    """Документ фильма в формате индекса movies"""
+    people = [{'id': str(uuid.uuid5(uuid.NAMESPACE_OID, str(i))),
+               'name': 'Person {0}'.format(i)} for i in range(5)]
+    return {
+        'id': film_id,
+        'imdb_rating': 7.5,
+        'genre': ['Action', 'Drama'],
+        'title': 'Film {0}'.format(number),
+        'description': 'description ' * 20,
+        'director': ['Person 0'],
+        'actors_names': [p['name'] for p in people[:3]],
+        'writers_names': [p['name'] for p in people[3:]],
+        'actors': people[:3],
+        'writers': people[3:],
+    }
+
+
+def make_rows(count: int) -> list:
+    """Строки в формате результата make_query: id и документ текстом JSON"""
+    rows = []
+    for i in range(count):
+        film_id = str(uuid.uuid4())
+        rows.append((film_id, json.dumps(make_doc(film_id, i))))
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--docs', type=int, default=20000)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--port', type=int, default=9201)
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    server = serve(args.port, args.latency)
+    es = elasticsearch.Elasticsearch(
+        [{'host': '127.0.0.1', 'port': args.port}],
+        maxsize=config.BULK_THREADS)
+    rows = make_rows(args.docs)
+    rates = {engine: [] for engine in ENGINES}
+    for number in range(args.rounds):
+        shift = number % len(ENGINES)
+        for engine in ENGINES[shift:] + ENGINES[:shift]:
+            config.BULK_ENGINE = engine
+            etl.batcher = AdaptiveBatcher.from_config()
+            started = perf_counter()
+            etl.load_batches(rows, es)
+            rates[engine].append(args.docs / (perf_counter() - started))
+    server.shutdown()
+    for engine, values in rates.items():
+        print('{0:>9}: {1:.0f} док/с (круги: {2})'.format(
+            engine, statistics.median(values),
+            ', '.join('{0:.0f}'.format(value) for value in values)))
+
+
+if __name__ == '__main__':
+    main()
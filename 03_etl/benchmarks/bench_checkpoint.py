@@ -0,0 +1,149 @@
+"""Сколько документов индексируется повторно после падения ETL
+   посреди прохода: с продолжением от контрольной точки и с повтором
+   прохода с начала окна. Проход падает после --crash-after документов
+   и перезапускается; заглушка ElasticSearch считает все документы.
+   Состояние в Redis перед каждым сценарием сбрасывается и затем
+   восстанавливается. --mode async проверяет асинхронный движок.
+
+   python benchmarks/bench_checkpoint.py --films 100000 --crash-after 50000
+   python benchmarks/bench_checkpoint.py --mode async
+"""
+import argparse
+import asyncio
+import datetime as dt
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..',
+                                'postgres_to_es'))
+
+import redis  # noqa: E402
+from elasticsearch import AsyncElasticsearch  # noqa: E402
+from redis import asyncio as aioredis  # noqa: E402
+
+import async_etl  # noqa: E402
+import etl  # noqa: E402
+from batching import AdaptiveBatcher  # noqa: E402
+from es_stub import serve  # noqa: E402
+from fixtures import drop_films, generate_films, pg_connect, pg_dsl  # noqa
+from state import STATES, StateStore  # noqa: E402
+
+CHECKPOINT = StateStore.checkpoint_key
+
+
+def redis_dsl() -> dict:
+    return {'host': os.environ.get('REDIS_HOST'),
+            'port': os.environ.get('REDIS_PORT')}
+
+
+async def run_async_pass(es_dsl: dict, crash_after: int) -> None:
+    """Один проход асинхронного движка, падение - как в run_pass"""
+    if crash_after:
+        send_batch = async_etl.send_batch
+        sent = [0]
+
+        async def crashing_send_batch(es, r, actions):
+            failed = await send_batch(es, r, actions)
+            sent[0] += len(actions)
+            if sent[0] >= crash_after:
+                os._exit(1)
+            return failed
+
+        async_etl.send_batch = crashing_send_batch
+    pool = await async_etl.connect(pg_dsl())
+    es = AsyncElasticsearch([es_dsl])
+    r = aioredis.Redis(**redis_dsl())
+    await async_etl.run_cycle(pool, es, r, AdaptiveBatcher.from_config())
+    await pool.close()
+    await es.close()
+    await r.close()
+
+
+def run_pass(port: int, crash_after: int, mode: str) -> None:
+    """Один проход ETL; при crash_after > 0 процесс завершается
+       без очистки сразу после пачки, на которой набралось столько
+       документов"""
+    if mode == 'async':
+        asyncio.run(run_async_pass({'host': '127.0.0.1', 'port': port},
+                                   crash_after))
+        return
+    if crash_after:
+        bulk_load = etl.bulk_load
+        sent = [0]
+
+        def crashing_bulk_load(es, actions):
+            actions = list(actions)
+            failed = bulk_load(es, actions)
+            sent[0] += len(actions)
+            if sent[0] >= crash_after:
+                os._exit(1)
+            return failed
+
+        etl.bulk_load = crashing_bulk_load
+    connections = etl.connect(pg_dsl(), {'host': '127.0.0.1', 'port': port},
+                              redis_dsl())
+    etl.try_connect(connections)
+    connections.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--films', type=int, default=100000)
+    parser.add_argument('--crash-after', type=int, default=50000)
+    parser.add_argument('--port', type=int, default=9201)
+    parser.add_argument('--mode', choices=('sync', 'async'), default='sync')
+    parser.add_argument('--run', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run is not None:
+        run_pass(args.port, args.run, args.mode)
+        return
+
+    server = serve(args.port, 0.0)
+    r = redis.Redis(**redis_dsl())
+    saved = {key: r.get(key) for key in STATES + (CHECKPOINT,)}
+    pg_conn = pg_connect()
+    generate_films(pg_conn, args.films)
+
+    def child(crash_after: int) -> None:
+        # Фильмы созданы прямо перед замером, окно не должно отставать
+        subprocess.run(
+            [sys.executable, __file__, '--port', str(args.port),
+             '--mode', args.mode, '--run', str(crash_after)],
+            env={**os.environ, 'ETL_COMMIT_LAG': '0'})
+
+    def reset() -> None:
+        for state in STATES:
+            r.set(state, dt.datetime.min.isoformat())
+        r.delete(CHECKPOINT)
+
+    try:
+        reset()
+        child(0)
+        clean = server.documents
+        print('без падения: {0} документов'.format(clean))
+        for title, keep_checkpoint in (('с контрольной точкой', True),
+                                       ('с начала окна', False)):
+            reset()
+            before = server.documents
+            child(args.crash_after)
+            if not keep_checkpoint:
+                r.delete(CHECKPOINT)
+            child(0)
+            sent = server.documents - before
+            print('{0}: {1} документов, повторно {2}'.format(
+                title, sent, sent - clean))
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                r.delete(key)
+            else:
+                r.set(key, value)
+        drop_films(pg_conn)
+        pg_conn.close()
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Сколько записей в ElasticSearch убирает пропуск неизменившихся
+   документов на повторе правок из админки: большая часть сохранений
+   только обновляет updated_at, меньшая меняет содержимое.
+
+   python benchmarks/bench_dedup.py --films 10000 --edits 20000 --changed 0.2
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..',
+                                'postgres_to_es'))
+
+import elasticsearch  # noqa: E402
+
+import etl  # noqa: E402
+import metrics  # noqa: E402
+from bench_bulk import make_doc, make_rows  # noqa: E402
+from es_stub import serve  # noqa: E402
+from fingerprints import LocalFingerprints  # noqa: E402
+
+
+def replay(es, server, rows: list, edits: list, store) -> int:
+    """Первичная загрузка и повтор правок, возвращает число записей в ES
+       на этапе правок"""
+    etl.load_batches(rows, es, store)
+    server.documents = 0
+    for number, (index, changed) in enumerate(edits):
+        row = rows[index]
+        if changed:
+            doc = make_doc(row[0], index)
+            doc['title'] = 'Film {0} edit {1}'.format(index, number)
+            row = (row[0], json.dumps(doc))
+            rows[index] = row
+        etl.load_batches([row], es, store)
+    return server.documents
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--films', type=int, default=10000)
+    parser.add_argument('--edits', type=int, default=20000)
+    parser.add_argument('--changed', type=float, default=0.2,
+                        help='доля правок, которые меняют содержимое')
+    parser.add_argument('--port', type=int, default=9201)
+    args = parser.parse_args()
+
+    server = serve(args.port, 0)
+    es = elasticsearch.Elasticsearch([{'host': '127.0.0.1',
+                                       'port': args.port}])
+    rows = make_rows(args.films)
+    rng = random.Random(0)
+    edits = [(rng.randrange(args.films), rng.random() < args.changed)
+             for _ in range(args.edits)]
+
+    without = replay(es, server, list(rows), edits, None)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = LocalFingerprints(os.path.join(tmp, 'fp.sqlite3'),
+                                  capacity=args.films * 2)
+        with_dedup = replay(es, server, list(rows), edits, store)
+    server.shutdown()
+
+    counters = metrics.snapshot()
+    print('записей без хэшей: {0}, с хэшами: {1} ({2:.0%} меньше)'.format(
+        without, with_dedup, 1 - with_dedup / without))
+    print('попаданий: {0}, промахов: {1}'.format(
+        counters.get('dedup_hits', 0), counters.get('dedup_misses', 0)))
+
+
+if __name__ == '__main__':
+    main()
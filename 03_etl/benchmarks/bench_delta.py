@@ -0,0 +1,63 @@
+"""Сколько повторных индексаций убирает объединенная выгрузка
+   изменений по сравнению с отдельными проходами по film_work,
+   genre и person. Изменения делаются в транзакции и откатываются.
+
+   python benchmarks/bench_delta.py --films 500 --genres 5 --persons 200
+"""
+import argparse
+import datetime as dt
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..',
+                                'postgres_to_es'))
+
+from fixtures import pg_connect  # noqa: E402
+from queries import DELTA_PARAMS, make_delta_query, make_prequery  # noqa
+
+TOUCH_QUERY = (
+    "UPDATE content.{0} SET updated_at = clock_timestamp() "
+    "WHERE id IN (SELECT id FROM content.{0} ORDER BY random() LIMIT %s)")
+
+
+def count(pg_cursor, query: str, params: dict) -> int:
+    pg_cursor.execute("SELECT count(*) FROM ({0}) AS q".format(query), params)
+    return pg_cursor.fetchone()[0]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--films', type=int, default=500)
+    parser.add_argument('--genres', type=int, default=5)
+    parser.add_argument('--persons', type=int, default=200)
+    args = parser.parse_args()
+
+    pg_conn = pg_connect()
+    with pg_conn.cursor() as pg_cursor:
+        # now() - время начала транзакции, изменения будут позже него
+        pg_cursor.execute("SELECT now()")
+        since = pg_cursor.fetchone()[0]
+        touched = {'film_work': args.films, 'genre': args.genres,
+                   'person': args.persons}
+        for table, limit in touched.items():
+            pg_cursor.execute(TOUCH_QUERY.format(table), (limit,))
+
+        states = {table: since for table in touched}
+        states['upper'] = dt.datetime.max
+        passes = {table: count(pg_cursor,
+                               make_prequery(table, DELTA_PARAMS[table]),
+                               states)
+                  for table in touched}
+        unique = count(pg_cursor, make_delta_query(DELTA_PARAMS), states)
+    pg_conn.rollback()
+    pg_conn.close()
+
+    total = sum(passes.values())
+    for table, films in passes.items():
+        print('{0:>9}: {1} фильмов'.format(table, films))
+    print('отдельные проходы: {0}, объединенная выгрузка: {1}, '
+          'повторов убрано: {2}'.format(total, unique, total - unique))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Задержка от сохранения фильма в БД до появления изменения
+   в ElasticSearch. ETL должен быть запущен отдельно: в режиме опроса
+   или с ETL_CHANGE_CAPTURE=true, чтобы сравнить режимы.
+
+   python benchmarks/bench_latency.py --samples 20
+"""
+import argparse
+import os
+import statistics
+import sys
+from time import monotonic, sleep
+
+import elasticsearch
+
+from fixtures import pg_connect
+
+
+def wait_visible(es: elasticsearch.Elasticsearch, film_id: str,
+                 title: str, timeout: float) -> float:
+    """Ожидание нового названия фильма в индексе, возвращает задержку"""
+    started = monotonic()
+    while monotonic() - started < timeout:
+        try:
+            doc = es.get(index='movies', id=film_id)
+            if doc['_source']['title'] == title:
+                return monotonic() - started
+        except elasticsearch.NotFoundError:
+            pass
+        sleep(0.01)
+    raise TimeoutError('Фильм {0} не появился в индексе'.format(film_id))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--samples', type=int, default=20)
+    parser.add_argument('--timeout', type=float, default=120)
+    args = parser.parse_args()
+
+    es = elasticsearch.Elasticsearch([{
+        'host': os.environ.get('ES_HOST', 'localhost'),
+        'port': os.environ.get('ES_PORT', 9200)}])
+    pg_conn = pg_connect()
+    with pg_conn.cursor() as pg_cursor:
+        pg_cursor.execute(
+            "SELECT id, title FROM content.film_work "
+            "ORDER BY random() LIMIT %s", (args.samples,))
+        films = pg_cursor.fetchall()
+    pg_conn.commit()
+
+    latencies = []
+    try:
+        for number, (film_id, title) in enumerate(films):
+            new_title = '{0} [bench {1}]'.format(title, number)
+            # Так же, как сохранение в админке: обновление строки и коммит
+            with pg_conn.cursor() as pg_cursor:
+                pg_cursor.execute(
+                    "UPDATE content.film_work "
+                    "SET title = %s, updated_at = now() WHERE id = %s",
+                    (new_title, film_id))
+            pg_conn.commit()
+            latencies.append(wait_visible(es, film_id, new_title,
+                                          args.timeout))
+    finally:
+        with pg_conn.cursor() as pg_cursor:
+            for film_id, title in films:
+                pg_cursor.execute(
+                    "UPDATE content.film_work "
+                    "SET title = %s, updated_at = now() WHERE id = %s",
+                    (title, film_id))
+        pg_conn.commit()
+        pg_conn.close()
+
+    if not latencies:
+        sys.exit('Нет замеров')
+    latencies.sort()
+    print('p50 {0:.3f} с, p95 {1:.3f} с, max {2:.3f} с'.format(
+        statistics.median(latencies),
+        latencies[int(len(latencies) * 0.95) - 1 if len(latencies) > 1 else 0],
+        latencies[-1]))
+
+
+if __name__ == '__main__':
+    main()
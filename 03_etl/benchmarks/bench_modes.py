@@ -0,0 +1,84 @@
+"""Сравнение синхронного цикла и асинхронного движка на одном наборе
+   фильмов: один полный проход каждого режима в заглушку ElasticSearch.
+   Состояние в Redis перед каждым проходом сбрасывается и затем
+   восстанавливается.
+
+   python benchmarks/bench_modes.py --films 100000 --latency 0.02
+"""
+import argparse
+import asyncio
+import datetime as dt
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..',
+                                'postgres_to_es'))
+
+import redis  # noqa: E402
+from elasticsearch import AsyncElasticsearch  # noqa: E402
+from redis import asyncio as aioredis  # noqa: E402
+
+import async_etl  # noqa: E402
+import config  # noqa: E402
+import etl  # noqa: E402
+from batching import AdaptiveBatcher  # noqa: E402
+from es_stub import serve  # noqa: E402
+from fixtures import drop_films, generate_films, pg_connect, pg_dsl  # noqa
+from state import STATES, StateStore  # noqa: E402
+
+CHECKPOINT = StateStore.checkpoint_key
+
+
+async def run_async(dsl: dict, es_dsl: dict, redis_dsl: dict) -> None:
+    pool = await async_etl.connect(dsl)
+    es = AsyncElasticsearch([es_dsl])
+    r = aioredis.Redis(**redis_dsl)
+    await async_etl.run_cycle(pool, es, r, AdaptiveBatcher.from_config())
+    await pool.close()
+    await es.close()
+    await r.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--films', type=int, default=100000)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--port', type=int, default=9201)
+    args = parser.parse_args()
+
+    server = serve(args.port, args.latency)
+    es_dsl = {'host': '127.0.0.1', 'port': args.port}
+    redis_dsl = {'host': os.environ.get('REDIS_HOST'),
+                 'port': os.environ.get('REDIS_PORT')}
+    r = redis.Redis(**redis_dsl)
+    saved = {state: r.get(state) for state in STATES + (CHECKPOINT,)}
+    # Фильмы создаются прямо перед замером, окно не должно отставать
+    config.COMMIT_LAG = 0
+    pg_conn = pg_connect()
+    generate_films(pg_conn, args.films)
+    try:
+        connections = etl.connect(pg_dsl(), es_dsl, redis_dsl)
+        runs = (('sync', lambda: etl.try_connect(connections)),
+                ('async', lambda: asyncio.run(
+                    run_async(pg_dsl(), es_dsl, redis_dsl))))
+        for mode, run in runs:
+            for state in STATES:
+                r.set(state, dt.datetime.min.isoformat())
+            r.delete(CHECKPOINT)
+            started = perf_counter()
+            run()
+            print('{0:>5}: {1:.1f} с'.format(mode, perf_counter() - started))
+    finally:
+        for state, value in saved.items():
+            if value is None:
+                r.delete(state)
+            else:
+                r.set(state, value)
+        drop_films(pg_conn)
+        pg_conn.close()
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Переименование человека, связанного с большим числом фильмов:
+   байты и время при полной переиндексации фильмов и при частичном
+   обновлении полей людей. Загрузка идет в заглушку ElasticSearch.
+
+   python benchmarks/bench_partial.py --films 10000
+"""
+import argparse
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..',
+                                'postgres_to_es'))
+
+import elasticsearch  # noqa: E402
+from elasticsearch.serializer import JSONSerializer  # noqa: E402
+
+import etl  # noqa: E402
+from documents import partial_updates, transform  # noqa: E402
+from es_stub import serve  # noqa: E402
+from fixtures import (FIXTURE_MARK, drop_films, generate_films,  # noqa: E402
+                      pg_connect)
+from loader import expand_action  # noqa: E402
+from queries import make_persons_query, make_query  # noqa: E402
+
+PERSON_ID = '00000000-0000-0000-0000-0000000000be'
+
+
+def link_person(pg_conn) -> None:
+    """Человек, который сыграл во всех сгенерированных фильмах"""
+    with pg_conn.cursor() as pg_cursor:
+        pg_cursor.execute(
+            "INSERT INTO content.person (id, full_name, created_at, "
+            "updated_at) VALUES (%s, 'Bench Person', now(), now()) "
+            "ON CONFLICT (id) DO NOTHING", (PERSON_ID,))
+        pg_cursor.execute(
+            "INSERT INTO content.person_film_work "
+            "(id, film_work_id, person_id, role, created_at) "
+            "SELECT md5('pfw' || fw.id)::uuid, fw.id, %s, 'actor', now() "
+            "FROM content.film_work fw WHERE fw.file_path = %s "
+            "ON CONFLICT DO NOTHING", (PERSON_ID, FIXTURE_MARK))
+    pg_conn.commit()
+
+
+def unlink_person(pg_conn) -> None:
+    # Каскад on_delete есть только в Django, в схеме БД его нет
+    with pg_conn.cursor() as pg_cursor:
+        pg_cursor.execute(
+            "DELETE FROM content.person_film_work WHERE person_id = %s",
+            (PERSON_ID,))
+        pg_cursor.execute("DELETE FROM content.person WHERE id = %s",
+                          (PERSON_ID,))
+    pg_conn.commit()
+
+
+def payload_bytes(actions) -> int:
+    """Объем тела bulk-запросов для действий"""
+    serializer = JSONSerializer()
+    total = 0
+    for action in actions:
+        meta, source = expand_action(action)
+        total += len(serializer.dumps(meta)) + len(serializer.dumps(source))
+        total += 2
+    return total
+
+
+def measure(pg_conn, es, query: str, make_actions, load) -> tuple:
+    started = perf_counter()
+    with pg_conn.cursor() as pg_cursor:
+        pg_cursor.execute(query, (PERSON_ID,))
+        rows = pg_cursor.fetchall()
+    load(rows, es)
+    elapsed = perf_counter() - started
+    return payload_bytes(make_actions(rows)), elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--films', type=int, default=10000)
+    parser.add_argument('--latency', type=float, default=0.01)
+    parser.add_argument('--port', type=int, default=9201)
+    args = parser.parse_args()
+
+    server = serve(args.port, args.latency)
+    es = elasticsearch.Elasticsearch([{'host': '127.0.0.1',
+                                       'port': args.port}])
+    pg_conn = pg_connect()
+    generate_films(pg_conn, args.films)
+    link_person(pg_conn)
+    try:
+        films = ("SELECT film_work_id FROM content.person_film_work "
+                 "WHERE person_id = %s")
+        full = measure(
+            pg_conn, es,
+            make_query("WHERE fw.id IN ({0}) ".format(films)),
+            transform, etl.load_batches)
+        partial = measure(
+            pg_conn, es,
+            make_persons_query("WHERE pfw.film_work_id IN ({0}) ".format(
+                films)),
+            partial_updates,
+            lambda rows, es: etl.update_batches(
+                pg_conn, rows, es, partial_updates))
+    finally:
+        unlink_person(pg_conn)
+        drop_films(pg_conn)
+        pg_conn.close()
+        server.shutdown()
+
+    for mode, (sent, elapsed) in (('полная', full), ('частичная', partial)):
+        print('{0:>9}: {1:.1f} МБ, {2:.2f} с'.format(
+            mode, sent / 1024 / 1024, elapsed))
+
+
+if __name__ == '__main__':
+    main()
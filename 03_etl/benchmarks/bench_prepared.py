@@ -0,0 +1,70 @@
+"""Время на пачку фильмов по id: запрос, собираемый заново на каждую
+   пачку, против подготовленного на сервере (PREPARE/EXECUTE).
+   Для обычного запроса дополнительно выводится время планирования
+   из EXPLAIN (SUMMARY).
+
+   python benchmarks/bench_prepared.py --batches 200 --batch-size 100
+"""
+import argparse
+import os
+import re
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..',
+                                'postgres_to_es'))
+
+import psycopg2  # noqa: E402
+from psycopg2.extras import DictCursor  # noqa: E402
+
+from connections import PreparingConnection  # noqa: E402
+from fixtures import pg_dsl  # noqa: E402
+from queries import make_query  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batches', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=100)
+    args = parser.parse_args()
+
+    pg_conn = psycopg2.connect(**pg_dsl(), cursor_factory=DictCursor,
+                               connection_factory=PreparingConnection)
+    pg_cursor = pg_conn.cursor()
+    pg_cursor.execute("SELECT id FROM content.film_work ORDER BY random() "
+                      "LIMIT %s", (args.batches * args.batch_size,))
+    ids = [row[0] for row in pg_cursor.fetchall()]
+    batches = [ids[i:i + args.batch_size]
+               for i in range(0, len(ids), args.batch_size)]
+
+    # Запрос с id в тексте, как было до параметризации
+    planning = 0.0
+    started = perf_counter()
+    for batch in batches:
+        query = make_query("WHERE fw.id IN ({0}) ".format(
+            ', '.join("'{0}'".format(film_id) for film_id in batch)))
+        pg_cursor.execute(query)
+        pg_cursor.fetchall()
+    adhoc = (perf_counter() - started) / len(batches)
+    for batch in batches[:20]:
+        pg_cursor.execute('EXPLAIN (SUMMARY) ' + make_query(
+            "WHERE fw.id IN ({0}) ".format(
+                ', '.join("'{0}'".format(film_id) for film_id in batch))))
+        plan = '\n'.join(row[0] for row in pg_cursor.fetchall())
+        planning += float(re.search(r'Planning Time: ([\d.]+)', plan)[1])
+
+    started = perf_counter()
+    for batch in batches:
+        pg_conn.execute_prepared(pg_cursor, 'etl_films_by_ids', (batch,))
+        pg_cursor.fetchall()
+    prepared = (perf_counter() - started) / len(batches)
+    pg_conn.rollback()
+    pg_conn.close()
+
+    print('запрос в тексте: {0:.2f} мс на пачку, из них планирование '
+          '{1:.2f} мс'.format(adhoc * 1000, planning / min(20, len(batches))))
+    print('PREPARE/EXECUTE: {0:.2f} мс на пачку'.format(prepared * 1000))
+
+
+if __name__ == '__main__':
+    main()
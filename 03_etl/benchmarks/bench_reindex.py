@@ -0,0 +1,74 @@
+"""Скорость полной загрузки фильмов в Elasticsearch: в живой индекс
+   с обычными настройками против переиндексации в новую версию
+   (refresh_interval -1, без реплик, затем слияние сегментов
+   и переключение псевдонима). Нужен Elasticsearch с индексом movies,
+   его схема копируется в индекс bench_movies, который удаляется
+   после замера.
+
+   python benchmarks/bench_reindex.py --films 200000
+"""
+import argparse
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..',
+                                'postgres_to_es'))
+
+import config  # noqa: E402
+import etl  # noqa: E402
+import reindex  # noqa: E402
+from fixtures import drop_films, generate_films, pg_connect, pg_dsl  # noqa
+
+ALIAS = 'bench_movies'
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--films', type=int, default=200000)
+    args = parser.parse_args()
+
+    es_dsl = {'host': os.environ.get('ES_HOST', 'localhost'),
+              'port': os.environ.get('ES_PORT', 9200)}
+    redis_dsl = {'host': os.environ.get('REDIS_HOST'),
+                 'port': os.environ.get('REDIS_PORT')}
+    connections = etl.connect(pg_dsl(), es_dsl, redis_dsl)
+    es = connections.es
+
+    # Живой индекс для замера - копия movies с его настройками
+    body, restore = reindex.clone_body(es, config.INDEX)
+    body['settings']['index'].update(restore)
+    config.INDEX = ALIAS
+    es.indices.create(index=ALIAS, body=body)
+
+    pg_conn = pg_connect()
+    generate_films(pg_conn, args.films)
+    try:
+        started = perf_counter()
+        with connections.postgres() as etl_conn, etl_conn:
+            loaded = reindex.load_index(etl_conn, es, ALIAS)
+        es.indices.refresh(index=ALIAS)
+        elapsed = perf_counter() - started
+        print('в живой индекс: {0} фильмов за {1:.1f} с, {2:.0f} док/с'.format(
+            loaded, elapsed, loaded / elapsed))
+
+        started = perf_counter()
+        index = reindex.reindex(connections)
+        elapsed = perf_counter() - started
+        count = es.count(index=index)['count']
+        print('переиндексация: {0} фильмов за {1:.1f} с, {2:.0f} док/с, '
+              'включая слияние и переключение'.format(
+                  count, elapsed, count / elapsed))
+    finally:
+        # После переключения bench_movies - псевдоним,
+        # удаляются индексы, на которые он указывает
+        names = list(es.indices.get(index=ALIAS + '*'))
+        if names:
+            es.indices.delete(index=','.join(names))
+        drop_films(pg_conn)
+        pg_conn.close()
+        connections.close()
+
+
+if __name__ == '__main__':
+    main()
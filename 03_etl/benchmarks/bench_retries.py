@@ -0,0 +1,96 @@
+"""Время восстановления под 429 от ElasticSearch: прежний повтор пачки
+   целиком (backoff по любому исключению) против повтора только
+   отклоненных документов (retries.retry_items). Заглушка отвечает 429
+   по всем документам доли --reject-rate bulk-запросов; документы
+   --poison отклоняются всегда ошибкой 400. Печатает время загрузки,
+   сколько документов получила заглушка на один исходный
+   и сколько документов не загружено.
+
+   python benchmarks/bench_retries.py --docs 20000 --reject-rate 0.2 --poison 3
+"""
+import argparse
+import logging
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..',
+                                'postgres_to_es'))
+
+import backoff  # noqa: E402
+import elasticsearch  # noqa: E402
+from elasticsearch import helpers  # noqa: E402
+
+import config  # noqa: E402
+import etl  # noqa: E402
+import metrics  # noqa: E402
+from bench_bulk import make_rows  # noqa: E402
+from documents import transform  # noqa: E402
+from es_stub import serve  # noqa: E402
+from loader import expand_action  # noqa: E402
+
+
+def legacy_load(es: elasticsearch.Elasticsearch, rows: list,
+                max_time: float) -> int:
+    """Загрузка пачками с прежним повтором: любая ошибка документа
+       отправляет пачку заново целиком. Отклоненный навсегда документ
+       останавливает загрузку через max_time"""
+    @backoff.on_exception(backoff.expo, BaseException, max_time=max_time)
+    def etl_part2(films: list) -> None:
+        helpers.bulk(es, transform(films),
+                     chunk_size=config.BULK_CHUNK_SIZE,
+                     expand_action_callback=expand_action)
+
+    for start in range(0, len(rows), config.BATCH_MAX_DOCS):
+        etl_part2(rows[start:start + config.BATCH_MAX_DOCS])
+    return 0
+
+
+def retry_load(es: elasticsearch.Elasticsearch, rows: list,
+               max_time: float) -> int:
+    """Загрузка теми же пачками через etl_part2: повторяются только
+       отклоненные документы. Возвращает количество незагруженных"""
+    metrics.reset()
+    for start in range(0, len(rows), config.BATCH_MAX_DOCS):
+        etl.etl_part2(rows[start:start + config.BATCH_MAX_DOCS], es)
+    return metrics.counter('etl_documents_failed_total').value
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--docs', type=int, default=20000)
+    parser.add_argument('--latency', type=float, default=0.01)
+    parser.add_argument('--reject-rate', type=float, default=0.2)
+    parser.add_argument('--poison', type=int, default=3)
+    parser.add_argument('--max-time', type=float, default=30,
+                        help='предельное время повторов одной пачки, с')
+    parser.add_argument('--port', type=int, default=9201)
+    args = parser.parse_args()
+
+    # Повторы пишут предупреждения в лог на каждую попытку
+    logging.disable(logging.CRITICAL)
+    rows = make_rows(args.docs)
+    poison = frozenset(row[0] for row in rows[:args.poison])
+    server = serve(args.port, args.latency, args.reject_rate, poison)
+    es = elasticsearch.Elasticsearch(
+        [{'host': '127.0.0.1', 'port': args.port}])
+
+    for title, load in (('пачка целиком', legacy_load),
+                        ('только отклоненные', retry_load)):
+        server.documents = 0
+        started = perf_counter()
+        try:
+            failed = load(es, rows, args.max_time)
+        except helpers.BulkIndexError:
+            failed = None
+        elapsed = perf_counter() - started
+        print('{0:>18}: {1:.1f} с, отправлено {2:.2f} док. на документ, '
+              'не загружено: {3}'.format(
+                  title, elapsed, server.documents / args.docs,
+                  'проход остановлен ошибкой' if failed is None
+                  else failed))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
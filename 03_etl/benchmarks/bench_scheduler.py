@@ -0,0 +1,176 @@
+"""Нагрузка на Postgres и отставание индекса при постоянной паузе
+   между проходами (ETL_SCHEDULER=fixed) и адаптивном расписании:
+   без изменений (idle) и под потоком изменений (busy, --rate фильмов
+   в секунду). Каждый режим работает --seconds секунд, проходы идут
+   в заглушку ElasticSearch. Нагрузка - проходы и проверки ETL и прирост
+   транзакций и прочитанных строк в pg_stat_database (без транзакций
+   потока изменений, он в обоих расписаниях одинаковый). Отставание -
+   время от фиксации изменения фильма до его загрузки в заглушку;
+   после потока изменений цикл работает еще --drain секунд, чтобы
+   догнать последние изменения.
+
+   python benchmarks/bench_scheduler.py --films 10000 --seconds 120 --rate 20
+"""
+import argparse
+import datetime as dt
+import os
+import random
+import statistics
+import sys
+import threading
+from time import sleep, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..',
+                                'postgres_to_es'))
+
+import psycopg2  # noqa: E402
+import redis  # noqa: E402
+
+import config  # noqa: E402
+import etl  # noqa: E402
+import metrics  # noqa: E402
+from es_stub import serve  # noqa: E402
+from fixtures import (FIXTURE_MARK, drop_films, generate_films,  # noqa: E402
+                      pg_connect, pg_dsl)
+from scheduler import AdaptiveScheduler  # noqa: E402
+from state import STATES, StateStore  # noqa: E402
+
+CHECKPOINT = StateStore.checkpoint_key
+
+
+def pg_stats(stats_conn) -> tuple:
+    """Транзакции и прочитанные строки БД с запуска статистики"""
+    with stats_conn.cursor() as pg_cursor:
+        pg_cursor.execute('SELECT pg_stat_clear_snapshot()')
+        pg_cursor.execute(
+            'SELECT xact_commit + xact_rollback, tup_returned + tup_fetched '
+            'FROM pg_stat_database WHERE datname = current_database()')
+        return pg_cursor.fetchone()
+
+
+def run_loop(schedule: str, connections, stop: threading.Event) -> None:
+    """Цикл ETL, как в etl.py, до сигнала stop"""
+    def poll() -> None:
+        etl.try_connect(connections)
+
+    if schedule == 'fixed':
+        while not stop.is_set():
+            etl.run_guarded(poll)
+            stop.wait(config.POLL_INTERVAL)
+        return
+    scheduler = AdaptiveScheduler.from_config()
+    while not stop.is_set():
+        stop.wait(etl.schedule_step(connections, poll, scheduler))
+
+
+def write_changes(pg_conn, ids: list, rate: float, seconds: float) -> list:
+    """Поток изменений: rate фильмов в секунду, каждый фильм один раз.
+       Возвращает id и время фиксации каждого изменения"""
+    writes = []
+    finish = time() + seconds
+    while time() < finish:
+        if rate <= 0:
+            sleep(finish - time())
+            break
+        film_id = ids.pop()
+        with pg_conn.cursor() as pg_cursor:
+            pg_cursor.execute(
+                'UPDATE content.film_work SET updated_at = now() '
+                'WHERE id = %s', (film_id,))
+        pg_conn.commit()
+        writes.append((film_id, time()))
+        sleep(1 / rate)
+    return writes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--films', type=int, default=10000)
+    parser.add_argument('--seconds', type=float, default=120)
+    parser.add_argument('--rate', type=float, default=20)
+    parser.add_argument('--drain', type=float, default=30)
+    parser.add_argument('--latency', type=float, default=0.01)
+    parser.add_argument('--port', type=int, default=9201)
+    args = parser.parse_args()
+
+    server = serve(args.port, args.latency, track=True)
+    es_dsl = {'host': '127.0.0.1', 'port': args.port}
+    redis_dsl = {'host': os.environ.get('REDIS_HOST'),
+                 'port': os.environ.get('REDIS_PORT')}
+    r = redis.Redis(**redis_dsl)
+    saved = {state: r.get(state) for state in STATES + (CHECKPOINT,)}
+    pg_conn = pg_connect()
+    stats_conn = psycopg2.connect(**pg_dsl())
+    stats_conn.autocommit = True
+    generate_films(pg_conn, args.films)
+    try:
+        connections = etl.connect(pg_dsl(), es_dsl, redis_dsl)
+        # Начальная загрузка фильмов, созданных прямо перед замером
+        commit_lag = config.COMMIT_LAG
+        config.COMMIT_LAG = 0
+        for state in STATES:
+            r.set(state, dt.datetime.min.isoformat())
+        r.delete(CHECKPOINT)
+        etl.try_connect(connections)
+        config.COMMIT_LAG = commit_lag
+
+        with pg_conn.cursor() as pg_cursor:
+            pg_cursor.execute(
+                'SELECT id FROM content.film_work WHERE file_path = %s',
+                (FIXTURE_MARK,))
+            ids = [str(row[0]) for row in pg_cursor.fetchall()]
+        pg_conn.commit()
+        random.shuffle(ids)
+
+        for schedule in ('fixed', 'adaptive'):
+            for workload, rate in (('idle', 0), ('busy', args.rate)):
+                metrics.reset()
+                stop = threading.Event()
+                loop = threading.Thread(
+                    target=run_loop, args=(schedule, connections, stop))
+                xacts, rows = pg_stats(stats_conn)
+                loop.start()
+                writes = write_changes(pg_conn, ids, rate, args.seconds)
+                xacts_after, rows_after = pg_stats(stats_conn)
+                passes = metrics.histogram('etl_pass_seconds').count
+                probes = sum(
+                    metrics.counter('etl_probes_total', result=result).value
+                    for result in ('idle', 'pending'))
+                if writes:
+                    sleep(args.drain)
+                stop.set()
+                loop.join()
+
+                lags = [server.seen[film_id] - written
+                        for film_id, written in writes
+                        if server.seen.get(film_id, 0) >= written]
+                line = ('{0:>8} {1}: проходов {2}, проверок {3}, '
+                        'транзакций {4}, строк прочитано {5}'.format(
+                            schedule, workload, passes, probes,
+                            xacts_after - xacts - len(writes) - 1,
+                            rows_after - rows))
+                if writes:
+                    lags.sort()
+                    line += (', отставание с: медиана {0:.1f}, '
+                             '95% {1:.1f}, макс. {2:.1f}, '
+                             'не загружено {3}'.format(
+                                 statistics.median(lags) if lags else 0,
+                                 lags[int(len(lags) * 0.95)] if lags else 0,
+                                 lags[-1] if lags else 0,
+                                 len(writes) - len(lags)))
+                print(line)
+        connections.close()
+    finally:
+        for state, value in saved.items():
+            if value is None:
+                r.delete(state)
+            else:
+                r.set(state, value)
+        drop_films(pg_conn)
+        pg_conn.close()
+        stats_conn.close()
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
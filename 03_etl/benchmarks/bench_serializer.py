@@ -0,0 +1,70 @@
+"""Время сериализации bulk-чанка из 500 документов и разбора ответа
+   на него стандартным сериализатором клиента ElasticSearch и orjson.
+   Документы - словари (как в асинхронном движке до сборки в БД)
+   и текст JSON из БД, который сериализатор пропускает как есть.
+
+   python benchmarks/bench_serializer.py --chunk 500 --repeat 200
+"""
+import argparse
+import json
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..',
+                                'postgres_to_es'))
+
+from elasticsearch.serializer import JSONSerializer  # noqa: E402
+
+from bench_bulk import make_doc, make_rows  # noqa: E402
+from documents import transform  # noqa: E402
+from loader import expand_action  # noqa: E402
+from serializer import OrjsonSerializer  # noqa: E402
+
+
+def chunk_body(pairs: list, serializer: JSONSerializer) -> str:
+    """Тело bulk-запроса так же, как его собирают helpers"""
+    lines = []
+    for meta, source in pairs:
+        lines.append(serializer.dumps(meta))
+        lines.append(serializer.dumps(source))
+    return '\n'.join(lines) + '\n'
+
+
+def timed(repeat: int, func, *args) -> float:
+    started = perf_counter()
+    for _ in range(repeat):
+        func(*args)
+    return (perf_counter() - started) / repeat * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chunk', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    rows = make_rows(args.chunk)
+    text_pairs = [expand_action(action) for action in transform(rows)]
+    dict_pairs = [(meta, make_doc(row[0], number))
+                  for number, ((meta, _), row)
+                  in enumerate(zip(text_pairs, rows))]
+    response = json.dumps({'took': 5, 'errors': False, 'items': [
+        {'index': {'_index': 'movies', '_id': row[0], '_version': 1,
+                   'result': 'created', 'status': 201,
+                   '_shards': {'total': 2, 'successful': 1, 'failed': 0},
+                   '_seq_no': number, '_primary_term': 1}}
+        for number, row in enumerate(rows)]})
+
+    for title, serializer in (('json', JSONSerializer()),
+                              ('orjson', OrjsonSerializer())):
+        print('{0:>6}: словари {1:.2f} мс, текст из БД {2:.2f} мс, '
+              'разбор ответа {3:.2f} мс на чанк'.format(
+                  title,
+                  timed(args.repeat, chunk_body, dict_pairs, serializer),
+                  timed(args.repeat, chunk_body, text_pairs, serializer),
+                  timed(args.repeat, serializer.loads, response)))
+
+
+if __name__ == '__main__':
+    main()
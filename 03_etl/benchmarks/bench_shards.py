@@ -0,0 +1,79 @@
+"""Время полного прохода в зависимости от количества шардов:
+   один процесс против пула из 2, 4, ... процессов до числа ядер.
+   Документы отправляются в заглушку ElasticSearch с задержкой ответа.
+   Состояние в Redis перед каждым проходом сбрасывается и затем
+   восстанавливается.
+
+   python benchmarks/bench_shards.py --films 200000 --latency 0.02
+"""
+import argparse
+import datetime as dt
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..',
+                                'postgres_to_es'))
+
+import redis  # noqa: E402
+
+import config  # noqa: E402
+import etl  # noqa: E402
+import sharding  # noqa: E402
+from es_stub import serve  # noqa: E402
+from fixtures import drop_films, generate_films, pg_connect, pg_dsl  # noqa
+from state import STATES, StateStore  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--films', type=int, default=200000)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--port', type=int, default=9201)
+    parser.add_argument('--max-shards', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    server = serve(args.port, args.latency)
+    es_dsl = {'host': '127.0.0.1', 'port': args.port}
+    redis_dsl = {'host': os.environ.get('REDIS_HOST'),
+                 'port': os.environ.get('REDIS_PORT')}
+    r = redis.Redis(**redis_dsl)
+    saved = {key: r.get(key) for key in STATES + (StateStore.checkpoint_key,)}
+    # Фильмы создаются прямо перед замером, окно не должно отставать
+    config.COMMIT_LAG = 0
+    pg_conn = pg_connect()
+    generate_films(pg_conn, args.films)
+    try:
+        connections = etl.connect(pg_dsl(), es_dsl, redis_dsl)
+        shards = 1
+        single = None
+        while shards <= args.max_shards:
+            for state in STATES:
+                r.set(state, dt.datetime.min.isoformat())
+            r.delete(StateStore.checkpoint_key)
+            started = perf_counter()
+            if shards == 1:
+                etl.try_connect(connections)
+            else:
+                with sharding.make_pool(
+                        shards, pg_dsl(), es_dsl, redis_dsl) as pool:
+                    started = perf_counter()
+                    sharding.try_connect(connections, pool, shards)
+            elapsed = perf_counter() - started
+            single = single or elapsed
+            print('{0:>3} шардов: {1:.1f} с, ускорение {2:.2f}'.format(
+                shards, elapsed, single / elapsed))
+            shards *= 2
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                r.delete(key)
+            else:
+                r.set(key, value)
+        drop_films(pg_conn)
+        pg_conn.close()
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Замер пикового RSS и скорости чтения film_work
+   в потоковом (именованный курсор) и буферизованном режимах.
+
+   python benchmarks/bench_streaming.py --films 1000000
+"""
+import argparse
+import datetime as dt
+import os
+import resource
+import subprocess
+import sys
+from collections import deque
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..',
+                                'postgres_to_es'))
+
+import etl  # noqa: E402
+from fixtures import drop_films, generate_films, pg_connect  # noqa: E402
+from queries import make_query  # noqa: E402
+
+
+def run_pass() -> None:
+    """Один проход film_work, документы уходят в пустой приемник"""
+    etl.bulk_load = lambda es, actions: deque(actions, maxlen=0)
+    pg_conn = pg_connect()
+    started = perf_counter()
+    rows_count = 0
+    with pg_conn:
+        pg_cursor = etl.open_cursor(pg_conn, 'bench_film_work')
+        pg_cursor.execute(make_query("WHERE fw.updated_at > %s "),
+                          (dt.datetime.min,))
+        rows = etl.fetch_rows(pg_cursor, etl.config.FETCH_SIZE)
+        for films in etl.batcher.batches(rows):
+            etl.etl_part2(films, None)
+            rows_count += len(films)
+        pg_cursor.close()
+    elapsed = perf_counter() - started
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print('{0:>9}: {1} строк, {2:.1f} строк/с, пиковый RSS {3:.1f} МБ'.format(
+        'stream' if etl.config.STREAMING else 'buffered',
+        rows_count, rows_count / elapsed, peak_mb))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--films', type=int, default=1_000_000)
+    parser.add_argument('--keep', action='store_true',
+                        help='не удалять сгенерированные фильмы')
+    parser.add_argument('--run', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_pass()
+        return
+
+    pg_conn = pg_connect()
+    generate_films(pg_conn, args.films)
+    try:
+        # Каждый режим в отдельном процессе, чтобы ru_maxrss не смешивался
+        for streaming in ('1', '0'):
+            subprocess.run(
+                [sys.executable, __file__, '--run'], check=True,
+                env={**os.environ, 'ETL_STREAMING': streaming})
+    finally:
+        if not args.keep:
+            drop_films(pg_conn)
+        pg_conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""Процессорное время ETL на 10 тыс. документов от чтения строк
+   из БД до готового тела bulk-запроса: прежний путь (DictCursor,
+   массивы jsonb разбираются в Python, документ собирается словарем
+   и сериализуется) против документа, собранного в БД текстом JSON.
+   Читаются первые --docs фильмов каталога. С --profile печатает
+   самые затратные функции cProfile.
+
+   python benchmarks/bench_transform.py --docs 10000 --profile
+"""
+import argparse
+import cProfile
+import os
+import pstats
+import sys
+from time import process_time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..',
+                                'postgres_to_es'))
+
+import psycopg2  # noqa: E402
+from elasticsearch import helpers  # noqa: E402
+from elasticsearch.serializer import JSONSerializer  # noqa: E402
+from psycopg2.extras import DictCursor  # noqa: E402
+
+from documents import transform  # noqa: E402
+from fixtures import pg_dsl  # noqa: E402
+from loader import expand_action  # noqa: E402
+from queries import make_query  # noqa: E402
+
+# Запрос до переноса сборки документа в БД
+LEGACY_QUERY = (
+    "SELECT "
+    "fw.id, fw.rating, fw.title, fw.description, "
+    "ARRAY_AGG(DISTINCT g.name) AS genres, "
+    "ARRAY_AGG(DISTINCT p.full_name) "
+    "FILTER (WHERE pfw.role = 'actor') AS actors_names, "
+    "ARRAY_AGG(DISTINCT p.full_name) "
+    "FILTER (WHERE pfw.role = 'writer') AS writers_names, "
+    "ARRAY_AGG(DISTINCT p.full_name) "
+    "FILTER (WHERE pfw.role = 'director') AS directors, "
+    "ARRAY_AGG(DISTINCT jsonb_build_object('id', p.id, 'name', p.full_name)) "
+    "FILTER (WHERE pfw.role = 'actor') AS actors, "
+    "ARRAY_AGG(DISTINCT jsonb_build_object('id', p.id, 'name', p.full_name)) "
+    "FILTER (WHERE pfw.role = 'writer') AS writers "
+    "FROM content.film_work fw "
+    "LEFT JOIN content.person_film_work pfw ON pfw.film_work_id = fw.id "
+    "LEFT JOIN content.person p ON p.id = pfw.person_id "
+    "LEFT JOIN content.genre_film_work gfw ON gfw.film_work_id = fw.id "
+    "LEFT JOIN content.genre g ON g.id = gfw.genre_id "
+    "GROUP BY fw.id ORDER BY fw.id LIMIT %s")
+
+
+def legacy_transform(rows):
+    """Подготовка документов до переноса сборки в БД"""
+    for data in rows:
+        yield {
+            '_id': data['id'],
+            '_op_type': 'index',
+            '_index': 'movies',
+            'id': data['id'],
+            'imdb_rating': data['rating'],
+            'genre': data['genres'],
+            'title': data['title'],
+            'description': data['description'],
+            'director': data['directors'],
+            'actors_names': data['actors_names'],
+            'writers_names': data['writers_names'],
+            'actors': data['actors'],
+            'writers': data['writers']
+        }
+
+
+def bulk_body(actions, expand, serializer: JSONSerializer) -> int:
+    """Сериализация действий так же, как в helpers.bulk"""
+    size = 0
+    for action in actions:
+        meta, data = expand(action)
+        size += len(serializer.dumps(meta)) + len(serializer.dumps(data))
+    return size
+
+
+def run(query: str, limit: int, cursor_factory, make_actions,
+        expand) -> int:
+    pg_conn = psycopg2.connect(**pg_dsl(), cursor_factory=cursor_factory)
+    try:
+        with pg_conn.cursor() as pg_cursor:
+            pg_cursor.execute(query, (limit,))
+            rows = pg_cursor.fetchall()
+        return bulk_body(make_actions(rows), expand, JSONSerializer())
+    finally:
+        pg_conn.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--docs', type=int, default=10000)
+    parser.add_argument('--profile', action='store_true')
+    args = parser.parse_args()
+
+    paths = (
+        ('прежний', LEGACY_QUERY, DictCursor, legacy_transform,
+         helpers.expand_action),
+        ('JSON из БД', make_query('', 'ORDER BY fw.id LIMIT %s'), None,
+         transform, expand_action),
+    )
+    for title, query, cursor_factory, make_actions, expand in paths:
+        # Под профилировщиком время больше, но соотношение сохраняется
+        profile = cProfile.Profile()
+        started = process_time()
+        if args.profile:
+            profile.enable()
+        size = run(query, args.docs, cursor_factory, make_actions, expand)
+        if args.profile:
+            profile.disable()
+        elapsed = process_time() - started
+        print('{0:>10}: {1:.0f} мс CPU на 10 тыс. документов, '
+              'тело bulk {2:.1f} МБ'.format(
+                  title, elapsed * 1000 * 10000 / args.docs,
+                  size / 1024 / 1024))
+        if args.profile:
+            pstats.Stats(profile).sort_stats('cumulative').print_stats(12)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+"""Генератор каталога для замеров: фильмы, люди, жанры и связи между
+   ними в схеме content, от десятков тысяч до десятков миллионов фильмов.
+   Строки собираются на стороне БД через generate_series порциями
+   по --chunk фильмов; названия, описания и имена выбираются из словарей,
+   которые один раз готовит Faker. У каждого фильма 1-3 жанра, --actors
+   актеров, --writers сценаристов и --directors режиссеров; популярные
+   люди встречаются чаще остальных. Включенные триггеры outbox на время
+   генерации выключаются. Повторный запуск с тем же --seed дает те же id.
+
+   python benchmarks/catalogue.py generate --films 1000000
+   python benchmarks/catalogue.py drop
+"""
+import argparse
+from time import perf_counter
+
+from faker import Faker
+from psycopg2.extensions import connection as _connection
+
+from fixtures import FIXTURE_MARK, drop_films, pg_connect
+
+# Первые 8 символов id людей и жанров каталога: по ним каталог
+# удаляется диапазоном первичного ключа
+PERSON_PREFIX = 'be4c0000'
+GENRE_PREFIX = 'be4c0001'
+GENRES = ('Action', 'Adventure', 'Animation', 'Biography', 'Comedy',
+          'Crime', 'Documentary', 'Drama', 'Family', 'Fantasy', 'Film-Noir',
+          'History', 'Horror', 'Music', 'Musical', 'Mystery', 'News',
+          'Reality-TV', 'Romance', 'Sci-Fi', 'Short', 'Sport', 'Talk-Show',
+          'Thriller', 'War', 'Western')
+# Таблицы с триггерами outbox
+TABLES = ('film_work', 'genre', 'person', 'genre_film_work',
+          'person_film_work')
+
+
+def make_id(prefix: str, kind: str, number: str) -> str:
+    # id из md5 номера строки: одинаковый при повторной генерации
+    return ("({0} || substr(md5(%(seed)s || '{1}' || {2}), 9))::uuid"
+            .format(prefix, kind, number))
+
+
+def pick(words: str) -> str:
+    # Случайный элемент словаря: список psycopg2 подставляет как
+    # ARRAY[...], и индексировать его можно только в скобках
+    return ("({0}::text[])[1 + floor(random() * cardinality({0}))::int]"
+            .format(words))
+
+
+PERSONS_QUERY = (
+    "INSERT INTO content.person (id, full_name, created_at, updated_at) "
+    "SELECT {0}, {1} || ' ' || {2}, "
+    "now() - interval '2 years', now() - random() * interval '365 days' "
+    "FROM generate_series(1, %(persons)s) AS i "
+    "ON CONFLICT (id) DO NOTHING").format(
+        make_id('%(person_prefix)s', 'person', 'i'), pick('%(first)s'),
+        pick('%(last)s'))
+
+GENRES_QUERY = (
+    "INSERT INTO content.genre (id, name, description, created_at, "
+    "updated_at) "
+    "SELECT {0}, name, %(mark)s, now(), now() "
+    "FROM unnest(%(genres)s::text[]) WITH ORDINALITY AS g (name, i) "
+    "ON CONFLICT (id) DO NOTHING").format(
+        make_id('%(genre_prefix)s', 'genre', 'i'))
+
+# Название из 1-4 слов и описание из 2 предложений словарей;
+# updated_at разбросан по последнему году, как у живого каталога
+FILMS_QUERY = (
+    "INSERT INTO content.film_work (id, title, description, creation_date, "
+    "file_path, rating, type, created_at, updated_at) "
+    "SELECT md5(%(seed)s || 'film' || i)::uuid, "
+    "initcap(array_to_string(ARRAY("
+    "SELECT {0} FROM generate_series(1, 1 + (i %% 4))), ' ')), "
+    "{1} || ' ' || {1}, "
+    "'1950-01-01'::date + floor(random() * 27000)::int, %(mark)s, "
+    "round((random() * 100)::numeric, 1), "
+    "CASE WHEN random() < 0.2 THEN 'TV' ELSE 'MV' END, "
+    "now() - interval '2 years', now() - random() * interval '365 days' "
+    "FROM generate_series(%(start)s, %(end)s) AS i "
+    "ON CONFLICT (id) DO NOTHING").format(pick('%(words)s'),
+                                          pick('%(sentences)s'))
+
+GENRE_LINKS_QUERY = (
+    "INSERT INTO content.genre_film_work (id, film_work_id, genre_id, "
+    "created_at) "
+    "SELECT md5(%(seed)s || 'genre_film_work' || i || '-' || j)::uuid, "
+    "md5(%(seed)s || 'film' || i)::uuid, {0}, now() "
+    "FROM generate_series(%(start)s, %(end)s) AS i, "
+    "generate_series(1, 1 + i %% 3) AS j "
+    "ON CONFLICT DO NOTHING").format(
+        make_id('%(genre_prefix)s', 'genre',
+                '1 + floor(random() * %(genre_count)s)::int'))
+
+# Номер человека - квадрат случайного числа: первые номера
+# встречаются в фильмах намного чаще последних
+PERSON_LINKS_QUERY = (
+    "INSERT INTO content.person_film_work (id, film_work_id, person_id, "
+    "role, created_at) "
+    "SELECT md5(%(seed)s || 'person_film_work' || i || r.role || j)::uuid, "
+    "md5(%(seed)s || 'film' || i)::uuid, {0}, r.role, now() "
+    "FROM generate_series(%(start)s, %(end)s) AS i, "
+    "(VALUES ('actor', %(actors)s), ('writer', %(writers)s), "
+    "('director', %(directors)s)) AS r (role, n), "
+    "generate_series(1, r.n) AS j "
+    "ON CONFLICT DO NOTHING").format(
+        make_id('%(person_prefix)s', 'person',
+                '1 + floor(random() ^ 2 * %(persons)s)::int'))
+
+
+def make_vocabulary(seed: int) -> dict:
+    """Словари для названий, описаний и имен"""
+    fake = Faker()
+    Faker.seed(seed)
+    return {
+        'words': sorted({fake.word() for _ in range(5000)}),
+        'sentences': [fake.sentence(nb_words=12) for _ in range(2000)],
+        'first': sorted({fake.first_name() for _ in range(3000)}),
+        'last': sorted({fake.last_name() for _ in range(3000)}),
+    }
+
+
+def enabled_triggers(pg_conn: _connection) -> list:
+    """Включенные триггеры таблиц каталога: (таблица, триггер)"""
+    with pg_conn.cursor() as pg_cursor:
+        pg_cursor.execute(
+            "SELECT c.relname, t.tgname FROM pg_trigger t "
+            "JOIN pg_class c ON c.oid = t.tgrelid "
+            "JOIN pg_namespace n ON n.oid = c.relnamespace "
+            "WHERE n.nspname = 'content' AND c.relname = ANY(%s) "
+            "AND NOT t.tgisinternal AND t.tgenabled <> 'D'", (list(TABLES),))
+        triggers = [tuple(row) for row in pg_cursor.fetchall()]
+    pg_conn.commit()
+    return triggers
+
+
+def set_triggers(pg_conn: _connection, triggers: list,
+                 enabled: bool) -> None:
+    """Триггеры outbox: при генерации каждая строка попала бы в outbox.
+       После генерации включаются только те, что были включены до нее:
+       в режиме опроса триггеры outbox выключены"""
+    with pg_conn.cursor() as pg_cursor:
+        for table, trigger in triggers:
+            pg_cursor.execute('ALTER TABLE content.{0} {1} TRIGGER {2}'
+                              .format(table,
+                                      'ENABLE' if enabled else 'DISABLE',
+                                      trigger))
+    pg_conn.commit()
+
+
+def generate(pg_conn: _connection, films: int, persons: int, genres: int,
+             actors: int, writers: int, directors: int, chunk: int,
+             seed: int) -> None:
+    genre_names = list(GENRES[:genres]) + [
+        'Genre {0}'.format(number) for number in range(len(GENRES), genres)]
+    params = {
+        'seed': str(seed), 'mark': FIXTURE_MARK,
+        'person_prefix': PERSON_PREFIX, 'genre_prefix': GENRE_PREFIX,
+        'persons': persons, 'genres': genre_names, 'genre_count': genres,
+        'actors': actors, 'writers': writers, 'directors': directors,
+        **make_vocabulary(seed)}
+    triggers = enabled_triggers(pg_conn)
+    set_triggers(pg_conn, triggers, False)
+    try:
+        with pg_conn.cursor() as pg_cursor:
+            pg_cursor.execute('SELECT setseed(%s)', (seed % 1000 / 1000,))
+            pg_cursor.execute(PERSONS_QUERY, params)
+            pg_cursor.execute(GENRES_QUERY, params)
+        pg_conn.commit()
+        print('Людей: {0}, жанров: {1}'.format(persons, genres))
+
+        started = perf_counter()
+        for start in range(1, films + 1, chunk):
+            end = min(films, start + chunk - 1)
+            with pg_conn.cursor() as pg_cursor:
+                for query in (FILMS_QUERY, GENRE_LINKS_QUERY,
+                              PERSON_LINKS_QUERY):
+                    pg_cursor.execute(
+                        query, {**params, 'start': start, 'end': end})
+            pg_conn.commit()
+            print('Фильмов: {0} из {1}, {2:.0f} фильмов/с'.format(
+                end, films, end / (perf_counter() - started)))
+    finally:
+        pg_conn.rollback()
+        set_triggers(pg_conn, triggers, True)
+    with pg_conn.cursor() as pg_cursor:
+        pg_cursor.execute('ANALYZE content.film_work, content.person, '
+                          'content.genre, content.genre_film_work, '
+                          'content.person_film_work')
+    pg_conn.commit()
+
+
+def drop(pg_conn: _connection) -> None:
+    """Удаление каталога: фильмы с их связями, затем люди и жанры"""
+    drop_films(pg_conn)
+    with pg_conn.cursor() as pg_cursor:
+        for table, column, prefix in (
+                ('person_film_work', 'person_id', PERSON_PREFIX),
+                ('genre_film_work', 'genre_id', GENRE_PREFIX),
+                ('person', 'id', PERSON_PREFIX),
+                ('genre', 'id', GENRE_PREFIX)):
+            pg_cursor.execute(
+                'DELETE FROM content.{0} WHERE {1} BETWEEN %s AND %s'.format(
+                    table, column),
+                (prefix + '-0000-0000-0000-000000000000',
+                 prefix + '-ffff-ffff-ffff-ffffffffffff'))
+    pg_conn.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=('generate', 'drop'))
+    parser.add_argument('--films', type=int, default=100000)
+    parser.add_argument('--persons', type=int,
+                        help='по умолчанию - половина количества фильмов')
+    parser.add_argument('--genres', type=int, default=len(GENRES))
+    parser.add_argument('--actors', type=int, default=5)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--directors', type=int, default=1)
+    parser.add_argument('--chunk', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    pg_conn = pg_connect()
+    try:
+        if args.command == 'drop':
+            drop(pg_conn)
+            return
+        generate(pg_conn, args.films, args.persons or max(1, args.films // 2),
+                 args.genres, args.actors, args.writers, args.directors,
+                 args.chunk, args.seed)
+    finally:
+        pg_conn.close()
+
+
+if __name__ == '__main__':
+    main()
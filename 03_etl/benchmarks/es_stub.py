@@ -0,0 +1,109 @@
+"""Заглушка ElasticSearch для замеров: принимает /_bulk,
+   отвечает успехом по каждому документу после заданной задержки.
+   С --reject-rate доля bulk-запросов получает 429 по всем документам,
+   как узел с переполненной очередью записи; документы из poison
+   всегда отклоняются ошибкой 400.
+
+   python benchmarks/es_stub.py --port 9201 --latency 0.05 --reject-rate 0.2
+"""
+import argparse
+import json
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import sleep, time
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    latency = 0.0
+    reject_rate = 0.0
+    poison = frozenset()
+    track = False
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status: int, body: dict) -> None:
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        self.send_json(200, {'version': {'number': '7.7.0'}})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length).decode('utf-8')
+        if not self.path.split('?')[0].endswith('/_bulk'):
+            self.send_json(200, {'acknowledged': True})
+            return
+        sleep(self.latency)
+        overloaded = random.random() < self.reject_rate
+        items = []
+        rejected = 0
+        lines = iter(line for line in body.split('\n') if line)
+        for line in lines:
+            op_type, meta = next(iter(json.loads(line).items()))
+            if op_type != 'delete':
+                next(lines, None)
+            result = {'_id': meta.get('_id'), 'status': 200}
+            if overloaded:
+                result.update(status=429, error={
+                    'type': 'es_rejected_execution_exception'})
+            elif meta.get('_id') in self.poison:
+                result.update(status=400, error={
+                    'type': 'mapper_parsing_exception'})
+            rejected += result['status'] != 200
+            items.append({op_type: result})
+        with self.server.lock:
+            self.server.documents += len(items)
+            self.server.rejected += rejected
+            if self.track:
+                received = time()
+                for item in items:
+                    result = next(iter(item.values()))
+                    if result['status'] == 200:
+                        self.server.seen[result['_id']] = received
+        self.send_json(200, {'took': 1, 'errors': bool(rejected),
+                             'items': items})
+
+    do_PUT = do_POST
+
+
+def serve(port: int, latency: float, reject_rate: float = 0.0,
+          poison: frozenset = frozenset(),
+          track: bool = False) -> ThreadingHTTPServer:
+    """Запуск заглушки в фоновом потоке. С track для каждого id
+       запоминается время последней успешной загрузки"""
+    handler = type('Handler', (StubHandler,), {
+        'latency': latency, 'reject_rate': reject_rate, 'poison': poison,
+        'track': track})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    # Количество полученных и отклоненных документов, для замеров
+    server.documents = 0
+    server.rejected = 0
+    server.seen = {}
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=9201)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--reject-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    server = serve(args.port, args.latency, args.reject_rate)
+    threading.Event().wait()
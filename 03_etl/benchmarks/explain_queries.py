@@ -0,0 +1,67 @@
+"""Планы запросов ETL до и после индексов из миграции
+   0008_etl_scan_indexes. План "до" строится в транзакции, где индексы
+   удалены, после чего транзакция откатывается.
+
+   python benchmarks/explain_queries.py --since-minutes 60
+"""
+import argparse
+import datetime as dt
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..',
+                                'postgres_to_es'))
+
+from fixtures import pg_connect  # noqa: E402
+from queries import (DELTA_PARAMS, make_delta_query, make_prequery,  # noqa
+                     make_query)
+
+INDEXES = (
+    'film_work_updated_at_idx',
+    'genre_updated_at_idx',
+    'person_updated_at_idx',
+    'genre_film_work_genre_idx',
+    'person_film_work_person_idx',
+)
+
+
+def explain(pg_cursor, title: str, query: str, params: dict) -> None:
+    pg_cursor.execute('EXPLAIN (ANALYZE, BUFFERS) ' + query, params)
+    print('--- {0}'.format(title))
+    print('\n'.join(row[0] for row in pg_cursor.fetchall()))
+
+
+def explain_all(pg_cursor, params: dict) -> None:
+    for table in ('film_work', 'genre', 'person'):
+        explain(pg_cursor, 'make_prequery({0})'.format(table),
+                make_prequery(table, DELTA_PARAMS[table]), params)
+    explain(pg_cursor, 'make_query по make_delta_query', make_query(
+        "WHERE fw.id IN ({0}) ".format(make_delta_query(DELTA_PARAMS)),
+        "ORDER BY fw.id"), params)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--since-minutes', type=int, default=60)
+    args = parser.parse_args()
+
+    since = dt.datetime.utcnow() - dt.timedelta(minutes=args.since_minutes)
+    params = {'film_work': since, 'genre': since, 'person': since,
+              'upper': dt.datetime.utcnow()}
+    pg_conn = pg_connect()
+    with pg_conn.cursor() as pg_cursor:
+        print('======== без индексов')
+        for index in INDEXES:
+            pg_cursor.execute(
+                'DROP INDEX IF EXISTS content.{0}'.format(index))
+        explain_all(pg_cursor, params)
+        pg_conn.rollback()
+
+        print('======== с индексами')
+        explain_all(pg_cursor, params)
+        pg_conn.rollback()
+    pg_conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+import os
+
+import psycopg2
+from psycopg2.extensions import connection as _connection
+from psycopg2.extras import DictCursor
+
+# Метка, по которой отличаются сгенерированные для замеров фильмы
+FIXTURE_MARK = 'benchmark'
+
+
+def pg_dsl() -> dict:
+    """Параметры БД из тех же переменных окружения, что и у ETL"""
+    return {
+        'dbname': os.environ.get('POSTGRES_DB'),
+        'user': os.environ.get('POSTGRES_USER'),
+        'password': os.environ.get('POSTGRES_PASSWORD'),
+        'host': os.environ.get('DB_HOST', '127.0.0.1'),
+        'port': os.environ.get('DB_PORT', 5432)
+    }
+
+
+def pg_connect() -> _connection:
+    return psycopg2.connect(**pg_dsl(), cursor_factory=DictCursor)
+
+
+def generate_films(pg_conn: _connection, count: int) -> None:
+    """Генерация count фильмов на стороне БД через generate_series"""
+    with pg_conn.cursor() as pg_cursor:
+        pg_cursor.execute(
+            "INSERT INTO content.film_work "
+            "(id, title, description, creation_date, file_path, rating, "
+            "type, created_at, updated_at) "
+            "SELECT md5(%(mark)s || i)::uuid, "
+            "'Film ' || i, repeat('description ', 20), "
+            "'2000-01-01'::date + (i %% 7000), %(mark)s, "
+            "round((random() * 100)::numeric, 1), 'MV', now(), now() "
+            "FROM generate_series(1, %(count)s) AS i "
+            "ON CONFLICT (id) DO NOTHING",
+            {'mark': FIXTURE_MARK, 'count': count})
+    pg_conn.commit()
+
+
+def drop_films(pg_conn: _connection) -> None:
+    """Удаление сгенерированных фильмов вместе с их связями"""
+    with pg_conn.cursor() as pg_cursor:
+        for table in ('genre_film_work', 'person_film_work'):
+            pg_cursor.execute(
+                "DELETE FROM content.{0} WHERE film_work_id IN ("
+                "SELECT id FROM content.film_work WHERE file_path = %s)"
+                .format(table), (FIXTURE_MARK,))
+        pg_cursor.execute(
+            "DELETE FROM content.film_work WHERE file_path = %s",
+            (FIXTURE_MARK,))
+    pg_conn.commit()
@@ -0,0 +1,220 @@
+"""Набор замеров ETL на каталоге, сгенерированном catalogue.py,
+   с заглушкой вместо ElasticSearch. Сценарии:
+   full - полный проход etl_part1 от пустого состояния;
+   delta - проход etl_part1 после изменения --touch людей и фильмов;
+   load - только etl_part2 (подготовка и загрузка) на --docs строках,
+   заранее прочитанных из БД.
+   Для каждого сценария печатает фильмов в секунду, пиковый RSS,
+   количество запросов к Postgres и fetch серверного курсора
+   и время этапов (среднее и 95-й перцентиль по гистограммам
+   etl_stage_seconds). Каждый сценарий идет в отдельном процессе,
+   чтобы ru_maxrss не смешивался. С --json результаты пишутся в файл,
+   с --baseline сравниваются с прошлым файлом: ухудшение больше
+   --tolerance печатается как регрессия, и скрипт завершается с кодом 1.
+
+   python benchmarks/catalogue.py generate --films 100000
+   python benchmarks/harness.py --json baseline.json
+   python benchmarks/harness.py --baseline baseline.json
+"""
+import argparse
+import datetime as dt
+import json
+import os
+import resource
+import subprocess
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..',
+                                'postgres_to_es'))
+
+import redis  # noqa: E402
+
+import config  # noqa: E402
+import etl  # noqa: E402
+import metrics  # noqa: E402
+from es_stub import serve  # noqa: E402
+from fixtures import pg_dsl  # noqa: E402
+from queries import make_query  # noqa: E402
+from state import STATES, StateStore  # noqa: E402
+
+SCENARIOS = ('full', 'delta', 'load')
+STAGES = ('extract', 'transform', 'load', 'update')
+# Показатели, которые сравниваются с прошлым запуском:
+# имя и True, если больше - лучше
+COMPARED = (('films_per_sec', True), ('peak_rss_mb', False),
+            ('queries', False), ('fetches', False))
+
+
+def touch(pg_conn, count: int) -> None:
+    """Изменение count случайных людей и count случайных фильмов"""
+    with pg_conn.cursor() as pg_cursor:
+        for table in ('person', 'film_work'):
+            pg_cursor.execute(
+                'UPDATE content.{0} SET updated_at = now() WHERE id IN ('
+                'SELECT id FROM content.{0} ORDER BY random() LIMIT %s)'
+                .format(table), (count,))
+    pg_conn.commit()
+
+
+def run_scenario(scenario: str, args: argparse.Namespace) -> dict:
+    es_dsl = {'host': '127.0.0.1', 'port': args.port}
+    redis_dsl = {'host': os.environ.get('REDIS_HOST'),
+                 'port': os.environ.get('REDIS_PORT')}
+    server = serve(args.port, args.latency)
+    connections = etl.connect(pg_dsl(), es_dsl, redis_dsl)
+    state = connections.state
+    r = connections.redis
+    r.delete(StateStore.checkpoint_key)
+    start = (dt.datetime.min if scenario == 'full'
+             else dt.datetime.utcnow())
+    for table in STATES:
+        r.set(table, start.isoformat())
+
+    with connections.postgres() as pg_conn:
+        if scenario == 'delta':
+            touch(pg_conn, args.touch)
+        rows = None
+        if scenario == 'load':
+            with pg_conn.cursor() as pg_cursor:
+                pg_cursor.execute(make_query('', 'ORDER BY fw.id LIMIT %s'),
+                                  (args.docs,))
+                rows = pg_cursor.fetchall()
+            pg_conn.commit()
+        metrics.reset()
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        started = perf_counter()
+        if rows is None:
+            with pg_conn:
+                etl.etl_part1(pg_conn, connections.es, state,
+                              connections.fingerprints)
+        else:
+            etl.load_batches(rows, connections.es, connections.fingerprints)
+        elapsed = perf_counter() - started
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    films = sum(metrics.counter('etl_documents_total', op=op).value
+                for op in ('index', 'update'))
+    result = {
+        'scenario': scenario,
+        'films': films,
+        'seconds': elapsed,
+        'films_per_sec': films / elapsed if elapsed else 0.0,
+        'peak_rss_mb': peak_rss / 1024,
+        'rss_growth_mb': (peak_rss - rss_before) / 1024,
+        'queries': metrics.counter('pg_queries_total').value,
+        'fetches': metrics.histogram('etl_stage_seconds',
+                                     stage='extract').count,
+        'bulk_documents': server.documents,
+    }
+    for stage in STAGES:
+        histogram = metrics.histogram('etl_stage_seconds', stage=stage)
+        result[stage + '_count'] = histogram.count
+        result[stage + '_mean_ms'] = (
+            histogram.sum / histogram.count * 1000 if histogram.count
+            else 0.0)
+        result[stage + '_p95_ms'] = histogram.quantile(0.95) * 1000
+    connections.close()
+    server.shutdown()
+    return result
+
+
+def print_results(results: list) -> None:
+    for result in results:
+        print('{scenario:>6}: {films} фильмов за {seconds:.1f} с, '
+              '{films_per_sec:.0f} фильмов/с, пиковый RSS '
+              '{peak_rss_mb:.0f} МБ (+{rss_growth_mb:.0f}), запросов '
+              '{queries}, fetch {fetches}'.format(**result))
+        for stage in STAGES:
+            if result[stage + '_count']:
+                print('{0:>16}: {1} раз, среднее {2:.1f} мс, '
+                      '95% {3:.1f} мс'.format(
+                          stage, result[stage + '_count'],
+                          result[stage + '_mean_ms'],
+                          result[stage + '_p95_ms']))
+
+
+def compare(results: list, baseline: list, tolerance: float) -> bool:
+    """Сравнение с прошлым запуском. Возвращает True, если есть регрессия"""
+    previous = {result['scenario']: result for result in baseline}
+    regression = False
+    for result in results:
+        before = previous.get(result['scenario'])
+        if before is None:
+            continue
+        names = list(COMPARED) + [
+            (stage + '_p95_ms', False) for stage in STAGES]
+        for name, higher_is_better in names:
+            if not before.get(name):
+                continue
+            change = (result[name] - before[name]) / before[name]
+            worse = -change if higher_is_better else change
+            mark = ''
+            if worse > tolerance:
+                mark = '  <- регрессия'
+                regression = True
+            print('{0:>6} {1:>18}: {2:.1f} -> {3:.1f} ({4:+.0%}){5}'.format(
+                result['scenario'], name, before[name], result[name],
+                change, mark))
+    return regression
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--touch', type=int, default=1000,
+                        help='сколько людей и фильмов меняет delta')
+    parser.add_argument('--docs', type=int, default=100000,
+                        help='сколько строк загружает load')
+    parser.add_argument('--latency', type=float, default=0.01)
+    parser.add_argument('--port', type=int, default=9201)
+    parser.add_argument('--json', help='файл для результатов')
+    parser.add_argument('--baseline', help='результаты прошлого запуска')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    parser.add_argument('--run', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run_scenario(args.run, args)))
+        return
+
+    r = redis.Redis(host=os.environ.get('REDIS_HOST'),
+                    port=os.environ.get('REDIS_PORT'))
+    keys = STATES + (StateStore.checkpoint_key,)
+    saved = {key: r.get(key) for key in keys}
+    results = []
+    try:
+        for scenario in args.scenarios.split(','):
+            # Изменения delta сделаны прямо перед проходом, окно
+            # не должно отставать от них
+            output = subprocess.run(
+                [sys.executable, __file__, '--run', scenario,
+                 '--touch', str(args.touch), '--docs', str(args.docs),
+                 '--latency', str(args.latency), '--port', str(args.port)],
+                check=True, stdout=subprocess.PIPE,
+                env={**os.environ, 'ETL_COMMIT_LAG': '0'}).stdout
+            results.append(json.loads(output.splitlines()[-1]))
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                r.delete(key)
+            else:
+                r.set(key, value)
+
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w') as results_file:
+            json.dump({'config': {
+                'bulk_engine': config.BULK_ENGINE,
+                'fetch_size': config.FETCH_SIZE,
+                'streaming': config.STREAMING,
+                'partial_updates': config.PARTIAL_UPDATES,
+            }, 'results': results}, results_file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+        if compare(results, baseline, args.tolerance):
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
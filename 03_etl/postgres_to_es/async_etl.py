@@ -0,0 +1,288 @@
+import asyncio
+import datetime as dt
+import logging
+from time import perf_counter
+from typing import AsyncIterator, NamedTuple, Optional
+
+import asyncpg
+from elasticsearch import AsyncElasticsearch
+from elasticsearch.helpers import async_bulk
+from redis import asyncio as aioredis
+
+import config
+import metrics
+import retries
+from batching import AdaptiveBatcher
+from dead_letters import DEAD_LETTERS_KEY, entries
+from documents import transform
+from loader import expand_action
+from queries import make_delta_query, make_latest_query, make_query
+from scheduler import AdaptiveScheduler
+from serializer import make_serializer
+from state import STATES, Checkpoint, StateStore
+
+# Этап контрольной точки асинхронного прохода: фильмы выгружаются
+# целиком одним запросом. Точку другого этапа, оставшуюся
+# от синхронного прохода, асинхронный проход начинает заново в том же
+# окне, а синхронный так же поступает с точкой этого этапа
+PHASE = 'async'
+# Временные ошибки asyncpg, вдобавок к общим из retries
+TRANSIENT_ERRORS = (asyncpg.PostgresConnectionError, asyncpg.InterfaceError,
+                    asyncio.TimeoutError)
+
+
+def permanent(error: BaseException) -> bool:
+    return not (isinstance(error, TRANSIENT_ERRORS)
+                or retries.is_transient(error))
+
+
+class PassDone(NamedTuple):
+    """Маркер в очереди: все пачки прохода уже в очереди,
+       после их загрузки можно сохранять состояние"""
+    checkpoint: Checkpoint
+
+
+class Batch(NamedTuple):
+    """Подготовленная пачка и id последнего фильма в ней"""
+    actions: list
+    last_id: str
+
+
+async def read_states(r: aioredis.Redis) -> dict:
+    """Состояние последнего обновления по каждой таблице, как
+       StateStore.watermarks: в UTC без часового пояса"""
+    states = {}
+    for state in STATES:
+        value = await r.get(state)
+        states[state] = (dt.datetime.fromisoformat(value.decode('utf-8'))
+                         if value else dt.datetime.min)
+    return states
+
+
+def as_utc(date: dt.datetime) -> dt.datetime:
+    # asyncpg сравнивает с timestamptz только datetime с часовым поясом,
+    # состояние и контрольная точка хранят время в UTC без пояса
+    return date.replace(tzinfo=dt.timezone.utc)
+
+
+async def begin_pass(r: aioredis.Redis) -> Checkpoint:
+    """Контрольная точка прохода, как StateStore.begin: прерванный проход
+       продолжается в своем окне после последнего загруженного фильма"""
+    value = await r.get(StateStore.checkpoint_key)
+    checkpoint = Checkpoint.loads(value) if value else None
+    if checkpoint is not None and checkpoint.phase == PHASE:
+        logging.info('Продолжение прохода после %s', checkpoint.last_id)
+        return checkpoint
+    if checkpoint is None:
+        lower = await read_states(r)
+        upper = (dt.datetime.utcnow()
+                 - dt.timedelta(seconds=config.COMMIT_LAG))
+    else:
+        lower, upper = checkpoint.lower, checkpoint.upper
+    checkpoint = Checkpoint(lower, upper, phase=PHASE)
+    await r.set(StateStore.checkpoint_key, checkpoint.dumps())
+    return checkpoint
+
+
+async def advance(r: aioredis.Redis, checkpoint: Checkpoint,
+                  last_id: str) -> None:
+    """Фиксация загруженной пачки"""
+    checkpoint.last_id = str(last_id)
+    await r.set(StateStore.checkpoint_key, checkpoint.dumps())
+
+
+async def commit(r: aioredis.Redis, checkpoint: Checkpoint) -> None:
+    """Завершение прохода, как StateStore.commit"""
+    async with r.pipeline() as pipe:
+        for state in STATES:
+            pipe.set(state, checkpoint.upper.isoformat())
+        pipe.delete(StateStore.checkpoint_key)
+        await pipe.execute()
+
+
+async def fetch_rows(
+        conn: asyncpg.Connection, query: str, *args) -> AsyncIterator:
+    """Построчная выдача результата запроса через серверный курсор.
+       asyncpg сам готовит запрос на сервере и кэширует его план"""
+    async with conn.transaction():
+        cursor = await conn.cursor(query, *args)
+        while True:
+            rows = await cursor.fetch(config.FETCH_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                yield row
+
+
+async def extract(pool: asyncpg.Pool, checkpoint: Checkpoint,
+                  batcher: AdaptiveBatcher, queue: asyncio.Queue) -> None:
+    """Чтение обновленных фильмов окна контрольной точки после ее
+       последнего id пачками в очередь"""
+    async with pool.acquire() as conn:
+        params = {state: '${0}'.format(number)
+                  for number, state in enumerate(STATES, start=1)}
+        params['upper'] = '${0}'.format(len(STATES) + 1)
+        bounds = [checkpoint.lower[state] for state in STATES]
+        bounds.append(checkpoint.upper)
+        rows = fetch_rows(conn, make_query(
+            "WHERE fw.id IN ({0}) AND fw.id > ${1} ".format(
+                make_delta_query(params), len(STATES) + 2),
+            "ORDER BY fw.id"),
+            *(as_utc(date) for date in bounds), checkpoint.last_id)
+        async for films in batcher.abatches(rows):
+            await queue.put(films)
+        await queue.put(PassDone(checkpoint))
+    await queue.put(None)
+
+
+async def transform_stage(
+        raw_queue: asyncio.Queue, doc_queue: asyncio.Queue) -> None:
+    """Подготовка объектов для ElasticSearch из пачек строк"""
+    while True:
+        item = await raw_queue.get()
+        if item is None or isinstance(item, PassDone):
+            await doc_queue.put(item)
+            if item is None:
+                break
+            continue
+        await doc_queue.put(Batch(list(transform(item)), item[-1][0]))
+
+
+async def send_actions(es: AsyncElasticsearch, actions: list) -> list:
+    """Одна отправка действий; ответы по неудачным документам"""
+    _, errors = await async_bulk(es, actions,
+                                 chunk_size=config.BULK_CHUNK_SIZE,
+                                 max_chunk_bytes=config.BATCH_MAX_BYTES,
+                                 expand_action_callback=expand_action,
+                                 raise_on_error=False,
+                                 raise_on_exception=False)
+    return errors
+
+
+async def send_batch(es: AsyncElasticsearch, r: aioredis.Redis,
+                     actions: list) -> int:
+    """Отправка пачки с повтором документов, отклоненных временной
+       ошибкой; отклоненные постоянной ошибкой уходят в хранилище
+       отклоненных. Если временные ошибки не прошли, поднимается
+       BulkIndexError, и контрольная точка не сдвигается.
+       Возвращает количество незагруженных документов"""
+    failed = await retries.aretry_items(
+        lambda pending: send_actions(es, pending), actions)
+    for item in failed:
+        logging.error('Документ не загружен в ElasticSearch: %s', item)
+    if failed:
+        metrics.counter('etl_documents_failed_total').inc(len(failed))
+        metrics.counter('etl_dead_letters_total').inc(len(failed))
+        await r.hset(DEAD_LETTERS_KEY, mapping=entries(failed))
+    return len(failed)
+
+
+async def load(es: AsyncElasticsearch, r: aioredis.Redis,
+               checkpoint: Checkpoint, batcher: AdaptiveBatcher,
+               queue: asyncio.Queue) -> None:
+    """Отправка пачек в ElasticSearch; после каждой пачки сдвигается
+       контрольная точка, после прохода сохраняется состояние"""
+    while True:
+        item = await queue.get()
+        if item is None:
+            break
+        if isinstance(item, PassDone):
+            await commit(r, item.checkpoint)
+            continue
+        started = perf_counter()
+        failed = await send_batch(es, r, item.actions)
+        elapsed = perf_counter() - started
+        batcher.record(len(item.actions), elapsed)
+        metrics.histogram('etl_stage_seconds', stage='load').observe(elapsed)
+        metrics.counter('etl_documents_total', op='index').inc(
+            len(item.actions) - failed)
+        await advance(r, checkpoint, item.last_id)
+
+
+@retries.retry(max_time=None, giveup=permanent)
+async def run_cycle(pool: asyncpg.Pool, es: AsyncElasticsearch,
+                    r: aioredis.Redis, batcher: AdaptiveBatcher) -> None:
+    """Один проход ETL: чтение из БД, подготовка и загрузка идут
+       одновременно и связаны очередями ограниченной длины"""
+    logging.info('Начало etl')
+    checkpoint = await begin_pass(r)
+    raw_queue = asyncio.Queue(maxsize=config.ASYNC_QUEUE_SIZE)
+    doc_queue = asyncio.Queue(maxsize=config.ASYNC_QUEUE_SIZE)
+    tasks = [
+        asyncio.create_task(extract(pool, checkpoint, batcher, raw_queue)),
+        asyncio.create_task(transform_stage(raw_queue, doc_queue)),
+        asyncio.create_task(load(es, r, checkpoint, batcher, doc_queue)),
+    ]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+@retries.retry(max_time=None, giveup=permanent)
+async def connect(dsl: dict) -> asyncpg.Pool:
+    """Подключение к PostgreSQL"""
+    pool = await asyncpg.create_pool(
+        database=dsl['dbname'], user=dsl['user'], password=dsl['password'],
+        host=dsl['host'], port=dsl['port'],
+        min_size=1, max_size=1)
+    logging.info('Подключение к БД выполнено')
+    return pool
+
+
+@retries.retry(max_time=None, giveup=permanent)
+async def probe(pool: asyncpg.Pool, r: aioredis.Redis) -> Optional[float]:
+    """Проверка изменений перед проходом, как etl.probe"""
+    if await r.exists(StateStore.checkpoint_key):
+        return float('inf')
+    states = await read_states(r)
+    async with pool.acquire() as conn:
+        row = await conn.fetchrow(make_latest_query(STATES))
+    # Время изменений приводится к состоянию: UTC без часового пояса
+    latest = {table: row[table].astimezone(dt.timezone.utc).replace(
+        tzinfo=None) for table in STATES if row[table] is not None}
+    pending = [states[table] for table in STATES
+               if table in latest and latest[table] > states[table]]
+    if not pending:
+        return None
+    return (dt.datetime.utcnow() - min(pending)).total_seconds()
+
+
+async def run_guarded(pool: asyncpg.Pool, es: AsyncElasticsearch,
+                      r: aioredis.Redis, batcher: AdaptiveBatcher) -> bool:
+    """Проход из бесконечного цикла, как etl.run_guarded: следующий
+       проход начнется заново в окне от сохраненного состояния"""
+    try:
+        await run_cycle(pool, es, r, batcher)
+    except Exception:
+        metrics.counter('etl_pass_failures_total').inc()
+        logging.exception('Проход прерван ошибкой, которая не повторяется')
+        return False
+    return True
+
+
+async def main(dsl: dict, es_dsl: dict, redis_dsl: dict) -> None:
+    """Асинхронный цикл ETL, соединения живут между проходами"""
+    pool = await connect(dsl)
+    es = AsyncElasticsearch([es_dsl], maxsize=config.ES_MAXSIZE,
+                            serializer=make_serializer())
+    r = aioredis.Redis(**redis_dsl)
+    batcher = AdaptiveBatcher.from_config()
+    scheduler = AdaptiveScheduler.from_config()
+    try:
+        while True:
+            if config.SCHEDULER == 'fixed':
+                await run_guarded(pool, es, r, batcher)
+                await asyncio.sleep(config.POLL_INTERVAL)
+                continue
+            staleness = await probe(pool, r)
+            ran = scheduler.should_run(staleness)
+            if ran and not await run_guarded(pool, es, r, batcher):
+                await asyncio.sleep(scheduler.failed())
+                continue
+            await asyncio.sleep(scheduler.delay(staleness, ran))
+    finally:
+        await pool.close()
+        await es.close()
+        await r.close()
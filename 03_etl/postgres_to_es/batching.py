@@ -0,0 +1,79 @@
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator
+
+import config
+import metrics
+
+
+def row_size(row) -> int:
+    """Оценка объема строки по длине ее полей: основное в строке -
+       документ, который уже пришел из БД текстом JSON"""
+    return sum(len(value) if isinstance(value, str) else len(str(value))
+               for value in row)
+
+
+class AdaptiveBatcher:
+    """Нарезка потока строк на пачки для ElasticSearch.
+       Пачка ограничена количеством документов и объемом данных,
+       а количество документов подстраивается под время ответа bulk:
+       быстрые ответы увеличивают пачку, медленные - уменьшают"""
+
+    def __init__(self, min_docs: int, max_docs: int, max_bytes: int,
+                 target_latency: float) -> None:
+        self.min_docs = min_docs
+        self.max_docs = max_docs
+        self.max_bytes = max_bytes
+        self.target_latency = target_latency
+        self.docs = min_docs
+
+    @classmethod
+    def from_config(cls) -> 'AdaptiveBatcher':
+        return cls(min_docs=config.BATCH_MIN_DOCS,
+                   max_docs=config.BATCH_MAX_DOCS,
+                   max_bytes=config.BATCH_MAX_BYTES,
+                   target_latency=config.BATCH_TARGET_LATENCY)
+
+    def batches(self, rows: Iterable) -> Iterator[tuple]:
+        batch = []
+        batch_bytes = 0
+        for row in rows:
+            batch.append(row)
+            batch_bytes += row_size(row)
+            if self.is_full(len(batch), batch_bytes):
+                self.count_bytes(batch_bytes)
+                yield tuple(batch)
+                batch = []
+                batch_bytes = 0
+        if batch:
+            self.count_bytes(batch_bytes)
+            yield tuple(batch)
+
+    async def abatches(self, rows: AsyncIterable) -> AsyncIterator[tuple]:
+        """То же, что batches, для асинхронного потока строк"""
+        batch = []
+        batch_bytes = 0
+        async for row in rows:
+            batch.append(row)
+            batch_bytes += row_size(row)
+            if self.is_full(len(batch), batch_bytes):
+                self.count_bytes(batch_bytes)
+                yield tuple(batch)
+                batch = []
+                batch_bytes = 0
+        if batch:
+            self.count_bytes(batch_bytes)
+            yield tuple(batch)
+
+    @staticmethod
+    def count_bytes(batch_bytes: int) -> None:
+        # Объем пачек по оценке row_size
+        metrics.counter('etl_bytes_total').inc(batch_bytes)
+
+    def is_full(self, docs: int, batch_bytes: int) -> bool:
+        return docs >= self.docs or batch_bytes >= self.max_bytes
+
+    def record(self, docs: int, elapsed: float) -> None:
+        """Учет времени отправки пачки из docs документов"""
+        if elapsed > self.target_latency:
+            self.docs = max(self.min_docs, self.docs // 2)
+        elif elapsed < self.target_latency / 2 and docs >= self.docs:
+            self.docs = min(self.max_docs, self.docs * 2)
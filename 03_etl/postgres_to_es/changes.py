@@ -0,0 +1,83 @@
+import logging
+import select
+
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from psycopg2.extensions import connection as _connection
+
+CHANNEL = 'etl_outbox'
+# Триггеры outbox: таблица и имя триггера
+TRIGGERS = (
+    ('film_work', 'etl_outbox_film_work'),
+    ('genre', 'etl_outbox_genre'),
+    ('person', 'etl_outbox_person'),
+    ('genre_film_work', 'etl_outbox_genre_film_work'),
+    ('person_film_work', 'etl_outbox_person_film_work'),
+)
+
+# Забираем из outbox очередную порцию событий; строки, заблокированные
+# другим экземпляром ETL, пропускаются
+DRAIN_QUERY = (
+    "DELETE FROM content.etl_outbox "
+    "WHERE id IN ("
+        "SELECT id FROM content.etl_outbox "
+        "ORDER BY id LIMIT %s "
+        "FOR UPDATE SKIP LOCKED) "
+    "RETURNING film_work_id")
+
+
+class ChangeListener:
+    """Ожидание уведомлений об изменениях в таблицах content.
+       Использует отдельное соединение в режиме autocommit,
+       т.к. уведомления приходят только вне транзакции"""
+
+    def __init__(self, dsl: dict) -> None:
+        self.pg_conn = psycopg2.connect(**dsl)
+        self.pg_conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        with self.pg_conn.cursor() as pg_cursor:
+            pg_cursor.execute('LISTEN {0}'.format(CHANNEL))
+        logging.info('Подписка на уведомления %s выполнена', CHANNEL)
+
+    def wait(self, timeout: float) -> bool:
+        """Ожидание уведомления не дольше timeout секунд.
+           Возвращает True, если уведомление пришло"""
+        if not self.pg_conn.notifies:
+            select.select([self.pg_conn], [], [], timeout)
+            self.pg_conn.poll()
+        received = bool(self.pg_conn.notifies)
+        self.pg_conn.notifies.clear()
+        return received
+
+    def close(self) -> None:
+        self.pg_conn.close()
+
+
+def set_capture(pg_conn: _connection, enabled: bool) -> None:
+    """Триггеры outbox работают только в режиме уведомлений. В режиме
+       опроса события никто не забирает: триггеры выключаются, а outbox
+       очищается. ALTER TABLE выполняется только для триггеров в другом
+       состоянии, чтобы не брать блокировку таблиц на каждом запуске"""
+    with pg_conn.cursor() as pg_cursor:
+        pg_cursor.execute(
+            "SELECT c.relname, t.tgname FROM pg_trigger t "
+            "JOIN pg_class c ON c.oid = t.tgrelid "
+            "JOIN pg_namespace n ON n.oid = c.relnamespace "
+            "WHERE n.nspname = 'content' AND t.tgname = ANY(%s) "
+            "AND (t.tgenabled <> 'D') <> %s",
+            ([trigger for _, trigger in TRIGGERS], enabled))
+        for table, trigger in pg_cursor.fetchall():
+            pg_cursor.execute('ALTER TABLE content.{0} {1} TRIGGER {2}'.format(
+                table, 'ENABLE' if enabled else 'DISABLE', trigger))
+        if not enabled:
+            pg_cursor.execute('TRUNCATE content.etl_outbox')
+    pg_conn.commit()
+    logging.info('Триггеры outbox %s', 'включены' if enabled else 'выключены')
+
+
+def drain_outbox(pg_conn: _connection, limit: int) -> list:
+    """id фильмов из очередной порции событий outbox без повторов.
+       События удаляются в текущей транзакции: если индексация упадет,
+       откат транзакции вернет их в outbox"""
+    with pg_conn.cursor() as pg_cursor:
+        pg_cursor.execute(DRAIN_QUERY, (limit,))
+        return list({row[0] for row in pg_cursor.fetchall()})
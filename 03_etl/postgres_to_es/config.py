@@ -0,0 +1,103 @@
+import os
+
+
+def env_bool(name: str, default: bool) -> bool:
+    # Чтение логического флага из переменной окружения
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.lower() in {'true', 'on', '1'}
+
+
+# Чтение film_work через именованный (серверный) курсор
+STREAMING = env_bool('ETL_STREAMING', True)
+# Количество строк, забираемых из БД за один fetchmany
+FETCH_SIZE = int(os.environ.get('ETL_FETCH_SIZE', 1000))
+# Количество событий outbox, забираемых за один запрос
+PAGE_SIZE = int(os.environ.get('ETL_PAGE_SIZE', 1000))
+# Границы размера пачки для ElasticSearch: документы и байты
+BATCH_MIN_DOCS = int(os.environ.get('ETL_BATCH_MIN_DOCS', 10))
+BATCH_MAX_DOCS = int(os.environ.get('ETL_BATCH_MAX_DOCS', 1000))
+BATCH_MAX_BYTES = int(os.environ.get('ETL_BATCH_MAX_BYTES', 5 * 1024 * 1024))
+# Желаемое время одного bulk-запроса в секундах
+BATCH_TARGET_LATENCY = float(os.environ.get('ETL_BATCH_TARGET_LATENCY', 1.0))
+# Движок индексации: bulk, streaming или parallel
+BULK_ENGINE = os.environ.get('ETL_BULK_ENGINE', 'bulk')
+# Количество документов в одном bulk-запросе внутри пачки
+BULK_CHUNK_SIZE = int(os.environ.get('ETL_BULK_CHUNK_SIZE', 500))
+# Количество потоков и длина очереди для parallel
+BULK_THREADS = int(os.environ.get('ETL_BULK_THREADS', 4))
+BULK_QUEUE_SIZE = int(os.environ.get('ETL_BULK_QUEUE_SIZE', 4))
+# Режим работы по умолчанию: sync или async
+MODE = os.environ.get('ETL_MODE', 'sync')
+# Длина очередей между стадиями асинхронного конвейера, в пачках
+ASYNC_QUEUE_SIZE = int(os.environ.get('ETL_ASYNC_QUEUE_SIZE', 4))
+# Размер пула соединений PostgreSQL
+PG_POOL_SIZE = int(os.environ.get('ETL_PG_POOL_SIZE', 2))
+# Количество keep-alive соединений клиента ElasticSearch с одним узлом
+ES_MAXSIZE = int(os.environ.get('ETL_ES_MAXSIZE', 10))
+# Период проверки соединений Redis в секундах
+REDIS_HEALTH_CHECK_INTERVAL = int(
+    os.environ.get('ETL_REDIS_HEALTH_CHECK_INTERVAL', 30))
+# Индексация по уведомлениям триггеров БД вместо опроса раз в 10 секунд
+CHANGE_CAPTURE = env_bool('ETL_CHANGE_CAPTURE', False)
+# Наибольшая пауза между разборами outbox в режиме уведомлений, если
+# уведомлений нет, в секундах
+POLL_FALLBACK_INTERVAL = float(
+    os.environ.get('ETL_POLL_FALLBACK_INTERVAL', 60))
+# Частичное обновление документов при изменении людей или жанров
+PARTIAL_UPDATES = env_bool('ETL_PARTIAL_UPDATES', True)
+# Пропуск неизменившихся документов по хэшу: off, redis или local
+DEDUP = os.environ.get('ETL_DEDUP', 'off')
+# Время жизни хэша в Redis, в секундах
+DEDUP_TTL = int(os.environ.get('ETL_DEDUP_TTL', 7 * 24 * 60 * 60))
+# Файл и предельное количество хэшей для local
+DEDUP_PATH = os.environ.get('ETL_DEDUP_PATH', 'fingerprints.sqlite3')
+DEDUP_CAPACITY = int(os.environ.get('ETL_DEDUP_CAPACITY', 1_000_000))
+# Отставание верхней границы окна изменений от текущего момента,
+# в секундах: строки незафиксированных транзакций попадут в следующий проход
+COMMIT_LAG = float(os.environ.get('ETL_COMMIT_LAG', 5))
+# Количество процессов параллельного прохода, каждый выгружает
+# свой диапазон id фильмов; 1 - проход в одном процессе
+SHARDS = int(os.environ.get('ETL_SHARDS', 1))
+# Период записи в лог прогресса шардов, в секундах
+SHARD_PROGRESS_INTERVAL = float(
+    os.environ.get('ETL_SHARD_PROGRESS_INTERVAL', 10))
+# Имя индекса фильмов; после первой переиндексации это псевдоним
+# версии индекса movies_vN
+INDEX = os.environ.get('ETL_INDEX', 'movies')
+# Предельное время слияния сегментов новой версии индекса, в секундах
+REINDEX_TIMEOUT = int(os.environ.get('ETL_REINDEX_TIMEOUT', 3600))
+# Сериализатор JSON клиента ElasticSearch: orjson или json
+JSON_SERIALIZER = os.environ.get('ETL_JSON_SERIALIZER', 'orjson')
+# Порт HTTP-эндпоинта /metrics в формате Prometheus; 0 - выключен
+METRICS_PORT = int(os.environ.get('ETL_METRICS_PORT', 0))
+# Формат main.log: text или json
+LOG_FORMAT = os.environ.get('ETL_LOG_FORMAT', 'text')
+# Предельное время повторов пачки при временных ошибках, в секундах;
+# потом ошибка уходит на уровень прохода, который продолжится
+# с контрольной точки
+RETRY_MAX_TIME = float(os.environ.get('ETL_RETRY_MAX_TIME', 300))
+# Предельная задержка между повторами, в секундах
+RETRY_MAX_DELAY = float(os.environ.get('ETL_RETRY_MAX_DELAY', 60))
+# Количество отправок документа, отклоненного временной ошибкой,
+# прежде чем он попадет в хранилище отклоненных
+RETRY_ITEM_TRIES = int(os.environ.get('ETL_RETRY_ITEM_TRIES', 5))
+# Начальная задержка повтора отклоненных документов, в секундах
+RETRY_ITEM_DELAY = float(os.environ.get('ETL_RETRY_ITEM_DELAY', 0.1))
+# Начальная задержка, если ElasticSearch ответил 429 (перегружен)
+RETRY_BACKPRESSURE_DELAY = float(
+    os.environ.get('ETL_RETRY_BACKPRESSURE_DELAY', 1.0))
+# Расписание проходов: adaptive - по проверке изменений,
+# fixed - через POLL_INTERVAL секунд
+SCHEDULER = os.environ.get('ETL_SCHEDULER', 'adaptive')
+# Пауза между проходами в расписании fixed, в секундах
+POLL_INTERVAL = float(os.environ.get('ETL_POLL_INTERVAL', 10))
+# Наименьшая и наибольшая пауза между проверками изменений, в секундах
+SCHEDULE_MIN_INTERVAL = float(
+    os.environ.get('ETL_SCHEDULE_MIN_INTERVAL', 0.5))
+SCHEDULE_MAX_INTERVAL = float(
+    os.environ.get('ETL_SCHEDULE_MAX_INTERVAL', 10))
+# Желаемое отставание индекса, в секундах; должно быть больше
+# ETL_COMMIT_LAG, иначе проходы идут подряд
+SCHEDULE_TARGET_LAG = float(os.environ.get('ETL_SCHEDULE_TARGET_LAG', 15))
@@ -0,0 +1,126 @@
+import logging
+from contextlib import contextmanager
+from typing import Iterator
+
+import elasticsearch
+import psycopg2
+import redis
+from psycopg2.extensions import connection as _connection
+from psycopg2.pool import ThreadedConnectionPool
+
+import config
+import metrics
+from dead_letters import DeadLetterStore
+from fingerprints import make_store
+from queries import PREPARED
+from serializer import make_serializer
+from state import StateStore
+
+
+class CountingCursor(psycopg2.extensions.cursor):
+    """Курсор с учетом выполненных запросов"""
+
+    def execute(self, query, vars=None):
+        metrics.counter('pg_queries_total').inc()
+        return super().execute(query, vars)
+
+
+class PreparingConnection(psycopg2.extensions.connection):
+    """Соединение, которое готовит запросы из queries.PREPARED на сервере
+       при первом использовании; дальше PostgreSQL переиспользует план,
+       а в каждую пачку уходят только имя запроса и параметры"""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.cursor_factory = CountingCursor
+        self.prepared = set()
+
+    def execute_prepared(self, pg_cursor, name: str, params: tuple) -> None:
+        types, query = PREPARED[name]
+        if name not in self.prepared:
+            pg_cursor.execute(
+                'PREPARE {0} ({1}) AS {2}'.format(name, types, query))
+            self.prepared.add(name)
+        casts = ', '.join('%s::{0}'.format(item.strip())
+                          for item in types.split(','))
+        pg_cursor.execute('EXECUTE {0} ({1})'.format(name, casts), params)
+
+
+class CountingPool(ThreadedConnectionPool):
+    """Пул соединений PostgreSQL с учетом открытых соединений"""
+
+    def _connect(self, key=None):
+        metrics.counter('pg_connections_opened').inc()
+        return super()._connect(key)
+
+
+class CountingRedisPool(redis.ConnectionPool):
+    """Пул соединений Redis с учетом открытых соединений"""
+
+    def make_connection(self):
+        metrics.counter('redis_connections_opened').inc()
+        return super().make_connection()
+
+
+def pg_is_alive(pg_conn: _connection) -> bool:
+    """Проверка, что соединение с PostgreSQL живо"""
+    if pg_conn.closed:
+        return False
+    try:
+        with pg_conn.cursor() as pg_cursor:
+            pg_cursor.execute('SELECT 1')
+        pg_conn.rollback()
+    except psycopg2.Error:
+        return False
+    return True
+
+
+class Connections:
+    """Долгоживущие соединения ETL, переиспользуются между проходами.
+       PostgreSQL - пул psycopg2, ElasticSearch - один клиент
+       с keep-alive соединениями urllib3, Redis - пул соединений"""
+
+    def __init__(self, dsl: dict, es_dsl: dict, redis_dsl: dict) -> None:
+        self.pg_pool = CountingPool(
+            1, config.PG_POOL_SIZE, **dsl,
+            connection_factory=PreparingConnection)
+        logging.info('Подключение к БД выполнено')
+        self.es = elasticsearch.Elasticsearch(
+            [es_dsl], maxsize=config.ES_MAXSIZE,
+            serializer=make_serializer())
+        logging.info('Подключение к ElasicSearch выполнено')
+        self.redis = redis.Redis(connection_pool=CountingRedisPool(
+            **redis_dsl,
+            health_check_interval=config.REDIS_HEALTH_CHECK_INTERVAL))
+        self.fingerprints = make_store(self.redis)
+        self.state = StateStore(self.redis)
+        self.dead_letters = DeadLetterStore(self.redis)
+
+    @contextmanager
+    def postgres(self) -> Iterator[_connection]:
+        """Соединение из пула; мертвое соединение заменяется новым"""
+        pg_conn = self.pg_pool.getconn()
+        if pg_is_alive(pg_conn):
+            metrics.counter('pg_connections_reused').inc()
+        else:
+            metrics.counter('pg_reconnects').inc()
+            logging.warning('Соединение с БД потеряно, переподключение')
+            self.pg_pool.putconn(pg_conn, close=True)
+            pg_conn = self.pg_pool.getconn()
+        try:
+            yield pg_conn
+        finally:
+            self.pg_pool.putconn(pg_conn, close=bool(pg_conn.closed))
+
+    def check(self) -> None:
+        """Проверка доступности ElasticSearch и Redis перед проходом"""
+        if not self.es.ping():
+            metrics.counter('es_unavailable').inc()
+            raise elasticsearch.ConnectionError(
+                'N/A', 'ElasticSearch недоступен', None)
+        self.redis.ping()
+
+    def close(self) -> None:
+        self.pg_pool.closeall()
+        self.es.transport.close()
+        self.redis.connection_pool.disconnect()
@@ -0,0 +1,61 @@
+import datetime as dt
+import json
+from typing import Dict
+
+import redis
+
+import metrics
+
+# Хэш Redis с отклоненными документами: id фильма - причина
+DEAD_LETTERS_KEY = 'etl_dead_letters'
+
+
+def entries(items: list) -> Dict[str, str]:
+    """Записи для хранилища по ответам ElasticSearch о неудачных
+       документах. Сам документ не хранится: при повторной отправке
+       он заново собирается из БД"""
+    failed_at = dt.datetime.utcnow().isoformat()
+    result = {}
+    for item in items:
+        op_type, info = next(iter(item.items()))
+        result[str(info.get('_id'))] = json.dumps({
+            'op': op_type,
+            'index': info.get('_index'),
+            'status': info.get('status'),
+            'error': info.get('error'),
+            'failed_at': failed_at,
+        }, ensure_ascii=False, default=str)
+    return result
+
+
+class DeadLetterStore:
+    """Документы, которые ElasticSearch отклонил постоянной ошибкой
+       или после всех повторов. Проход их пропускает и не останавливается,
+       повторно они отправляются командой etl.py redrive"""
+
+    def __init__(self, r: redis.Redis) -> None:
+        self.r = r
+
+    def add(self, items: list) -> None:
+        if not items:
+            return
+        self.r.hset(DEAD_LETTERS_KEY, mapping=entries(items))
+        metrics.counter('etl_dead_letters_total').inc(len(items))
+
+    def all(self) -> Dict[str, str]:
+        return {key.decode('utf-8'): value.decode('utf-8')
+                for key, value in self.r.hgetall(DEAD_LETTERS_KEY).items()}
+
+    def resolve(self, snapshot: Dict[str, str]) -> None:
+        """Удаление записей, не изменившихся с момента snapshot.
+           Документ, который снова отклонен, получил новую запись
+           и остается в хранилище"""
+        if not snapshot:
+            return
+        ids = list(snapshot)
+        current = self.r.hmget(DEAD_LETTERS_KEY, ids)
+        resolved = [doc_id for doc_id, value in zip(ids, current)
+                    if value is not None
+                    and value.decode('utf-8') == snapshot[doc_id]]
+        if resolved:
+            self.r.hdel(DEAD_LETTERS_KEY, *resolved)
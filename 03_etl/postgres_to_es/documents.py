@@ -0,0 +1,33 @@
+from typing import Iterable, Iterator, Optional
+
+import config
+
+# Строки запросов из queries - кортежи: id фильма
+# и тело для ElasticSearch текстом JSON
+ID = 0
+DOC = 1
+
+
+def transform(pg_objects: Iterable,
+              index: Optional[str] = None) -> Iterator[dict]:
+    """Подготовка объектов для ElasticSearch из строк БД.
+       Документ уже собран в БД и передается в bulk-запрос как есть.
+       По умолчанию документы пишутся в индекс из настроек"""
+    for row in pg_objects:
+        yield {
+            '_id': row[ID],
+            '_op_type': 'index',
+            '_index': index or config.INDEX,
+            '_source': row[DOC]
+        }
+
+
+def partial_updates(pg_objects: Iterable) -> Iterator[dict]:
+    """Частичное обновление полей, которые зависят от людей или жанров"""
+    for row in pg_objects:
+        yield {
+            '_id': row[ID],
+            '_op_type': 'update',
+            '_index': config.INDEX,
+            '_source': row[DOC]
+        }
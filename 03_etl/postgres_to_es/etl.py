@@ -1,150 +1,429 @@
+import argparse
+import asyncio
 import datetime as dt
 import logging
 import os
 import os.path
-from contextlib import contextmanager
-from time import sleep
+from time import perf_counter, sleep
+from typing import Callable, Iterable, Iterator, Optional
 
-import backoff
 import elasticsearch
 import psycopg2
-import redis
 from psycopg2.extensions import connection as _connection
-from psycopg2.extras import DictCursor
-from elasticsearch import helpers
-from queries import make_query, make_prequery
-
-
-@backoff.on_exception(backoff.expo, BaseException)
-def etl_part2(
-        pg_objects: tuple, es: elasticsearch.client.Elasticsearch) -> None:
-
-    data_to_load = []
-
-    for data in pg_objects:
-        # Подготовка объекта в ElasticSearch
-        object = {
-            'id': data['id'],
-            'imdb_rating': data['rating'],
-            'genre': data['genres'],
-            'title': data['title'],
-            'description': data['description'],
-            'director': data['directors'],
-            'actors_names': data['actors_names'],
-            'writers_names': data['writers_names'],
-            'actors': data['actors'],
-            'writers': data['writers']
-        }
-        data_to_load.append(object)
-
-    def gendata():
-        for doc in data_to_load:
-            record = {'_id': doc['id'],
-                      '_op_type': 'index',
-                      '_index': 'movies',
-                      **doc}
-            yield record
-    # Отправка пачки объектов в ElasticSearch
-    helpers.bulk(es, gendata())
-
-
-@backoff.on_exception(backoff.expo, BaseException)
-def etl_part1(
-        pg_conn: _connection, es: elasticsearch.client.Elasticsearch) -> None:
+
+import config
+import loader
+import metrics
+from batching import AdaptiveBatcher
+from changes import ChangeListener, drain_outbox, set_capture
+from connections import Connections
+from documents import ID, partial_updates, transform
+from fingerprints import FingerprintStore, drop_unchanged
+from loader import bulk_load, bulk_update
+from queries import (DELTA_PARAMS, make_delta_query, make_full_delta_query,
+                     make_genres_query, make_latest_query,
+                     make_partial_delta_query, make_persons_query, make_query)
+from retries import retry
+from scheduler import AdaptiveScheduler
+from state import DONE, STATES, Checkpoint, StateStore
+
+batcher = AdaptiveBatcher.from_config()
+
+
+def fetch_rows(pg_cursor, size: int) -> Iterator:
+    """Построчная выдача результата запроса, забираемого из БД пачками"""
+    extract = metrics.histogram('etl_stage_seconds', stage='extract')
+    while True:
+        started = perf_counter()
+        rows = pg_cursor.fetchmany(size)
+        extract.observe(perf_counter() - started)
+        if not rows:
+            break
+        yield from rows
+
+
+def open_cursor(pg_conn: _connection, name: str):
+    """Курсор для чтения больших выборок.
+       В потоковом режиме строки читаются именованным (серверным) курсором
+       и не накапливаются в памяти процесса"""
+    if not config.STREAMING:
+        return pg_conn.cursor()
+    pg_cursor = pg_conn.cursor(name=name)
+    pg_cursor.itersize = config.FETCH_SIZE
+    return pg_cursor
+
+
+@retry()
+def etl_part2(pg_objects: tuple, es: elasticsearch.client.Elasticsearch,
+              store: Optional[FingerprintStore] = None) -> None:
+    # Подготовка и отправка пачки объектов в ElasticSearch
+    with metrics.timer('etl_stage_seconds', stage='transform'):
+        docs = list(transform(pg_objects))
+        # Документы, не изменившиеся с прошлой отправки, не отправляются;
+        # хэши сохраняются только для загруженных документов
+        if store is not None:
+            docs, hashes = drop_unchanged(docs, store)
+    if not docs:
+        return
+    with metrics.timer('etl_stage_seconds', stage='load'):
+        failed = bulk_load(es, docs)
+    metrics.counter('etl_documents_total', op='index').inc(
+        len(docs) - len(failed))
+    if store is not None:
+        store.set_many({doc_id: value for doc_id, value in hashes.items()
+                        if doc_id not in failed})
+
+
+def load_batches(rows: Iterable, es: elasticsearch.client.Elasticsearch,
+                 store: Optional[FingerprintStore] = None,
+                 on_loaded: Optional[Callable] = None) -> None:
+    """Отправка потока строк в ElasticSearch пачками адаптивного размера.
+       on_loaded вызывается после каждой загруженной пачки"""
+    for films in batcher.batches(rows):
+        started = perf_counter()
+        etl_part2(films, es, store)
+        batcher.record(len(films), perf_counter() - started)
+        if on_loaded is not None:
+            on_loaded(films)
+
+
+@retry()
+def etl_part2_update(pg_objects: tuple,
+                     es: elasticsearch.client.Elasticsearch,
+                     make_actions: Callable) -> list:
+    # Частичное обновление пачки документов в ElasticSearch
+    with metrics.timer('etl_stage_seconds', stage='update'):
+        missing = bulk_update(es, make_actions(pg_objects))
+    metrics.counter('etl_documents_total', op='update').inc(
+        len(pg_objects) - len(missing))
+    return missing
+
+
+def update_batches(pg_conn: _connection, rows: Iterable,
+                   es: elasticsearch.client.Elasticsearch,
+                   make_actions: Callable,
+                   store: Optional[FingerprintStore] = None,
+                   on_loaded: Optional[Callable] = None) -> None:
+    """Частичное обновление документов пачками адаптивного размера.
+       Фильмы, которых еще нет в индексе, загружаются целиком"""
+    for films in batcher.batches(rows):
+        # Хэш полного документа после частичного обновления устарел
+        if store is not None:
+            store.forget(film[ID] for film in films)
+        started = perf_counter()
+        missing = etl_part2_update(films, es, make_actions)
+        batcher.record(len(films), perf_counter() - started)
+        if missing:
+            pg_cursor = pg_conn.cursor()
+            pg_conn.execute_prepared(
+                pg_cursor, 'etl_films_by_ids', (missing,))
+            load_batches(pg_cursor.fetchall(), es, store)
+            pg_cursor.close()
+        if on_loaded is not None:
+            on_loaded(films)
+
+
+def run_phases(pg_conn: _connection, es: elasticsearch.client.Elasticsearch,
+               state: StateStore, checkpoint: Checkpoint,
+               store: Optional[FingerprintStore] = None) -> int:
+    """Выгрузка окна изменений с контрольной точки до конца прохода.
+       Возвращает количество выгруженных фильмов"""
+    if checkpoint.phase == DONE:
+        return 0
+    if checkpoint.phase != 'full' or checkpoint.last_id != checkpoint.after_id:
+        logging.info('Продолжение прохода: %s после %s',
+                     checkpoint.phase, checkpoint.last_id)
+
+    # Фильмы, затронутые изменениями в любой из таблиц, выгружаются
+    # одним запросом в порядке id, каждый фильм - один раз.
+    # При частичных обновлениях целиком выгружаются только фильмы,
+    # изменившиеся сами, а у фильмов, где изменились только люди
+    # или только жанры, обновляются только зависящие от них поля
+    if config.PARTIAL_UPDATES:
+        delta_query = make_full_delta_query(DELTA_PARAMS)
+    else:
+        delta_query = make_delta_query(DELTA_PARAMS)
+    phases = [('full', make_query(
+        "WHERE fw.id IN ({0}) AND fw.id > %(last_id)s "
+        "AND fw.id <= %(end_id)s ".format(delta_query),
+        "ORDER BY fw.id"), None)]
+    if config.PARTIAL_UPDATES:
+        phases.append(('person', make_persons_query(
+            "WHERE pfw.film_work_id IN ({0}) "
+            "AND pfw.film_work_id > %(last_id)s "
+            "AND pfw.film_work_id <= %(end_id)s ".format(
+                make_partial_delta_query('person', DELTA_PARAMS)),
+            "ORDER BY pfw.film_work_id"), partial_updates))
+        phases.append(('genre', make_genres_query(
+            "WHERE gfw.film_work_id IN ({0}) "
+            "AND gfw.film_work_id > %(last_id)s "
+            "AND gfw.film_work_id <= %(end_id)s ".format(
+                make_partial_delta_query('genre', DELTA_PARAMS)),
+            "ORDER BY gfw.film_work_id"), partial_updates))
+
+    loaded = 0
+    names = [phase for phase, _, _ in phases]
+    start = names.index(checkpoint.phase) if checkpoint.phase in names else 0
+    for phase, query, make_actions in phases[start:]:
+        if phase != checkpoint.phase:
+            state.advance(checkpoint, phase, checkpoint.after_id)
+
+        # После каждой загруженной пачки фиксируется последний id
+        def on_loaded(films: tuple, phase: str = phase) -> None:
+            nonlocal loaded
+            loaded += len(films)
+            state.advance(checkpoint, phase, films[-1][ID])
+
+        pg_cursor = open_cursor(pg_conn, 'etl_' + phase)
+        pg_cursor.execute(query, checkpoint.params())
+        rows = fetch_rows(pg_cursor, config.FETCH_SIZE)
+        if make_actions is None:
+            # Отправляем фильмы пачками по мере чтения из БД
+            load_batches(rows, es, store, on_loaded)
+        else:
+            update_batches(pg_conn, rows, es, make_actions, store, on_loaded)
+        pg_cursor.close()
+    return loaded
+
+
+def begin_pass(state: StateStore) -> Checkpoint:
+    """Окно изменений прохода заканчивается чуть раньше текущего момента,
+       чтобы не пропустить строки еще не зафиксированных транзакций.
+       Прерванный проход продолжается в том же окне"""
+    return state.begin(
+        dt.datetime.utcnow() - dt.timedelta(seconds=config.COMMIT_LAG))
+
+
+def etl_part1(pg_conn: _connection, es: elasticsearch.client.Elasticsearch,
+              state: StateStore,
+              store: Optional[FingerprintStore] = None) -> None:
     """Считывание состояния последнего обновления в хранилище
        Детектирование более новых записей в БД относительно состояния
        Обновление соответствующих записей в ElasticSearch"""
     logging.info('Начало etl')
+    with metrics.timer('etl_pass_seconds'):
+        checkpoint = begin_pass(state)
+        run_phases(pg_conn, es, state, checkpoint, store)
+        state.commit(checkpoint)
+
+
+def latest_changes(pg_conn: _connection) -> dict:
+    """Время последнего изменения в каждой таблице, в UTC
+       без часового пояса, как хранится состояние; None - таблица пуста"""
+    with pg_conn.cursor() as pg_cursor:
+        pg_cursor.execute(make_latest_query(STATES))
+        row = pg_cursor.fetchone()
+    pg_conn.rollback()
+    latest = {}
+    for table, value in zip(STATES, row):
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(dt.timezone.utc).replace(tzinfo=None)
+        latest[table] = value
+    return latest
+
+
+def observe_lag(pg_conn: _connection, state: StateStore) -> dict:
+    """Отставание состояния от последнего изменения в каждой таблице,
+       в секундах; пишется в gauge etl_watermark_lag_seconds"""
+    watermarks = state.watermarks()
+    lags = {}
+    for table, latest in latest_changes(pg_conn).items():
+        lag = (0.0 if latest is None
+               else max(0.0, (latest - watermarks[table]).total_seconds()))
+        metrics.gauge('etl_watermark_lag_seconds', table=table).set(lag)
+        lags[table] = lag
+    return lags
+
 
-    # Подключение к хранилищу, получение состояния
-    r = redis.Redis(host=os.environ.get('REDIS_HOST'),
-                    port=os.environ.get('REDIS_PORT'))
-    if not r.exists('film_work') == 1:
-        r.set(name='film_work', value=dt.datetime.min.isoformat())
-    if not r.exists('person') == 1:
-        r.set(name='person', value=dt.datetime.min.isoformat())
-    if not r.exists('genre') == 1:
-        r.set(name='genre', value=dt.datetime.min.isoformat())
-
-    state_fw = dt.datetime.fromisoformat(r.get('film_work').decode("utf-8"))
-    state_g = dt.datetime.fromisoformat(r.get('genre').decode("utf-8"))
-    state_p = dt.datetime.fromisoformat(r.get('person').decode("utf-8"))
-
-    states = {
-        'film_work': state_fw,
-        'genre': state_g,
-        'person': state_p}
-
-    # Подключение к БД, обнаружение обновленных относительно состояния записей
-    pg_cursor = pg_conn.cursor()
-
-    for state, date in states.items():
-        if state == 'genre' or state == 'person':
-            films_ids = []
-            # Берем все id фильмов, где изменился жанр или человек пачками
-            pg_cursor.execute(make_prequery(state, date))
-            while True:
-                rows = pg_cursor.fetchmany(100)
-                if len(rows) > 0:
-                    for row in rows:
-                        films_ids.append(row['id'])
-                else:
-                    break
-
-            # По id фильмов берем полную информацию для отправки пачками
-            for films in range(0, len(films_ids), 10):
-                pg_cursor.execute(make_query("WHERE fw.id IN {0}".format(
-                    tuple(films_ids[films:films + 10]))))
-                # Тут можно использовать fetchall(), т.к. цикл по 10 объектов
-                etl_part2(pg_cursor.fetchall(), es)
-
-            r.set(name=state, value=dt.datetime.utcnow().isoformat())
-
-        elif state == 'film_work':
-            all_films = []
-            # Берем все обновленные фильмы пачками
-            pg_cursor.execute(make_query("WHERE fw.updated_at > '{0}'".format(
-                date)))
-            while True:
-                rows = pg_cursor.fetchmany(100)
-                if len(rows) > 0:
-                    for row in rows:
-                        all_films.append(row)
-                else:
-                    break
-
-            # Отправляем данные на отправку пачками
-            for films in range(0, len(all_films), 10):
-                etl_part2(tuple(all_films[films:films + 10]), es)
-            r.set(name=state, value=dt.datetime.utcnow().isoformat())
-
-
-@backoff.on_exception(backoff.expo, BaseException)
-def try_connect(dsl: dict, es_dsl: dict) -> None:
-    """Подключение к PostgreSQL и ElasticSearch"""
-    @contextmanager
-    def pg_context(dsl: dict):
-        pg_conn = psycopg2.connect(**dsl, cursor_factory=DictCursor)
+def probe(connections: Connections) -> Optional[float]:
+    """Проверка перед проходом: одним запросом max(updated_at) по таблицам
+       против сохраненного состояния. Возвращает None, если изменений нет,
+       иначе - сколько секунд назад начинается окно невыгруженных
+       изменений. Прерванный проход продолжается без ожидания"""
+    if connections.state.current() is not None:
+        return float('inf')
+    with connections.postgres() as pg_conn:
+        latest = latest_changes(pg_conn)
+    watermarks = connections.state.watermarks()
+    pending = [watermarks[table] for table in STATES
+               if latest[table] is not None
+               and latest[table] > watermarks[table]]
+    if not pending:
+        return None
+    return (dt.datetime.utcnow() - min(pending)).total_seconds()
+
+
+def log_pass(lags: dict) -> None:
+    """Итог прохода: счетчики и отставание; в формате JSON
+       это отдельные поля записи"""
+    counters = metrics.snapshot()
+    logging.info('Проход завершен: %s, отставание: %s', counters, lags,
+                 extra={'metrics': counters, 'watermark_lag': lags})
+
+
+@retry(max_time=None)
+def etl_changes(connections: Connections) -> None:
+    """Индексация фильмов, накопленных в outbox триггерами БД"""
+    with connections.postgres() as pg_conn:
+        while True:
+            films_ids = drain_outbox(pg_conn, config.PAGE_SIZE)
+            if not films_ids:
+                pg_conn.commit()
+                break
+            pg_cursor = pg_conn.cursor()
+            pg_conn.execute_prepared(
+                pg_cursor, 'etl_films_by_ids', (films_ids,))
+            load_batches(fetch_rows(pg_cursor, config.FETCH_SIZE),
+                         connections.es, connections.fingerprints)
+            pg_cursor.close()
+            # Фиксируем удаление событий только после загрузки в ES
+            pg_conn.commit()
+            logging.info('Проиндексировано изменений: %s', len(films_ids))
+
+
+def run_guarded(func: Callable, *args) -> bool:
+    """Запуск прохода из бесконечного цикла. Временные ошибки повторяет
+       сам проход; постоянная ошибка пишется в лог, и цикл продолжается:
+       следующий проход начнется с контрольной точки.
+       Возвращает False, если проход прерван"""
+    try:
+        func(*args)
+    except Exception:
+        metrics.counter('etl_pass_failures_total').inc()
+        logging.exception('Проход прерван ошибкой, которая не повторяется')
+        return False
+    return True
+
+
+@retry(max_time=None)
+def schedule_step(connections: Connections, poll: Callable,
+                  scheduler: AdaptiveScheduler) -> float:
+    """Проверка изменений и, если пора, проход.
+       Возвращает паузу до следующей проверки"""
+    staleness = probe(connections)
+    ran = scheduler.should_run(staleness)
+    if ran and not run_guarded(poll):
+        return scheduler.failed()
+    return scheduler.delay(staleness, ran)
+
+
+@retry(max_time=None)
+def prepare_capture(dsl: dict) -> None:
+    """Триггеры outbox по режиму ETL_CHANGE_CAPTURE"""
+    pg_conn = psycopg2.connect(**dsl)
+    try:
+        set_capture(pg_conn, config.CHANGE_CAPTURE)
+    finally:
+        pg_conn.close()
+
+
+@retry(max_time=None)
+def listen(dsl: dict) -> ChangeListener:
+    return ChangeListener(dsl)
+
+
+def change_capture_loop(connections: Connections, dsl: dict,
+                        poll: Callable) -> None:
+    """Цикл по уведомлениям БД. Опрос по updated_at (poll) идет только
+       при старте и после потери соединения для уведомлений: он
+       подхватывает изменения, сделанные до включения триггеров.
+       Outbox хранит события до загрузки, поэтому без уведомления он
+       все равно разбирается раз в POLL_FALLBACK_INTERVAL"""
+    listener = listen(dsl)
+    polled = run_guarded(poll)
+    while True:
         try:
-            yield pg_conn
-        finally:
-            pg_conn.close()
+            listener.wait(timeout=config.POLL_FALLBACK_INTERVAL)
+        except psycopg2.Error:
+            logging.warning('Соединение для уведомлений потеряно')
+            listener.close()
+            listener = listen(dsl)
+            polled = False
+        if not polled:
+            polled = run_guarded(poll)
+        run_guarded(etl_changes, connections)
+
 
-    es = elasticsearch.Elasticsearch([es_dsl])
-    logging.info('Подключение к ElasicSearch выполнено')
+@retry(max_time=None)
+def connect(dsl: dict, es_dsl: dict, redis_dsl: dict) -> Connections:
+    """Подключение к PostgreSQL, ElasticSearch и Redis"""
+    connections = Connections(dsl, es_dsl, redis_dsl)
+    loader.dead_letters = connections.dead_letters
+    return connections
 
-    with pg_context(dsl) as pg_conn, pg_conn:
-        logging.info('Подключение к БД выполнено')
-        etl_part1(pg_conn, es)
+
+@retry(max_time=None)
+def try_connect(connections: Connections) -> None:
+    """Проход ETL на долгоживущих соединениях"""
+    connections.check()
+    with connections.postgres() as pg_conn, pg_conn:
+        etl_part1(pg_conn, connections.es, connections.state,
+                  connections.fingerprints)
+        lags = observe_lag(pg_conn, connections.state)
+    log_pass(lags)
+
+
+def redrive(connections: Connections) -> int:
+    """Повторная отправка отклоненных документов: фильмы заново
+       собираются из БД и загружаются целиком. Снова отклоненные
+       документы остаются в хранилище.
+       Возвращает количество отправленных фильмов"""
+    entries = connections.dead_letters.all()
+    ids = list(entries)
+    sent = 0
+    with connections.postgres() as pg_conn, pg_conn:
+        for start in range(0, len(ids), config.PAGE_SIZE):
+            page = ids[start:start + config.PAGE_SIZE]
+            pg_cursor = pg_conn.cursor()
+            pg_conn.execute_prepared(pg_cursor, 'etl_films_by_ids', (page,))
+            films = pg_cursor.fetchall()
+            pg_cursor.close()
+            load_batches(films, connections.es, connections.fingerprints)
+            # Записи удаляются и для фильмов, которых уже нет в БД
+            connections.dead_letters.resolve(
+                {doc_id: entries[doc_id] for doc_id in page})
+            sent += len(films)
+    return sent
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        'command', nargs='?', choices=('run', 'reindex', 'redrive'),
+        default='run',
+        help='run - цикл ETL, reindex - полная переиндексация в новую '
+             'версию индекса с переключением псевдонима, redrive - '
+             'повторная отправка отклоненных документов')
+    parser.add_argument(
+        '--delete-old', action='store_true',
+        help='удалить старые версии индекса после переиндексации')
+    parser.add_argument(
+        '--mode', choices=('sync', 'async'), default=config.MODE,
+        help='sync - последовательный цикл, async - asyncio-конвейер')
+    parser.add_argument(
+        '--shards', type=int, default=config.SHARDS,
+        help='количество процессов, выгружающих свои диапазоны id фильмов')
+    args = parser.parse_args()
+    # Асинхронный движок выгружает фильмы одним конвейером по updated_at:
+    # диапазонов процессов и outbox в нем нет
+    if args.command == 'run' and args.mode == 'async':
+        if args.shards > 1:
+            parser.error('--mode async не поддерживает --shards больше 1')
+        if config.CHANGE_CAPTURE:
+            parser.error(
+                '--mode async не поддерживает ETL_CHANGE_CAPTURE=true')
+
     logging.basicConfig(
         level=logging.DEBUG,
         filename='main.log',
         format='%(asctime)s, %(levelname)s, %(name)s, %(message)s',
         encoding='utf-8'
     )
+    if config.LOG_FORMAT == 'json':
+        for handler in logging.getLogger().handlers:
+            handler.setFormatter(metrics.JsonFormatter())
+    if config.METRICS_PORT:
+        metrics.serve(config.METRICS_PORT)
 
     dsl = {
         'dbname': os.environ.get('POSTGRES_DB'),
@@ -159,6 +438,55 @@ if __name__ == '__main__':
         'port': os.environ.get('ES_PORT', 9200)
         }
 
+    redis_dsl = {
+        'host': os.environ.get('REDIS_HOST'),
+        'port': os.environ.get('REDIS_PORT')
+        }
+
+    if args.command == 'reindex':
+        import reindex
+        connections = connect(dsl, es_dsl, redis_dsl)
+        reindex.reindex(connections, args.delete_old)
+        connections.close()
+        raise SystemExit
+
+    if args.command == 'redrive':
+        connections = connect(dsl, es_dsl, redis_dsl)
+        logging.info('Повторно отправлено фильмов: %s', redrive(connections))
+        connections.close()
+        raise SystemExit
+
+    prepare_capture(dsl)
+
+    if args.mode == 'async':
+        # Асинхронный движок импортируется только при выборе режима,
+        # чтобы синхронный цикл не зависел от asyncpg
+        import async_etl
+        asyncio.run(async_etl.main(dsl, es_dsl, redis_dsl))
+
+    if args.shards > 1:
+        # Пул создается до подключения, чтобы процессы не наследовали
+        # соединения координатора
+        import sharding
+        pool = sharding.make_pool(args.shards, dsl, es_dsl, redis_dsl)
+        connections = connect(dsl, es_dsl, redis_dsl)
+
+        def poll() -> None:
+            sharding.try_connect(connections, pool, args.shards)
+    else:
+        connections = connect(dsl, es_dsl, redis_dsl)
+
+        def poll() -> None:
+            try_connect(connections)
+
+    if config.CHANGE_CAPTURE:
+        change_capture_loop(connections, dsl, poll)
+
+    if config.SCHEDULER == 'fixed':
+        while True:
+            run_guarded(poll)
+            sleep(config.POLL_INTERVAL)
+
+    scheduler = AdaptiveScheduler.from_config()
     while True:
-        try_connect(dsl, es_dsl)
-        sleep(10)
+        sleep(schedule_step(connections, poll, scheduler))
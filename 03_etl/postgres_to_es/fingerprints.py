@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from typing import Dict, Iterable, Optional, Union
+
+import redis
+
+import config
+import metrics
+
+
+def fingerprint(doc: dict) -> str:
+    """Хэш содержимого документа, не зависящий от порядка ключей.
+       Тело, которое пришло из БД текстом JSON, хэшируется как есть:
+       БД собирает его всегда в одном порядке"""
+    source = doc.get('_source')
+    if isinstance(source, str):
+        data = source.encode('utf-8')
+    else:
+        data = json.dumps(doc, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class RedisFingerprints:
+    """Хэши документов в Redis, ключ на фильм;
+       вытеснение - по времени жизни ключа"""
+
+    prefix = 'etl:fingerprint:'
+
+    def __init__(self, r: redis.Redis, ttl: int) -> None:
+        self.r = r
+        self.ttl = ttl
+
+    def get_many(self, ids: list) -> Dict[str, str]:
+        values = self.r.mget([self.prefix + str(i) for i in ids])
+        return {str(i): value.decode('utf-8')
+                for i, value in zip(ids, values) if value is not None}
+
+    def set_many(self, hashes: Dict[str, str]) -> None:
+        pipe = self.r.pipeline(transaction=False)
+        for doc_id, value in hashes.items():
+            pipe.set(self.prefix + doc_id, value, ex=self.ttl)
+        pipe.execute()
+
+    def forget(self, ids: Iterable) -> None:
+        keys = [self.prefix + str(i) for i in ids]
+        if keys:
+            self.r.delete(*keys)
+
+
+class LocalFingerprints:
+    """Хэши документов в локальном файле SQLite;
+       при превышении capacity вытесняются давно не использованные.
+       Количество строк считается один раз при открытии и дальше
+       ведется в памяти, поэтому вытеснение запускается, только когда
+       строк стало больше capacity"""
+
+    def __init__(self, path: str, capacity: int) -> None:
+        self.capacity = capacity
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS fingerprints ('
+            'id TEXT PRIMARY KEY, hash TEXT NOT NULL, used_at REAL NOT NULL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS fingerprints_used_at '
+                        'ON fingerprints (used_at)')
+        self.count = self.db.execute(
+            'SELECT count(*) FROM fingerprints').fetchone()[0]
+
+    def get_many(self, ids: list) -> Dict[str, str]:
+        ids = [str(i) for i in ids]
+        rows = self.db.execute(
+            'SELECT id, hash FROM fingerprints WHERE id IN ({0})'.format(
+                ', '.join('?' * len(ids))), ids).fetchall()
+        return dict(rows)
+
+    def set_many(self, hashes: Dict[str, str]) -> None:
+        if not hashes:
+            return
+        now = time.time()
+        with self.db:
+            known = self.db.execute(
+                'SELECT count(*) FROM fingerprints WHERE id IN ({0})'.format(
+                    ', '.join('?' * len(hashes))), list(hashes)).fetchone()[0]
+            self.db.executemany(
+                'INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?)',
+                [(doc_id, value, now) for doc_id, value in hashes.items()])
+            self.count += len(hashes) - known
+            if self.count > self.capacity:
+                # Самые старые строки по индексу used_at: обход только
+                # лишних строк, а не всех capacity
+                self.count -= self.db.execute(
+                    'DELETE FROM fingerprints WHERE id IN ('
+                    'SELECT id FROM fingerprints ORDER BY used_at '
+                    'LIMIT ?)', (self.count - self.capacity,)).rowcount
+
+    def forget(self, ids: Iterable) -> None:
+        with self.db:
+            self.count -= self.db.executemany(
+                'DELETE FROM fingerprints WHERE id = ?',
+                [(str(i),) for i in ids]).rowcount
+
+
+FingerprintStore = Union[RedisFingerprints, LocalFingerprints]
+
+
+def make_store(r: redis.Redis) -> Optional[FingerprintStore]:
+    """Хранилище хэшей по настройке ETL_DEDUP"""
+    if config.DEDUP == 'redis':
+        return RedisFingerprints(r, config.DEDUP_TTL)
+    if config.DEDUP == 'local':
+        return LocalFingerprints(
+            os.path.expanduser(config.DEDUP_PATH), config.DEDUP_CAPACITY)
+    return None
+
+
+def drop_unchanged(docs: list, store: FingerprintStore) -> tuple:
+    """Отбрасывает документы, хэш которых совпадает с сохраненным.
+       Возвращает документы для отправки и их новые хэши"""
+    hashes = {str(doc['_id']): fingerprint(doc) for doc in docs}
+    known = store.get_many(list(hashes))
+    changed = [doc for doc in docs
+               if known.get(str(doc['_id'])) != hashes[str(doc['_id'])]]
+    metrics.counter('dedup_hits').inc(len(docs) - len(changed))
+    metrics.counter('dedup_misses').inc(len(changed))
+    return changed, {str(doc['_id']): hashes[str(doc['_id'])]
+                     for doc in changed}
@@ -0,0 +1,95 @@
+import logging
+from typing import Iterable, Optional
+
+import elasticsearch
+from elasticsearch import helpers
+
+import config
+import metrics
+from dead_letters import DeadLetterStore
+from retries import item_info, item_status, retry_items
+
+# Ключи действия, которые уходят в строку метаданных bulk-запроса
+ACTION_KEYS = ('_id', '_index')
+# Хранилище отклоненных документов; задается при подключении
+# (etl.connect), без него отклоненные документы только пишутся в лог
+dead_letters: Optional[DeadLetterStore] = None
+
+
+def expand_action(data: dict) -> tuple:
+    """Строка метаданных и тело для bulk-запроса.
+       Тело, собранное в БД текстом JSON, передается как есть,
+       в том числе у частичных обновлений"""
+    source = data.get('_source')
+    if not isinstance(source, str):
+        return helpers.expand_action(data)
+    meta = {key: data[key] for key in ACTION_KEYS if key in data}
+    return {data.get('_op_type', 'index'): meta}, source
+
+
+def send_actions(es: elasticsearch.client.Elasticsearch, actions: list,
+                 engine: str) -> list:
+    """Одна отправка действий выбранным движком индексации.
+       bulk - последовательные запросы, ошибки собираются списком;
+       streaming - последовательные запросы, ошибки разбираются по мере
+       ответов; parallel - пул потоков, запросы идут одновременно.
+       Ошибка запроса целиком (обрыв соединения, 429) не прерывает
+       отправку, а считается ошибкой каждого документа этого запроса.
+       Возвращает ответы ElasticSearch по неудачным документам"""
+    options = {'chunk_size': config.BULK_CHUNK_SIZE,
+               'max_chunk_bytes': config.BATCH_MAX_BYTES,
+               'expand_action_callback': expand_action,
+               'raise_on_error': False,
+               'raise_on_exception': False}
+    if engine == 'bulk':
+        _, errors = helpers.bulk(es, actions, **options)
+        return errors
+    if engine == 'parallel':
+        results = helpers.parallel_bulk(
+            es, actions,
+            thread_count=config.BULK_THREADS,
+            queue_size=config.BULK_QUEUE_SIZE,
+            **options)
+    elif engine == 'streaming':
+        results = helpers.streaming_bulk(es, actions, **options)
+    else:
+        raise ValueError('Неизвестный движок индексации: {0}'.format(engine))
+    return [item for ok, item in results if not ok]
+
+
+def reject(items: list, message: str) -> set:
+    """Учет документов, которые не удалось загрузить: в лог, в метрики
+       и в хранилище отклоненных. Возвращает их id"""
+    for item in items:
+        logging.error(message, item)
+    metrics.counter('etl_documents_failed_total').inc(len(items))
+    if dead_letters is not None:
+        dead_letters.add(items)
+    return {str(item_info(item).get('_id')) for item in items}
+
+
+def bulk_load(
+        es: elasticsearch.client.Elasticsearch, actions: Iterable) -> set:
+    """Отправка действий в ElasticSearch движком ETL_BULK_ENGINE.
+       Документы, отклоненные временной ошибкой, отправляются повторно,
+       остальные документы пачки повторно не отправляются. Если временные
+       ошибки не прошли, поднимается BulkIndexError.
+       Возвращает id документов, отклоненных постоянной ошибкой"""
+    failed = retry_items(
+        lambda pending: send_actions(es, pending, config.BULK_ENGINE),
+        list(actions))
+    return reject(failed, 'Документ не загружен в ElasticSearch: %s')
+
+
+def bulk_update(
+        es: elasticsearch.client.Elasticsearch, actions: Iterable) -> list:
+    """Отправка частичных обновлений документов.
+       Возвращает id документов, которых еще нет в индексе:
+       их нужно загрузить целиком"""
+    failed = retry_items(
+        lambda pending: send_actions(es, pending, 'streaming'),
+        list(actions))
+    missing = [item for item in failed if item_status(item) == 404]
+    reject([item for item in failed if item_status(item) != 404],
+           'Документ не обновлен в ElasticSearch: %s')
+    return [item_info(item)['_id'] for item in missing]
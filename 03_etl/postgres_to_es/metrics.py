@@ -0,0 +1,266 @@
+import json
+import logging
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter
+from typing import Dict, Iterator, Tuple
+
+# Границы корзин гистограмм времени, в секундах
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def metric_key(name: str, labels: dict) -> str:
+    """Имя метрики с метками в формате Prometheus: name{label="value"}"""
+    if not labels:
+        return name
+    return '{0}{{{1}}}'.format(name, ','.join(
+        '{0}="{1}"'.format(key, value)
+        for key, value in sorted(labels.items())))
+
+
+class Counter:
+    """Монотонно растущий счетчик"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dump(self):
+        return self.value
+
+    def merge(self, value) -> None:
+        self.inc(value)
+
+    def samples(self, key: str) -> Iterator[Tuple[str, float]]:
+        yield key, self.value
+
+
+class Gauge:
+    """Текущее значение, например отставание состояния"""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def dump(self):
+        return self.value
+
+    def merge(self, value) -> None:
+        self.set(value)
+
+    def samples(self, key: str) -> Iterator[Tuple[str, float]]:
+        yield key, self.value
+
+
+class Histogram:
+    """Распределение значений по корзинам, сумма и количество"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, buckets: tuple = TIME_BUCKETS) -> None:
+        self.name = name
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.sum += value
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля по корзинам, как histogram_quantile
+           в Prometheus: линейно внутри корзины"""
+        total = self.count
+        if not total:
+            return 0.0
+        rank = q * total
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index]
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def dump(self):
+        return {'counts': list(self.counts), 'sum': self.sum}
+
+    def merge(self, value) -> None:
+        with self._lock:
+            for index, count in enumerate(value['counts']):
+                self.counts[index] += count
+            self.sum += value['sum']
+
+    def samples(self, key: str) -> Iterator[Tuple[str, float]]:
+        # Корзины в Prometheus накопительные: le - верхняя граница
+        name, _, labels = key.partition('{')
+        labels = labels.rstrip('}')
+        cumulative = 0
+        bounds = [str(bound) for bound in self.buckets] + ['+Inf']
+        for bound, count in zip(bounds, self.counts):
+            cumulative += count
+            yield '{0}_bucket{{{1}le="{2}"}}'.format(
+                name, labels + ',' if labels else '', bound), cumulative
+        suffix = '{' + labels + '}' if labels else ''
+        yield name + '_sum' + suffix, self.sum
+        yield name + '_count' + suffix, cumulative
+
+
+_metrics: Dict[str, object] = {}
+_registry_lock = threading.Lock()
+
+
+def _get(cls, name: str, labels: dict):
+    key = metric_key(name, labels)
+    with _registry_lock:
+        if key not in _metrics:
+            _metrics[key] = cls(name)
+        return _metrics[key]
+
+
+def counter(name: str, **labels) -> Counter:
+    """Счетчик по имени и меткам, создается при первом обращении"""
+    return _get(Counter, name, labels)
+
+
+def gauge(name: str, **labels) -> Gauge:
+    return _get(Gauge, name, labels)
+
+
+def histogram(name: str, **labels) -> Histogram:
+    return _get(Histogram, name, labels)
+
+
+@contextmanager
+def timer(name: str, **labels) -> Iterator[None]:
+    """Время выполнения блока в гистограмму"""
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        histogram(name, **labels).observe(perf_counter() - started)
+
+
+def on_backoff(details: dict) -> None:
+    # Обработчик backoff: каждая повторная попытка считается
+    counter('etl_retries_total', target=details['target'].__name__).inc()
+
+
+def on_giveup(details: dict) -> None:
+    # Обработчик backoff: повторы прекращены, ошибка ушла выше
+    counter('etl_retry_giveups_total',
+            target=details['target'].__name__).inc()
+
+
+def snapshot() -> dict:
+    """Текущие значения всех счетчиков"""
+    return {key: item.value for key, item in list(_metrics.items())
+            if isinstance(item, Counter)}
+
+
+def dump() -> dict:
+    """Состояние всех метрик процесса для передачи другому процессу"""
+    return {key: (item.kind, item.name, item.dump())
+            for key, item in list(_metrics.items())}
+
+
+def reset() -> None:
+    with _registry_lock:
+        _metrics.clear()
+
+
+def merge(state: dict) -> None:
+    """Добавление метрик другого процесса: счетчики и гистограммы
+       суммируются, у gauge остается последнее значение"""
+    kinds = {'counter': Counter, 'gauge': Gauge, 'histogram': Histogram}
+    for key, (kind, name, value) in state.items():
+        with _registry_lock:
+            if key not in _metrics:
+                _metrics[key] = kinds[kind](name)
+            item = _metrics[key]
+        item.merge(value)
+
+
+def render() -> str:
+    """Все метрики в текстовом формате Prometheus"""
+    lines = []
+    typed = set()
+    for key, item in sorted(list(_metrics.items())):
+        if item.name not in typed:
+            lines.append('# TYPE {0} {1}'.format(item.name, item.kind))
+            typed.add(item.name)
+        for sample, value in item.samples(key):
+            lines.append('{0} {1}'.format(sample, value))
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        data = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def serve(port: int) -> ThreadingHTTPServer:
+    """HTTP-эндпоинт /metrics в фоновом потоке"""
+    server = ThreadingHTTPServer(('0.0.0.0', port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class JsonFormatter(logging.Formatter):
+    """Запись лога одной строкой JSON; поля из extra
+       попадают в запись отдельными ключами"""
+
+    # Атрибуты LogRecord, которые не относятся к extra
+    reserved = set(vars(logging.LogRecord(
+        '', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in self.reserved:
+                data[key] = value
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
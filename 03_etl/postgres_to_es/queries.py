@@ -1,32 +1,56 @@
-from datetime import datetime
+from typing import Iterable, Optional
 
+TABLES = ('film_work', 'genre', 'person')
 
-def make_query(where_block: str) -> str:
-    # Получение всех фильмов по приходящему WHERE
+
+def make_query(where_block: str, tail: str = '') -> str:
+    # Получение всех фильмов по приходящему WHERE.
+    # Документ для ElasticSearch собирается в БД и приходит текстом JSON,
+    # который уходит в bulk-запрос без разбора на стороне Python
     query_fw = (
     "SELECT "
         "fw.id, "
-        "fw.rating, "
-        "fw.title, "
-        "fw.description, "
-        "ARRAY_AGG(DISTINCT g.name) AS genres, "
-        "ARRAY_AGG(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'actor') AS actors_names, "
-        "ARRAY_AGG(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'writer') AS writers_names, "
-        "ARRAY_AGG(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'director') AS directors, "
-        "ARRAY_AGG(DISTINCT jsonb_build_object('id', p.id, 'name', p.full_name)) FILTER (WHERE pfw.role = 'actor') AS actors, "
-        "ARRAY_AGG(DISTINCT jsonb_build_object('id', p.id, 'name', p.full_name)) FILTER (WHERE pfw.role = 'writer') AS writers "
+        "json_build_object("
+            "'id', fw.id, "
+            "'imdb_rating', fw.rating, "
+            "'genre', ARRAY_AGG(DISTINCT g.name), "
+            "'title', fw.title, "
+            "'description', fw.description, "
+            "'director', ARRAY_AGG(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'director'), "
+            "'actors_names', ARRAY_AGG(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'actor'), "
+            "'writers_names', ARRAY_AGG(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'writer'), "
+            "'actors', ARRAY_AGG(DISTINCT jsonb_build_object('id', p.id, 'name', p.full_name)) FILTER (WHERE pfw.role = 'actor'), "
+            "'writers', ARRAY_AGG(DISTINCT jsonb_build_object('id', p.id, 'name', p.full_name)) FILTER (WHERE pfw.role = 'writer')"
+        ")::text AS doc "
     "FROM content.film_work fw "
         "LEFT JOIN content.person_film_work pfw ON pfw.film_work_id = fw.id "
         "LEFT JOIN content.person p ON p.id = pfw.person_id "
         "LEFT JOIN content.genre_film_work gfw ON gfw.film_work_id = fw.id "
         "LEFT JOIN content.genre g ON g.id = gfw.genre_id "
     "{0}"
-    "GROUP BY fw.id".format(where_block))
+    "GROUP BY fw.id "
+    "{1}".format(where_block, tail))
 
     return query_fw
 
 
-def make_prequery(index: str, state: datetime) -> str:
+def make_window(column: str, param: str, upper: Optional[str]) -> str:
+    # Окно изменений: позже состояния и, если задана, не позже upper
+    if upper is None:
+        return "{0} > {1} ".format(column, param)
+    return "{0} > {1} AND {0} <= {2} ".format(column, param, upper)
+
+
+def make_prequery(index: str, param: str, upper: Optional[str] = None) -> str:
+    # Значение состояния не подставляется в текст запроса, а передается
+    # параметром param: '%(genre)s' для psycopg2 или '$2' для asyncpg
+    # Получение всех обновленных фильмов
+    query_fw = (
+    "SELECT "
+        "fw.id "
+    "FROM content.film_work fw "
+    "WHERE {0}".format(make_window('fw.updated_at', param, upper)))
+
     # Поулчение всех фильмов, связанных с обновленным жанром
     query_g = (
     "SELECT "
@@ -34,8 +58,8 @@ def make_prequery(index: str, state: datetime) -> str:
     "FROM content.genre_film_work gfw "
         "LEFT JOIN content.film_work fw ON fw.id = gfw.film_work_id "
         "LEFT JOIN content.genre g ON g.id = gfw.genre_id "
-    "WHERE g.updated_at > '{0}' "
-    "GROUP BY fw.id".format(state))
+    "WHERE {0}"
+    "GROUP BY fw.id".format(make_window('g.updated_at', param, upper)))
 
     # Поулчение всех фильмов, связанных с обновленным человеком
     query_p = (
@@ -44,10 +68,115 @@ def make_prequery(index: str, state: datetime) -> str:
     "FROM content.person_film_work pfw "
         "LEFT JOIN content.film_work fw ON fw.id = pfw.film_work_id "
         "LEFT JOIN content.person p ON p.id = pfw.person_id "
-    "WHERE p.updated_at > '{0}' "
-    "GROUP BY fw.id".format(state))
+    "WHERE {0}"
+    "GROUP BY fw.id".format(make_window('p.updated_at', param, upper)))
 
+    if index == 'film_work':
+        return query_fw
     if index == 'genre':
         return query_g
     if index == 'person':
         return query_p
+
+
+def make_delta_query(params: dict) -> str:
+    # Получение id фильмов, затронутых изменениями в film_work, genre
+    # и person с момента их состояний; UNION убирает повторы, поэтому
+    # фильм, у которого изменились и жанр, и человек, выгружается один раз.
+    # params - плейсхолдеры состояний по таблицам и, если есть,
+    # верхней границы окна 'upper'
+    query_delta = (
+    "WITH changed AS ("
+        "{0}"
+    ") "
+    "SELECT id FROM changed".format(" UNION ".join(
+        "({0})".format(make_prequery(index, params[index],
+                                     params.get('upper')))
+        for index in TABLES)))
+
+    return query_delta
+
+
+def make_full_delta_query(params: dict) -> str:
+    # Фильмы, которые переиндексируются целиком: изменился сам фильм
+    # или у него изменились одновременно и жанр, и человек
+    query_full = (
+    "({0}) UNION (({1}) INTERSECT ({2}))".format(
+        make_prequery('film_work', params['film_work'], params.get('upper')),
+        make_prequery('person', params['person'], params.get('upper')),
+        make_prequery('genre', params['genre'], params.get('upper'))))
+
+    return query_full
+
+
+def make_partial_delta_query(index: str, params: dict) -> str:
+    # Фильмы, у которых изменились только связанные жанры
+    # или только связанные люди
+    query_partial = (
+    "({0}) EXCEPT ({1})".format(
+        make_prequery(index, params[index], params.get('upper')),
+        make_full_delta_query(params)))
+
+    return query_partial
+
+
+def make_persons_query(where_block: str, tail: str = '') -> str:
+    # Только поля фильмов, которые зависят от людей,
+    # тело частичного обновления приходит текстом JSON
+    query_p = (
+    "SELECT "
+        "pfw.film_work_id AS id, "
+        "json_build_object('doc', json_build_object("
+            "'director', ARRAY_AGG(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'director'), "
+            "'actors_names', ARRAY_AGG(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'actor'), "
+            "'writers_names', ARRAY_AGG(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'writer'), "
+            "'actors', ARRAY_AGG(DISTINCT jsonb_build_object('id', p.id, 'name', p.full_name)) FILTER (WHERE pfw.role = 'actor'), "
+            "'writers', ARRAY_AGG(DISTINCT jsonb_build_object('id', p.id, 'name', p.full_name)) FILTER (WHERE pfw.role = 'writer')"
+        "))::text AS doc "
+    "FROM content.person_film_work pfw "
+        "JOIN content.person p ON p.id = pfw.person_id "
+    "{0}"
+    "GROUP BY pfw.film_work_id "
+    "{1}".format(where_block, tail))
+
+    return query_p
+
+
+def make_genres_query(where_block: str, tail: str = '') -> str:
+    # Только жанры фильмов, тело частичного обновления текстом JSON
+    query_g = (
+    "SELECT "
+        "gfw.film_work_id AS id, "
+        "json_build_object('doc', json_build_object("
+            "'genre', ARRAY_AGG(DISTINCT g.name)"
+        "))::text AS doc "
+    "FROM content.genre_film_work gfw "
+        "JOIN content.genre g ON g.id = gfw.genre_id "
+    "{0}"
+    "GROUP BY gfw.film_work_id "
+    "{1}".format(where_block, tail))
+
+    return query_g
+
+
+def make_latest_query(tables: Iterable[str]) -> str:
+    # Время последнего изменения в каждой из таблиц одним запросом;
+    # max(updated_at) берется с края индекса (updated_at, id)
+    return "SELECT {0}".format(', '.join(
+        "(SELECT max(updated_at) FROM content.{0}) AS {0}".format(table)
+        for table in tables))
+
+
+# Плейсхолдеры состояний и верхней границы окна для psycopg2,
+# значения передаются словарем
+DELTA_PARAMS = {
+    'film_work': '%(film_work)s',
+    'genre': '%(genre)s',
+    'person': '%(person)s',
+    'upper': '%(upper)s'}
+
+# Запросы, которые выполняются на каждую пачку, готовятся на сервере
+# один раз на соединение: PREPARE имя (типы) AS запрос
+PREPARED = {
+    'etl_films_by_ids': ('uuid[]', make_query("WHERE fw.id = ANY($1) ")),
+}
@@ -0,0 +1,152 @@
+import datetime as dt
+import logging
+import re
+from time import perf_counter
+from typing import List, Tuple
+
+import elasticsearch
+from psycopg2.extensions import connection as _connection
+
+import config
+from connections import Connections
+from documents import transform
+from etl import batcher, fetch_rows, open_cursor, run_phases
+from loader import bulk_load
+from queries import make_query
+from state import STATES, Checkpoint, StateStore
+
+# Настройки индекса на время загрузки: без обновления поиска и без реплик
+LOAD_SETTINGS = {'refresh_interval': '-1', 'number_of_replicas': 0}
+# Настройки, которые переносятся из живого индекса в новую версию
+CLONED_SETTINGS = ('number_of_shards', 'analysis')
+
+
+class ReindexState(StateStore):
+    """Контрольная точка догоняющего прохода переиндексации,
+       отдельная от контрольной точки основного цикла"""
+
+    checkpoint_key = 'etl_reindex_checkpoint'
+
+
+def versions(es: elasticsearch.client.Elasticsearch, alias: str) -> List[str]:
+    """Версии индекса alias_vN по возрастанию N"""
+    pattern = re.compile(r'^{0}_v(\d+)$'.format(re.escape(alias)))
+    names = [name for name in es.indices.get(index=alias + '_v*')
+             if pattern.match(name)]
+    return sorted(names, key=lambda name: int(pattern.match(name).group(1)))
+
+
+def next_version(es: elasticsearch.client.Elasticsearch, alias: str) -> str:
+    existing = versions(es, alias)
+    number = int(existing[-1].rsplit('_v', 1)[1]) + 1 if existing else 1
+    return '{0}_v{1}'.format(alias, number)
+
+
+def clone_body(es: elasticsearch.client.Elasticsearch,
+               alias: str) -> Tuple[dict, dict]:
+    """Схема новой версии по живому индексу: маппинг и настройки анализа
+       копируются, обновление поиска и реплики выключаются на время
+       загрузки. Возвращает тело запроса и настройки для восстановления"""
+    live = next(iter(es.indices.get(index=alias).values()))
+    settings = live['settings']['index']
+    restore = {
+        'refresh_interval': settings.get('refresh_interval', '1s'),
+        'number_of_replicas': settings.get('number_of_replicas', 1)}
+    index_settings = {key: settings[key]
+                      for key in CLONED_SETTINGS if key in settings}
+    index_settings.update(LOAD_SETTINGS)
+    body = {'settings': {'index': index_settings},
+            'mappings': live['mappings']}
+    return body, restore
+
+
+def load_index(pg_conn: _connection, es: elasticsearch.client.Elasticsearch,
+               index: str) -> int:
+    """Загрузка всех фильмов в индекс пачками в порядке id.
+       Возвращает количество загруженных фильмов"""
+    loaded = 0
+    pg_cursor = open_cursor(pg_conn, 'etl_reindex')
+    pg_cursor.execute(make_query('', 'ORDER BY fw.id'))
+    for films in batcher.batches(fetch_rows(pg_cursor, config.FETCH_SIZE)):
+        started = perf_counter()
+        failed = bulk_load(es, transform(films, index))
+        if failed:
+            raise RuntimeError(
+                'Не загружено документов: {0}'.format(len(failed)))
+        batcher.record(len(films), perf_counter() - started)
+        loaded += len(films)
+    pg_cursor.close()
+    return loaded
+
+
+def swap_alias(es: elasticsearch.client.Elasticsearch, alias: str,
+               index: str) -> List[str]:
+    """Атомарное переключение псевдонима на новую версию.
+       Живой индекс с именем псевдонима удаляется тем же запросом.
+       Возвращает версии, с которых снят псевдоним"""
+    actions = [{'add': {'index': index, 'alias': alias}}]
+    previous = []
+    if es.indices.exists_alias(name=alias):
+        previous = [name for name in es.indices.get_alias(name=alias)
+                    if name != index]
+        actions = [{'remove': {'index': name, 'alias': alias}}
+                   for name in previous] + actions
+    elif es.indices.exists(index=alias):
+        actions.append({'remove_index': {'index': alias}})
+    es.indices.update_aliases(body={'actions': actions})
+    return previous
+
+
+def catch_up(pg_conn: _connection, connections: Connections,
+             since: dt.datetime) -> int:
+    """Догоняющий проход по псевдониму: изменения, сделанные после начала
+       загрузки, могли попасть только в старый индекс"""
+    state = ReindexState(connections.redis)
+    checkpoint = Checkpoint({table: since for table in STATES},
+                            dt.datetime.utcnow())
+    loaded = run_phases(pg_conn, connections.es, state, checkpoint)
+    connections.redis.delete(state.checkpoint_key)
+    return loaded
+
+
+def reindex(connections: Connections, delete_old: bool = False) -> str:
+    """Полная переиндексация без простоя: загрузка новой версии индекса
+       с выключенным обновлением поиска, восстановление настроек,
+       слияние сегментов и переключение псевдонима.
+       Возвращает имя новой версии"""
+    alias = config.INDEX
+    es = connections.es
+    connections.check()
+    index = next_version(es, alias)
+    body, restore = clone_body(es, alias)
+    es.indices.create(index=index, body=body)
+    logging.info('Переиндексация в %s', index)
+
+    since = dt.datetime.utcnow() - dt.timedelta(seconds=config.COMMIT_LAG)
+    started = perf_counter()
+    try:
+        with connections.postgres() as pg_conn, pg_conn:
+            loaded = load_index(pg_conn, es, index)
+        elapsed = perf_counter() - started
+        logging.info('Загружено %s фильмов за %.1f с', loaded, elapsed)
+
+        es.indices.put_settings(index=index, body={'index': restore})
+        es.indices.forcemerge(index=index, max_num_segments=1,
+                              request_timeout=config.REINDEX_TIMEOUT)
+        es.indices.refresh(index=index)
+    except BaseException:
+        # Недогруженная версия удаляется, псевдоним остается на старой
+        es.indices.delete(index=index, ignore_unavailable=True)
+        raise
+
+    previous = swap_alias(es, alias, index)
+    logging.info('Псевдоним %s переключен на %s', alias, index)
+
+    with connections.postgres() as pg_conn, pg_conn:
+        changed = catch_up(pg_conn, connections, since)
+    logging.info('Догоняющий проход: %s фильмов', changed)
+
+    if delete_old and previous:
+        es.indices.delete(index=','.join(previous))
+        logging.info('Удалены старые версии: %s', ', '.join(previous))
+    return index
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import random
+from time import sleep
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+import backoff
+import elasticsearch
+import psycopg2
+import redis
+from elasticsearch.helpers import BulkIndexError
+
+import config
+import metrics
+
+# Статусы ответа ElasticSearch, после которых отправку имеет смысл
+# повторить: 429 - очереди записи узла переполнены, 502-504 - узел
+# или балансировщик временно недоступен. Остальные ошибки документа
+# (400 - документ не подходит под схему индекса и т. п.) постоянные
+TRANSIENT_STATUSES = {429, 502, 503, 504}
+# Ошибки соединений: БД, Redis или сеть недоступны
+TRANSIENT_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError,
+                    redis.ConnectionError, redis.TimeoutError,
+                    ConnectionError, TimeoutError)
+
+
+def is_transient_status(status) -> bool:
+    # N/A - ответа не было: обрыв соединения или таймаут запроса
+    return status == 'N/A' or status in TRANSIENT_STATUSES
+
+
+def item_info(item: dict) -> dict:
+    """Ответ ElasticSearch по документу без типа операции"""
+    return next(iter(item.values()))
+
+
+def item_status(item: dict):
+    return item_info(item).get('status')
+
+
+def is_transient(error: BaseException) -> bool:
+    """Временная ошибка: повтор той же операции может пройти"""
+    if isinstance(error, BulkIndexError):
+        return all(is_transient_status(item_status(item))
+                   for item in error.errors)
+    if isinstance(error, elasticsearch.TransportError):
+        return is_transient_status(error.status_code)
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+def permanent(error: BaseException) -> bool:
+    return not is_transient(error)
+
+
+def retry(max_time: Optional[float] = config.RETRY_MAX_TIME,
+          giveup: Callable = permanent) -> Callable:
+    """Повтор при временных ошибках: экспоненциальная задержка
+       со случайным разбросом, не больше RETRY_MAX_DELAY между попытками
+       и не дольше max_time в сумме (None - без ограничения).
+       Постоянные ошибки не повторяются, KeyboardInterrupt и SystemExit
+       не перехватываются"""
+    return backoff.on_exception(
+        backoff.expo, Exception, max_time=max_time, giveup=giveup,
+        jitter=backoff.full_jitter, max_value=config.RETRY_MAX_DELAY,
+        on_backoff=metrics.on_backoff, on_giveup=metrics.on_giveup)
+
+
+def split_failed(failed: list, pending: list) -> Tuple[list, list, list]:
+    """Разбор ответов по неудачным документам: действия для повтора,
+       ответы с временной ошибкой и ответы с постоянной ошибкой"""
+    transient, rejected = [], []
+    for item in failed:
+        if is_transient_status(item_status(item)):
+            transient.append(item)
+        else:
+            rejected.append(item)
+    ids = {str(item_info(item).get('_id')) for item in transient}
+    return ([action for action in pending if str(action['_id']) in ids],
+            transient, rejected)
+
+
+def item_delay(attempt: int, transient: list) -> float:
+    """Задержка перед повтором документов: растет вдвое с каждой
+       попыткой, при 429 начинается с RETRY_BACKPRESSURE_DELAY.
+       Половина задержки случайна, чтобы процессы не повторяли
+       запросы одновременно"""
+    base = config.RETRY_ITEM_DELAY
+    if any(item_status(item) == 429 for item in transient):
+        metrics.counter('etl_backpressure_total').inc()
+        base = config.RETRY_BACKPRESSURE_DELAY
+    delay = min(config.RETRY_MAX_DELAY, base * 2 ** (attempt - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def log_retry(pending: list, transient: list) -> None:
+    metrics.counter('etl_item_retries_total').inc(len(pending))
+    logging.warning('Повтор отправки %s документов, статусы: %s',
+                    len(pending), {item_status(item) for item in transient})
+
+
+def exhausted(transient: list) -> BulkIndexError:
+    """Документы с временной ошибкой после RETRY_ITEM_TRIES попыток:
+       ошибка всей пачки, которую повторяет retry прохода. Контрольная
+       точка и состояние при этом не сдвигаются, и такие документы
+       не попадают в хранилище отклоненных"""
+    return BulkIndexError('{0} документов не загружены из-за временных '
+                          'ошибок'.format(len(transient)), transient)
+
+
+def retry_items(send: Callable[[list], list], actions: list) -> List[dict]:
+    """Отправка действий с повтором только документов, отклоненных
+       временной ошибкой. send отправляет действия и возвращает ответы
+       ElasticSearch по неудачным документам. Возвращает ответы
+       по документам, отклоненным постоянной ошибкой; если временные
+       ошибки не прошли за RETRY_ITEM_TRIES попыток, поднимает
+       BulkIndexError"""
+    pending, rejected = actions, []
+    for attempt in range(1, config.RETRY_ITEM_TRIES + 1):
+        pending, transient, failed = split_failed(send(pending), pending)
+        rejected.extend(failed)
+        if not transient:
+            break
+        if attempt == config.RETRY_ITEM_TRIES:
+            raise exhausted(transient)
+        log_retry(pending, transient)
+        sleep(item_delay(attempt, transient))
+    return rejected
+
+
+async def aretry_items(send: Callable[[list], Awaitable[list]],
+                       actions: list) -> List[dict]:
+    """То же, что retry_items, для асинхронной отправки"""
+    pending, rejected = actions, []
+    for attempt in range(1, config.RETRY_ITEM_TRIES + 1):
+        pending, transient, failed = split_failed(await send(pending),
+                                                  pending)
+        rejected.extend(failed)
+        if not transient:
+            break
+        if attempt == config.RETRY_ITEM_TRIES:
+            raise exhausted(transient)
+        log_retry(pending, transient)
+        await asyncio.sleep(item_delay(attempt, transient))
+    return rejected
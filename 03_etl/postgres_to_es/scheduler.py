@@ -0,0 +1,56 @@
+from typing import Optional
+
+import config
+import metrics
+
+
+class AdaptiveScheduler:
+    """Расписание проходов ETL по результату дешевой проверки изменений.
+       Проверка возвращает None, если изменений нет, иначе - сколько
+       секунд назад начинается окно еще не выгруженных изменений.
+       Без изменений проверки идут все реже, до max_interval.
+       Изменения выгружаются, когда окно стало старше target_lag:
+       так мелкие изменения собираются в один проход, а отставание
+       не растет больше target_lag плюс время прохода. Если проход
+       дольше этого запаса, следующий начинается сразу"""
+
+    def __init__(self, min_interval: float, max_interval: float,
+                 target_lag: float) -> None:
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target_lag = target_lag
+        self.interval = min_interval
+
+    @classmethod
+    def from_config(cls) -> 'AdaptiveScheduler':
+        return cls(min_interval=config.SCHEDULE_MIN_INTERVAL,
+                   max_interval=config.SCHEDULE_MAX_INTERVAL,
+                   target_lag=config.SCHEDULE_TARGET_LAG)
+
+    def should_run(self, staleness: Optional[float]) -> bool:
+        """Нужен ли проход по результату проверки"""
+        if staleness is None:
+            metrics.counter('etl_probes_total', result='idle').inc()
+            return False
+        metrics.counter('etl_probes_total', result='pending').inc()
+        self.interval = self.min_interval
+        return staleness >= self.target_lag
+
+    def delay(self, staleness: Optional[float], ran: bool) -> float:
+        """Пауза до следующей проверки. После прохода проверка идет
+           сразу: если изменений накопилось больше target_lag,
+           проходы идут подряд"""
+        if ran:
+            delay = 0.0
+        elif staleness is None:
+            delay = self.interval
+            self.interval = min(self.max_interval, self.interval * 2)
+        else:
+            delay = max(self.min_interval, self.target_lag - staleness)
+        metrics.gauge('etl_schedule_delay_seconds').set(delay)
+        return delay
+
+    def failed(self) -> float:
+        """Пауза после прохода, прерванного постоянной ошибкой"""
+        self.interval = self.max_interval
+        return self.max_interval
@@ -0,0 +1,48 @@
+import decimal
+import logging
+from typing import Any
+
+from elasticsearch.serializer import JSONSerializer
+
+import config
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def default(data: Any) -> Any:
+    # Типы, которых нет в orjson, приводятся так же,
+    # как в стандартном сериализаторе клиента ElasticSearch
+    if isinstance(data, decimal.Decimal):
+        return float(data)
+    raise TypeError('Тип {0} не сериализуется в JSON'.format(type(data)))
+
+
+class OrjsonSerializer(JSONSerializer):
+    """Сериализатор клиента ElasticSearch на orjson.
+       UUID и datetime orjson переводит в строки сам, Decimal - в число.
+       Строки, например документы, собранные в БД, передаются как есть"""
+
+    def dumps(self, data: Any) -> str:
+        if isinstance(data, str):
+            return data
+        try:
+            return orjson.dumps(data, default=default).decode('utf-8')
+        except TypeError:
+            # Остальные типы - стандартным сериализатором
+            return super().dumps(data)
+
+    def loads(self, s: str) -> Any:
+        return orjson.loads(s)
+
+
+def make_serializer() -> JSONSerializer:
+    """Сериализатор по настройке ETL_JSON_SERIALIZER;
+       без установленного orjson - стандартный json"""
+    if config.JSON_SERIALIZER == 'orjson':
+        if orjson is not None:
+            return OrjsonSerializer()
+        logging.warning('orjson не установлен, используется json')
+    return JSONSerializer()
@@ -0,0 +1,82 @@
+import logging
+from multiprocessing import Pool
+from multiprocessing.pool import Pool as PoolType
+from typing import Optional, Tuple
+
+import config
+import metrics
+from connections import Connections
+from etl import begin_pass, connect, log_pass, observe_lag, run_phases
+from retries import retry
+from state import DONE, StateStore
+
+# Соединения процесса пула, открываются один раз при его запуске
+_connections: Optional[Connections] = None
+
+
+def init_worker(dsl: dict, es_dsl: dict, redis_dsl: dict) -> None:
+    global _connections
+    _connections = connect(dsl, es_dsl, redis_dsl)
+
+
+def make_pool(shards: int, dsl: dict, es_dsl: dict,
+              redis_dsl: dict) -> PoolType:
+    """Пул процессов по одному на шард, процессы живут между проходами"""
+    return Pool(shards, initializer=init_worker,
+                initargs=(dsl, es_dsl, redis_dsl))
+
+
+@retry()
+def etl_shard(shard: int, shards: int) -> Tuple[int, dict]:
+    """Выгрузка диапазона id шарда в окне прохода координатора.
+       Возвращает количество выгруженных фильмов и метрики процесса
+       с прошлой выгрузки: их сводит координатор"""
+    _connections.check()
+    state = StateStore(_connections.redis, shard, shards)
+    checkpoint = state.resume(_connections.state.current())
+    with _connections.postgres() as pg_conn, pg_conn:
+        loaded = run_phases(pg_conn, _connections.es, state, checkpoint,
+                            _connections.fingerprints)
+    state.advance(checkpoint, DONE, checkpoint.end_id)
+    state_metrics = metrics.dump()
+    metrics.reset()
+    return loaded, state_metrics
+
+
+def log_progress(connections: Connections, shards: int) -> None:
+    """Сводный прогресс прохода по контрольным точкам шардов"""
+    progress = []
+    for shard in range(shards):
+        checkpoint = StateStore(connections.redis, shard, shards).current()
+        if checkpoint is None:
+            progress.append('-')
+        else:
+            progress.append('{0} {1:.0%}'.format(
+                checkpoint.phase, checkpoint.progress()))
+    logging.info('Прогресс шардов: %s', ', '.join(progress))
+
+
+@retry(max_time=None)
+def try_connect(connections: Connections, pool: PoolType,
+                shards: int) -> None:
+    """Параллельный проход ETL: координатор задает окно изменений,
+       процессы пула выгружают свои диапазоны id со своими контрольными
+       точками, состояние сохраняется, когда закончили все шарды"""
+    connections.check()
+    logging.info('Начало etl, шардов: %s', shards)
+    with metrics.timer('etl_pass_seconds'):
+        window = begin_pass(connections.state)
+        result = pool.starmap_async(
+            etl_shard, [(shard, shards) for shard in range(shards)])
+        while not result.ready():
+            result.wait(config.SHARD_PROGRESS_INTERVAL)
+            log_progress(connections, shards)
+        loaded = 0
+        for shard_loaded, shard_metrics in result.get():
+            loaded += shard_loaded
+            metrics.merge(shard_metrics)
+        connections.state.commit(window, shards)
+    logging.info('Выгружено фильмов: %s', loaded)
+    with connections.postgres() as pg_conn:
+        lags = observe_lag(pg_conn, connections.state)
+    log_pass(lags)
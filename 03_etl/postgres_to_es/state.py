@@ -0,0 +1,149 @@
+import datetime as dt
+import json
+import uuid
+from typing import Optional, Tuple
+
+import redis
+
+STATES = ('film_work', 'genre', 'person')
+MIN_UUID = '00000000-0000-0000-0000-000000000000'
+MAX_UUID = 'ffffffff-ffff-ffff-ffff-ffffffffffff'
+# Этап шарда, выгрузившего свой диапазон целиком
+DONE = 'done'
+
+
+def shard_range(shard: int, shards: int) -> Tuple[str, str]:
+    """Диапазон id фильмов шарда (after_id, end_id]: пространство uuid
+       делится на равные части, случайные uuid распределяются по ним
+       равномерно"""
+    space = 2 ** 128
+    after_id = (str(uuid.UUID(int=shard * space // shards - 1))
+                if shard else MIN_UUID)
+    end_id = str(uuid.UUID(int=(shard + 1) * space // shards - 1))
+    return after_id, end_id
+
+
+class Checkpoint:
+    """Незавершенный проход ETL: окно изменений (lower, upper]
+       по каждой таблице, этап прохода и последний загруженный id фильма.
+       Фильмы выгружаются в порядке id, поэтому после перезапуска проход
+       продолжается с id > last_id в том же окне.
+       Проход ограничен диапазоном id (after_id, end_id], по умолчанию
+       это все фильмы"""
+
+    def __init__(self, lower: dict, upper: dt.datetime,
+                 phase: str = 'full', last_id: Optional[str] = None,
+                 after_id: str = MIN_UUID, end_id: str = MAX_UUID) -> None:
+        self.lower = lower
+        self.upper = upper
+        self.phase = phase
+        self.last_id = after_id if last_id is None else last_id
+        self.after_id = after_id
+        self.end_id = end_id
+
+    def params(self) -> dict:
+        """Параметры запросов выгрузки"""
+        return {**self.lower, 'upper': self.upper, 'last_id': self.last_id,
+                'end_id': self.end_id}
+
+    def progress(self) -> float:
+        """Доля диапазона id, выгруженная на текущем этапе"""
+        if self.phase == DONE:
+            return 1.0
+        after_id = uuid.UUID(self.after_id).int
+        return ((uuid.UUID(self.last_id).int - after_id)
+                / (uuid.UUID(self.end_id).int - after_id))
+
+    def dumps(self) -> str:
+        return json.dumps({
+            'lower': {k: v.isoformat() for k, v in self.lower.items()},
+            'upper': self.upper.isoformat(),
+            'phase': self.phase,
+            'last_id': self.last_id,
+            'after_id': self.after_id,
+            'end_id': self.end_id})
+
+    @classmethod
+    def loads(cls, value: bytes) -> 'Checkpoint':
+        data = json.loads(value)
+        return cls(
+            {k: dt.datetime.fromisoformat(v)
+             for k, v in data['lower'].items()},
+            dt.datetime.fromisoformat(data['upper']),
+            data['phase'], data['last_id'],
+            data.get('after_id', MIN_UUID), data.get('end_id', MAX_UUID))
+
+
+class StateStore:
+    """Состояние ETL в Redis: состояние по каждой таблице
+       и контрольная точка текущего прохода.
+       У шарда параллельного прохода своя контрольная точка
+       в диапазоне id шарда, окно прохода общее"""
+
+    checkpoint_key = 'etl_checkpoint'
+
+    def __init__(self, r: redis.Redis, shard: int = 0,
+                 shards: int = 1) -> None:
+        self.r = r
+        self.shard = shard
+        self.shards = shards
+        if shards > 1:
+            self.checkpoint_key = '{0}:{1}:{2}'.format(
+                StateStore.checkpoint_key, shard, shards)
+
+    def watermarks(self) -> dict:
+        """Состояние последнего завершенного прохода по каждой таблице"""
+        states = {}
+        for state in STATES:
+            value = self.r.get(state)
+            states[state] = (dt.datetime.fromisoformat(value.decode('utf-8'))
+                             if value else dt.datetime.min)
+        return states
+
+    def begin(self, upper: dt.datetime) -> Checkpoint:
+        """Начало прохода; если предыдущий проход прервался,
+           возвращается его контрольная точка"""
+        checkpoint = self.current()
+        if checkpoint is None:
+            checkpoint = Checkpoint(self.watermarks(), upper)
+            self.save(checkpoint)
+        return checkpoint
+
+    def resume(self, window: Checkpoint) -> Checkpoint:
+        """Контрольная точка шарда в окне прохода; точка,
+           оставшаяся от другого окна, начинается заново"""
+        checkpoint = self.current()
+        if checkpoint is None or checkpoint.upper != window.upper:
+            after_id, end_id = shard_range(self.shard, self.shards)
+            checkpoint = Checkpoint(window.lower, window.upper,
+                                    after_id=after_id, end_id=end_id)
+            self.save(checkpoint)
+        return checkpoint
+
+    def current(self) -> Optional[Checkpoint]:
+        value = self.r.get(self.checkpoint_key)
+        return Checkpoint.loads(value) if value else None
+
+    def save(self, checkpoint: Checkpoint) -> None:
+        self.r.set(self.checkpoint_key, checkpoint.dumps())
+
+    def advance(self, checkpoint: Checkpoint, phase: str,
+                last_id: str) -> None:
+        """Фиксация загруженной пачки"""
+        checkpoint.phase = phase
+        checkpoint.last_id = str(last_id)
+        self.save(checkpoint)
+
+    def commit(self, checkpoint: Checkpoint, shards: int = 1) -> None:
+        """Завершение прохода: верхняя граница окна становится состоянием
+           всех таблиц, контрольные точки прохода и его shards шардов
+           удаляются"""
+        keys = [self.checkpoint_key]
+        if shards > 1:
+            keys.extend(StateStore(self.r, shard, shards).checkpoint_key
+                        for shard in range(shards))
+        pipe = self.r.pipeline()
+        for state in STATES:
+            pipe.set(state, checkpoint.upper.isoformat())
+        pipe.delete(*keys)
+        pipe.execute()